@@ -0,0 +1,177 @@
+"""
+Re-extract stored receipts (services/blobs.py) and bulk-update their orders.
+
+    python -m apps.api.backfill                        # receipts not yet extracted with the current model/prompt
+    python -m apps.api.backfill --concurrency 16 --batch 200
+    python -m apps.api.backfill --force                # every receipt; prints a --before value to resume with
+
+Receipts go in sha256 order, `batch` at a time, with up to `concurrency`
+extractions in flight; the next batch is extracted while the previous one is
+written. Each batch commits in one transaction: order rows, their line items, and
+the receipt's extraction_version/extracted_at, which is the checkpoint. Run the
+same command again after an interruption and it carries on from there.
+
+Per order: items are replaced by the re-extracted ones and the deadline is
+recomputed; merchant / order id change only if no other order already has the
+new pair. Answers from the fallback parser (no provider reachable) are not
+applied. A running API re-schedules reminders for moved deadlines on its next re-scan.
+"""
+import os, json, time, asyncio, argparse, datetime
+from typing import Optional
+from sqlalchemy import delete, insert, update
+from .db import engine, session_scope, ReadSessionLocal
+from .models import Order, LineItem, ReceiptBlob
+from . import migrations
+from .services import blobs, extract_claude, telemetry, summary
+from .routers.ingest import _extract_fields, _build_order, _total, compute_deadline
+
+BACKFILL_BATCH = int(os.getenv("BACKFILL_BATCH", "100"))
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "8"))
+
+def _pending(after:str, before:Optional[datetime.datetime], limit:int) -> list:
+    stale = ReceiptBlob.extraction_version.is_(None) | (ReceiptBlob.extraction_version != extract_claude.EXTRACTION_VERSION)
+    if before is not None:
+        stale = stale | ReceiptBlob.extracted_at.is_(None) | (ReceiptBlob.extracted_at < before)
+    db = ReadSessionLocal()
+    try:
+        return (db.query(ReceiptBlob.sha256, ReceiptBlob.filename, ReceiptBlob.content_type)
+                .filter(ReceiptBlob.sha256 > after, stale)
+                .order_by(ReceiptBlob.sha256)
+                .limit(limit)
+                .all())
+    finally:
+        db.close()
+
+async def _extract(row, refresh:bool) -> tuple[str, Optional[dict], Optional[str]]:
+    """(sha256, fields, error)"""
+    try:
+        upload = await asyncio.to_thread(blobs.open_upload, row.sha256, row.filename or "", row.content_type)
+    except Exception as e:
+        return row.sha256, None, repr(e)
+    stages = []
+    try:
+        with extract_claude.progress(lambda kind, data: stages.append(data.get("stage")) if kind == "stage" else None):
+            fields = await _extract_fields(upload, refresh=refresh)
+    except Exception as e:
+        return row.sha256, None, repr(e)
+    finally:
+        upload.close()
+    if "fallback" in stages:
+        return row.sha256, None, "no provider answered (fallback parse not applied)"
+    return row.sha256, fields, None
+
+def _item_key(rows) -> list[tuple]:
+    return sorted((r["name"], r["sku"] or "", r["quantity"], round(r["unit_price"], 2)) for r in rows)
+
+def _commit(results:list[tuple[str, dict]], checkpoint:list[str]) -> int:
+    """Write one batch; returns how many orders changed."""
+    now = datetime.datetime.utcnow()
+    changed = 0
+    with session_scope() as db:
+        orders = db.query(Order).filter(Order.receipt_sha256.in_([sha for sha, _ in results])).all() if results else []
+        by_sha: dict[str, list[Order]] = {}
+        for o in orders:
+            by_sha.setdefault(o.receipt_sha256, []).append(o)
+        current: dict[int, list[dict]] = {}
+        for it in db.query(LineItem).filter(LineItem.order_id.in_([o.id for o in orders])):
+            current.setdefault(it.order_id, []).append(
+                {"name": it.name, "sku": it.sku, "quantity": it.quantity, "unit_price": it.unit_price or 0.0})
+
+        claimed = {(o.merchant, o.order_id_text) for o in orders if o.order_id_text}
+        order_rows, item_rows, replaced, deltas = [], [], [], {}
+        for sha, fields in results:
+            fresh, items = _build_order(fields)
+            for o in by_sha.get(sha, []):
+                merchant, order_id_text = o.merchant, o.order_id_text
+                ident = (fresh.merchant, fresh.order_id_text)
+                if ident != (merchant, order_id_text):
+                    taken = fresh.order_id_text is not None and (ident in claimed or db.query(Order.id).filter(
+                        Order.merchant == ident[0], Order.order_id_text == ident[1], Order.id != o.id).first())
+                    if taken:
+                        telemetry.warn("backfill.identity_kept", order=o.id, merchant=ident[0], order_id=ident[1])
+                    else:
+                        claimed.discard((merchant, order_id_text))
+                        claimed.add(ident)
+                        merchant, order_id_text = ident
+                row = {"id": o.id, "merchant": merchant, "order_id_text": order_id_text,
+                       "purchase_date": fresh.purchase_date, "deadline_date": compute_deadline(fresh.purchase_date, merchant),
+                       "total_amount": _total(items), "updated_at": now}
+                same_items = _item_key(items) == _item_key(current.get(o.id, []))
+                if same_items and all(getattr(o, k) == row[k] for k in ("merchant", "order_id_text", "purchase_date", "deadline_date")):
+                    continue
+                # a bulk UPDATE bypasses the flush hook, so the summary deltas are ours to apply
+                summary.add(deltas, (o.merchant, o.deadline_date, o.total_amount),
+                            (row["merchant"], row["deadline_date"], row["total_amount"]))
+                order_rows.append(row)
+                if not same_items:
+                    replaced.append(o.id)
+                    item_rows += [{**r, "order_id": o.id} for r in items]
+                changed += 1
+
+        if order_rows:
+            db.execute(update(Order), order_rows)
+            summary.apply(db.connection(), deltas)
+        if replaced:
+            db.execute(delete(LineItem).where(LineItem.order_id.in_(replaced)))
+        if item_rows:
+            db.execute(insert(LineItem), item_rows)
+        if checkpoint:
+            db.execute(update(ReceiptBlob), [{"sha256": sha, "extraction_version": extract_claude.EXTRACTION_VERSION,
+                                              "extracted_at": now} for sha in checkpoint])
+    return changed
+
+async def backfill(batch:int=BACKFILL_BATCH, concurrency:int=BACKFILL_CONCURRENCY,
+                   before:Optional[datetime.datetime]=None, limit:int=0) -> dict:
+    migrations.upgrade(engine)
+    sem = asyncio.Semaphore(concurrency)
+    totals = {"receipts": 0, "orders_changed": 0, "failed": 0}
+    after, writing = "", None
+    started = time.perf_counter()
+    # with --before the version already matches, so a cached answer would just repeat the old one
+    refresh = before is not None
+
+    async def one(row):
+        async with sem:
+            return await _extract(row, refresh)
+
+    while not (limit and totals["receipts"] >= limit):
+        rows = await asyncio.to_thread(_pending, after, before, min(batch, limit - totals["receipts"]) if limit else batch)
+        if not rows:
+            break
+        after = rows[-1].sha256
+        results = await asyncio.gather(*(one(r) for r in rows))
+        for sha, _, err in results:
+            if err:
+                telemetry.warn("backfill.failed", sha256=sha, error=err)
+        ok = [(sha, fields) for sha, fields, err in results if err is None]
+        if writing is not None:
+            totals["orders_changed"] += await writing
+        writing = asyncio.ensure_future(asyncio.to_thread(_commit, ok, [sha for sha, _ in ok]))
+        totals["receipts"] += len(rows)
+        totals["failed"] += len(rows) - len(ok)
+        elapsed = time.perf_counter() - started
+        telemetry.log("backfill.progress", **totals, after=after, per_s=round(totals["receipts"] / elapsed, 2))
+    if writing is not None:
+        totals["orders_changed"] += await writing
+    totals["seconds"] = round(time.perf_counter() - started, 2)
+    return totals
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--batch", type=int, default=BACKFILL_BATCH)
+    ap.add_argument("--concurrency", type=int, default=BACKFILL_CONCURRENCY)
+    ap.add_argument("--limit", type=int, default=0, help="stop after this many receipts (0 = all)")
+    ap.add_argument("--before", type=datetime.datetime.fromisoformat,
+                    help="also redo receipts last extracted before this UTC time, even with the current version")
+    ap.add_argument("--force", action="store_true", help="redo every receipt (same as --before now)")
+    args = ap.parse_args()
+    before = args.before
+    if args.force and before is None:
+        before = datetime.datetime.utcnow().replace(microsecond=0)
+        print(f"re-extracting everything; resume with --before {before.isoformat()}")
+    if not (extract_claude.LAVA_FORWARD_TOKEN or extract_claude.ANTHROPIC_API_KEY):
+        print("warning: no LLM credentials; only receipts the local parser can read will be updated")
+    print(json.dumps(asyncio.run(backfill(args.batch, args.concurrency, before, args.limit))))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+"""
+Offline benchmarks: the real API, a local stand-in for Lava / Anthropic / Reka,
+and a database seeded with synthetic orders. Nothing leaves the machine.
+
+    python -m apps.api.bench.run --orders 100000 --concurrency 32 --duration 20 --out bench.json
+    python -m apps.api.bench.run --compare old.json new.json
+
+See run.py for the scenarios and the report format.
+"""
@@ -0,0 +1,142 @@
+"""
+Local stand-in for the upstreams the extractor talks to:
+
+  POST /v1/forward   Lava forward (Anthropic messages body, stream or not)
+  POST /v1/messages  Anthropic messages API (what the SDK calls)
+  POST /v1/chat      Reka chat (OCR)
+  GET  /stats        request / failure counts per endpoint
+
+Answers are deterministic per request body, so the same receipt always
+extracts to the same order. Latency and failure rate come from FAKE_* env vars.
+
+    python -m apps.api.bench.fakes --port 8900 --latency-ms 400 --fail-rate 0.02
+"""
+import os, json, random, hashlib, asyncio, datetime
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FAKE_LATENCY_MS = float(os.getenv("FAKE_LATENCY_MS", "400"))
+FAKE_JITTER_MS = float(os.getenv("FAKE_JITTER_MS", "100"))
+# Share of calls answered with 529 overloaded (retryable, counts toward the breaker)
+FAKE_FAIL_RATE = float(os.getenv("FAKE_FAIL_RATE", "0"))
+FAKE_STREAM_CHUNK = int(os.getenv("FAKE_STREAM_CHUNK", "16"))
+FAKE_STREAM_DELAY_MS = float(os.getenv("FAKE_STREAM_DELAY_MS", "5"))
+
+MERCHANTS = ["Amazon", "Target", "Best Buy", "Walmart", "Nordstrom", "Zara", "Uniqlo", "Apple", "Costco", "IKEA"]
+ITEMS = ["USB-C Cable", "Wireless Mouse", "Cotton T-Shirt", "Desk Lamp", "Water Bottle", "Headphones", "Notebook"]
+
+app = FastAPI(title="sendback bench upstreams")
+stats: dict[str, dict[str, int]] = {}
+
+def _seed(body:bytes) -> random.Random:
+    return random.Random(int(hashlib.sha256(body).hexdigest()[:16], 16))
+
+def _receipt(rng:random.Random) -> dict:
+    day = datetime.date.today() - datetime.timedelta(days=rng.randrange(0, 40))
+    return {
+        "merchant": rng.choice(MERCHANTS),
+        "order_id": f"FAKE-{rng.randrange(10**9):09d}",
+        "purchase_date": day.isoformat(),
+        "items": [{"name": rng.choice(ITEMS), "sku": None, "qty": rng.randint(1, 3),
+                   "unit_price": round(rng.uniform(3, 200), 2)} for _ in range(rng.randint(1, 4))],
+    }
+
+def _policy(rng:random.Random) -> dict:
+    return {"window_days": rng.choice([14, 30, 45, 90]), "restocking_fee_pct": rng.choice([0, 0, 15]),
+            "in_store_allowed": True, "mail_allowed": True, "return_bar_supported": rng.random() < 0.3,
+            "requires_rma": False, "notes": "Synthetic policy (bench)"}
+
+def _answer(body:bytes) -> str:
+    rng = _seed(body)
+    return json.dumps(_policy(rng) if b"Policy snippet" in body else _receipt(rng))
+
+def _count(endpoint:str, outcome:str):
+    row = stats.setdefault(endpoint, {})
+    row[outcome] = row.get(outcome, 0) + 1
+
+async def _delay():
+    await asyncio.sleep(max(0.0, random.gauss(FAKE_LATENCY_MS, FAKE_JITTER_MS)) / 1000)
+
+def _overloaded() -> JSONResponse:
+    return JSONResponse(status_code=529, content={"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded (fake)"}})
+
+def _message(text:str, model:str, input_tokens:int=0) -> dict:
+    # ~4 characters per token is close enough for comparing runs
+    return {"id": "msg_fake", "type": "message", "role": "assistant", "model": model,
+            "content": [{"type": "text", "text": text}], "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": len(text) // 4}}
+
+def _sse(event:str, data:dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _message_stream(text:str, model:str, input_tokens:int):
+    start = _message("", model, input_tokens)
+    start["content"], start["stop_reason"] = [], None
+    yield _sse("message_start", {"type": "message_start", "message": start})
+    yield _sse("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+    for i in range(0, len(text), FAKE_STREAM_CHUNK):
+        await asyncio.sleep(FAKE_STREAM_DELAY_MS / 1000)
+        yield _sse("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                           "delta": {"type": "text_delta", "text": text[i:i + FAKE_STREAM_CHUNK]}})
+    yield _sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+    yield _sse("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                 "usage": {"output_tokens": len(text) // 4}})
+    yield _sse("message_stop", {"type": "message_stop"})
+
+async def _messages(endpoint:str, request:Request):
+    body = await request.body()
+    await _delay()
+    if random.random() < FAKE_FAIL_RATE:
+        _count(endpoint, "overloaded")
+        return _overloaded()
+    _count(endpoint, "ok")
+    payload = json.loads(body or b"{}")
+    text, model, input_tokens = _answer(body), payload.get("model", "fake"), len(body) // 4
+    if payload.get("stream"):
+        return StreamingResponse(_message_stream(text, model, input_tokens), media_type="text/event-stream")
+    return _message(text, model, input_tokens)
+
+@app.post("/v1/forward")
+async def lava_forward(request: Request):
+    return await _messages("lava", request)
+
+@app.post("/v1/messages")
+async def anthropic_messages(request: Request):
+    return await _messages("anthropic", request)
+
+@app.post("/v1/chat")
+async def reka_chat(request: Request):
+    body = await request.body()
+    await _delay()
+    if random.random() < FAKE_FAIL_RATE:
+        _count("reka", "overloaded")
+        return JSONResponse(status_code=503, content={"detail": "unavailable (fake)"})
+    _count("reka", "ok")
+    r = _receipt(_seed(body))
+    lines = [f"Thank you for shopping at {r['merchant']}!", f"Order # {r['order_id']}", f"Order date: {r['purchase_date']}"]
+    lines += [f"- {it['name']} x{it['qty']} ${it['unit_price']:.2f}" for it in r["items"]]
+    return {"responses": [{"message": {"role": "assistant", "content": "\n".join(lines)}}]}
+
+@app.get("/stats")
+def get_stats():
+    return stats
+
+@app.get("/health")
+def health():
+    return {"ok": True}
+
+def main():
+    import argparse, uvicorn
+    global FAKE_LATENCY_MS, FAKE_JITTER_MS, FAKE_FAIL_RATE
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8900)
+    ap.add_argument("--latency-ms", type=float, default=FAKE_LATENCY_MS)
+    ap.add_argument("--jitter-ms", type=float, default=FAKE_JITTER_MS)
+    ap.add_argument("--fail-rate", type=float, default=FAKE_FAIL_RATE)
+    args = ap.parse_args()
+    FAKE_LATENCY_MS, FAKE_JITTER_MS, FAKE_FAIL_RATE = args.latency_ms, args.jitter_ms, args.fail_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+Load-test the API against local fake upstreams and a seeded database.
+
+    python -m apps.api.bench.run --orders 100000 --concurrency 32 --duration 20 --out bench.json
+    python -m apps.api.bench.run --compare base.json bench.json --max-regression 10
+
+Starts apps.api.bench.fakes and uvicorn apps.api.main:app as subprocesses
+(pointed at the fakes through LAVA_BASE_URL / ANTHROPIC_BASE_URL / REKA_BASE_URL),
+seeds the database, then runs each scenario for --duration seconds at --concurrency:
+
+  ingest_text   POST /ingest/receipt, unique text receipts; --llm-ratio of them don't parse locally
+  ingest_image  POST /ingest/receipt, unique PNGs (vision path)
+  orders        GET /orders pages (id / deadline sort, merchant filter) and /orders/expiring
+  order_detail  GET /order/{id}/full|items|options|eligibility for random seeded ids
+  policy        GET /policy for seeded and unknown merchants, some with policy text
+  summary       GET /orders/summary over 1–26 weeks, sometimes for one merchant
+
+The report is one JSON document:
+  {"version", "git", "started_at", "config", "seed", "startup_s",
+   "scenarios": {name: {"requests", "errors", "status", "seconds", "rps",
+                        "latency_ms": {"p50", "p95", "p99", "max", "mean"}}},
+   "rss_mb": {"api_peak", "fakes_peak"}, "tiers", "tokens", "upstream"}
+"""
+import os, io, sys, json, math, time, random, signal, socket, asyncio, argparse, datetime, platform, subprocess, tempfile
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Optional
+import httpx
+
+REPORT_VERSION = 1
+ROOT = Path(__file__).resolve().parents[3]
+SCENARIOS = ("ingest_text", "ingest_image", "orders", "order_detail", "policy", "summary")
+
+# --- processes ---
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _spawn(args:list, env:dict, log_path:str) -> subprocess.Popen:
+    log = open(log_path, "ab")
+    return subprocess.Popen([sys.executable, *args], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+async def _wait_ready(url:str, proc:subprocess.Popen, timeout:float):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"{url} exited with {proc.returncode} before becoming ready")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+def _peak_rss_mb(pid:int) -> Optional[float]:
+    """VmHWM (peak resident set) from /proc; None where that isn't available."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+def _stop(proc:subprocess.Popen):
+    if proc.poll() is None:
+        proc.send_signal(signal.SIGINT)  # lets uvicorn run the lifespan shutdown
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+def _git() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, timeout=10).stdout.strip()
+        except Exception:
+            return ""
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+# --- request generators: (i, rng) -> (method, url, httpx kwargs) ---
+
+def _text_receipt(i:int, rng:random.Random, llm_ratio:float) -> bytes:
+    merchant = rng.choice(["Amazon", "Target", "Best Buy", "Walmart", "Nordstrom"])
+    day = datetime.date.today() - datetime.timedelta(days=rng.randrange(0, 30))
+    nonce = f"{i}-{rng.randrange(10**12)}"
+    if rng.random() < llm_ratio:
+        # nothing the local parser can anchor on, so this one goes to the LLM
+        return f"{merchant.lower()} stuff ref {nonce}\nthanks!! paid w/ card ~{rng.randint(5, 300)} bucks\n".encode()
+    return (f"Thank you for shopping at {merchant}!\nOrder # BN{nonce.replace('-', 'X')}\n"
+            f"Order date: {day.isoformat()}\n- Wireless Mouse x1 $24.99\n- USB-C Cable x2 $9.99\nTotal $44.97\n").encode()
+
+def _png(i:int, rng:random.Random) -> bytes:
+    from PIL import Image
+    img = Image.frombytes("L", (96, 128), rng.randbytes(96 * 128))
+    out = io.BytesIO()
+    img.save(out, format="PNG")
+    return out.getvalue()
+
+def _generators(args, max_id:int) -> dict[str, Callable]:
+    merchants = ["Amazon", "Target", "Best Buy", "Walmart", "Nordstrom", "Zara", "Corner Hardware", "AMZN Mktp US"]
+    texts = [f"Returns accepted within {d} days with receipt. Restocking fee {f}% on electronics."
+             for d in (14, 30, 45, 60, 90) for f in (0, 10, 15, 20)]
+
+    def ingest_text(i, rng):
+        return "POST", "/ingest/receipt", {"files": {"file": (f"r{i}.txt", _text_receipt(i, rng, args.llm_ratio), "text/plain")}}
+
+    def ingest_image(i, rng):
+        return "POST", "/ingest/receipt", {"files": {"file": (f"r{i}.png", _png(i, rng), "image/png")}}
+
+    def orders(i, rng):
+        params = rng.choice([
+            {"limit": 50}, {"limit": 50, "sort": "deadline", "returnable": "true"},
+            {"limit": 50, "merchant": rng.choice(merchants[:6])},
+        ])
+        if rng.random() < 0.2:
+            return "GET", "/orders/expiring", {"params": {"within": 7, "limit": 100}}
+        return "GET", "/orders", {"params": params}
+
+    def order_detail(i, rng):
+        part = rng.choice(["full", "items", "options", "eligibility"])
+        return "GET", f"/order/{rng.randint(1, max_id)}/{part}", {}
+
+    def policy(i, rng):
+        params = {"merchant": rng.choice(merchants)}
+        if rng.random() < 0.3:
+            params["text"] = rng.choice(texts)
+        return "GET", "/policy", {"params": params}
+
+    def summary(i, rng):
+        params = {"weeks": rng.choice([1, 4, 8, 26])}
+        if rng.random() < 0.3:
+            params["merchant"] = rng.choice(merchants)
+        return "GET", "/orders/summary", {"params": params}
+
+    return {"ingest_text": ingest_text, "ingest_image": ingest_image, "orders": orders,
+            "order_detail": order_detail, "policy": policy, "summary": summary}
+
+# --- load ---
+
+def _percentile(xs:list[float], q:float) -> float:
+    if not xs:
+        return 0.0
+    return xs[max(0, math.ceil(q / 100 * len(xs)) - 1)]  # nearest rank
+
+def _summary(latencies:list[float], status:Counter, seconds:float) -> dict:
+    xs = sorted(latencies)
+    ms = lambda v: round(v * 1000, 2)
+    errors = sum(n for s, n in status.items() if not (s.isdigit() and (200 <= int(s) < 300 or s == "304")))
+    return {
+        "requests": len(xs), "errors": errors, "status": dict(sorted(status.items())),
+        "seconds": round(seconds, 2), "rps": round(len(xs) / seconds, 2) if seconds else 0.0,
+        "latency_ms": {"p50": ms(_percentile(xs, 50)), "p95": ms(_percentile(xs, 95)), "p99": ms(_percentile(xs, 99)),
+                       "max": ms(xs[-1]) if xs else 0.0, "mean": ms(sum(xs) / len(xs)) if xs else 0.0},
+    }
+
+async def _drive(client:httpx.AsyncClient, make:Callable, concurrency:int, duration:float,
+                 max_requests:int=0, rng_seed:int=0) -> dict:
+    latencies, status = [], Counter()
+    issued = 0
+    stop_at = time.perf_counter() + duration
+
+    async def worker(w:int):
+        nonlocal issued
+        rng = random.Random(rng_seed * 1000 + w)
+        while time.perf_counter() < stop_at and not (max_requests and issued >= max_requests):
+            i = issued
+            issued += 1
+            method, url, kwargs = make(i, rng)
+            start = time.perf_counter()
+            try:
+                r = await client.request(method, url, **kwargs)
+                code = str(r.status_code)
+            except httpx.HTTPError as e:
+                code = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            status[code] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    return _summary(latencies, status, time.perf_counter() - start)
+
+def _counter(metrics_text:str, name:str, label:str) -> dict:
+    """Sum a counter from /metrics by one label, e.g. extraction tier or token kind."""
+    out = {}
+    for line in metrics_text.splitlines():
+        if line.startswith(name + "{") and f'{label}="' in line:
+            labels, value = line.rsplit(" ", 1)
+            key = labels.split(f'{label}="', 1)[1].split('"', 1)[0]
+            out[key] = out.get(key, 0) + float(value)
+    return out
+
+async def bench(args) -> dict:
+    work = args.workdir or tempfile.mkdtemp(prefix="sendback-bench-")
+    os.makedirs(work, exist_ok=True)
+    fake_port, api_port = _free_port(), _free_port()
+    fake_url, api_url = f"http://127.0.0.1:{fake_port}", f"http://127.0.0.1:{api_port}"
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(work, 'bench.db')}",
+        "EXTRACT_CACHE_PATH": os.path.join(work, "extract_cache.db"),
+        "JOBS_DB_PATH": os.path.join(work, "jobs.db"),
+        "BLOB_STORE_DIR": os.path.join(work, "blobs"),
+        "LAVA_BASE_URL": fake_url, "ANTHROPIC_BASE_URL": fake_url, "REKA_BASE_URL": fake_url,
+        "REKA_API_KEY": "bench", "LOG_LEVEL": args.log_level,
+    }
+    for key in ("LAVA_FORWARD_TOKEN", "ANTHROPIC_API_KEY"):
+        env.pop(key, None)
+    if args.providers in ("lava", "sdk"):
+        env["ANTHROPIC_API_KEY"] = "bench"
+    if args.providers == "lava":
+        env["LAVA_FORWARD_TOKEN"] = "bench"
+    if args.providers == "none":
+        env.pop("REKA_API_KEY")
+
+    report = {
+        "version": REPORT_VERSION, "git": _git(),
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare", "out", "workdir")},
+    }
+
+    print(f"seeding {args.orders} orders in {work}", file=sys.stderr)
+    seeded = subprocess.run([sys.executable, "-m", "apps.api.bench.seed", "--orders", str(args.orders)],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if seeded.returncode != 0:
+        raise RuntimeError(f"seed failed:\n{seeded.stderr}")
+    report["seed"] = json.loads(seeded.stdout.strip().splitlines()[-1])
+
+    fakes = _spawn(["-m", "apps.api.bench.fakes", "--port", str(fake_port), "--latency-ms", str(args.latency_ms),
+                    "--jitter-ms", str(args.jitter_ms), "--fail-rate", str(args.fail_rate)],
+                   env, os.path.join(work, "fakes.log"))
+    api = None
+    try:
+        await _wait_ready(f"{fake_url}/health", fakes, 30)
+        started = time.perf_counter()
+        api = _spawn(["-m", "uvicorn", "apps.api.main:app", "--host", "127.0.0.1", "--port", str(api_port),
+                      "--log-level", "warning", "--no-access-log"], env, os.path.join(work, "api.log"))
+        await _wait_ready(f"{api_url}/health", api, 300)
+        report["startup_s"] = round(time.perf_counter() - started, 2)
+
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=api_url, timeout=args.timeout, limits=limits) as client:
+            newest = (await client.get("/orders", params={"limit": 1})).json()["orders"]
+            gens = _generators(args, newest[0]["id"] if newest else 1)
+            report["scenarios"] = {}
+            for n, name in enumerate(args.scenarios):
+                print(f"{name}: {args.concurrency} concurrent for {args.duration}s", file=sys.stderr)
+                if args.warmup:
+                    await _drive(client, gens[name], args.concurrency, args.warmup, rng_seed=10_000 + n)
+                report["scenarios"][name] = await _drive(client, gens[name], args.concurrency, args.duration,
+                                                         args.requests, rng_seed=n)
+            metrics = (await client.get("/metrics")).text
+            report["tiers"] = _counter(metrics, "sendback_extraction_tier_total", "tier")
+            report["tokens"] = _counter(metrics, "sendback_llm_tokens_total", "kind")
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            report["upstream"] = (await client.get(f"{fake_url}/stats")).json()
+        report["rss_mb"] = {"api_peak": _peak_rss_mb(api.pid), "fakes_peak": _peak_rss_mb(fakes.pid)}
+    finally:
+        if api is not None:
+            _stop(api)
+        _stop(fakes)
+    return report
+
+# --- compare ---
+
+def _pct(old:float, new:float) -> Optional[float]:
+    return round((new - old) / old * 100, 1) if old else None
+
+def compare(old:dict, new:dict, max_regression:Optional[float]=None) -> int:
+    """Print per-scenario deltas; non-zero if rps fell or p95/p99 rose by more than max_regression %."""
+    failed = []
+    print(f"{'scenario':<14}" + "".join(f"{h:^27}" for h in ("rps", "p95 ms", "p99 ms")) + f"{'errors':^13}")
+    for name, b in new.get("scenarios", {}).items():
+        a = old.get("scenarios", {}).get(name)
+        if not a:
+            print(f"{name:<14}{'(new)':^27}")
+            continue
+        cells, deltas = [], {}
+        for key, get in (("rps", lambda s: s["rps"]), ("p95", lambda s: s["latency_ms"]["p95"]),
+                         ("p99", lambda s: s["latency_ms"]["p99"])):
+            d = deltas[key] = _pct(get(a), get(b))
+            cells.append(f"{get(a):>9.2f} → {get(b):<9.2f}{'' if d is None else f'{d:+.1f}%':>7}")
+        print(f"{name:<14}" + "".join(cells) + f"{a['errors']:>6} → {b['errors']:<6}")
+        if max_regression is not None:
+            if (deltas["rps"] or 0) < -max_regression:
+                failed.append(f"{name} rps {deltas['rps']:+.1f}%")
+            for key in ("p95", "p99"):
+                if (deltas[key] or 0) > max_regression:
+                    failed.append(f"{name} {key} {deltas[key]:+.1f}%")
+    a_rss, b_rss = (old.get("rss_mb") or {}).get("api_peak"), (new.get("rss_mb") or {}).get("api_peak")
+    if a_rss and b_rss:
+        print(f"api peak RSS  {a_rss} MB → {b_rss} MB ({_pct(a_rss, b_rss):+.1f}%)")
+    for line in failed:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if failed else 0
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--orders", type=int, default=10000, help="seed the database up to this many orders")
+    ap.add_argument("--scenarios", type=lambda s: [x for x in s.split(",") if x], default=list(SCENARIOS))
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--duration", type=float, default=15.0, help="seconds per scenario")
+    ap.add_argument("--warmup", type=float, default=2.0, help="unrecorded seconds before each scenario")
+    ap.add_argument("--requests", type=int, default=0, help="cap per scenario (0 = duration only)")
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--llm-ratio", type=float, default=0.5, help="share of text receipts the local parser can't read")
+    ap.add_argument("--providers", choices=["lava", "sdk", "none"], default="lava",
+                    help="which upstream credentials the API gets (none = local parse / fallback only)")
+    ap.add_argument("--latency-ms", type=float, default=400.0)
+    ap.add_argument("--jitter-ms", type=float, default=100.0)
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--log-level", default="WARNING")
+    ap.add_argument("--workdir", help="keep the database, caches and logs here (default: a fresh temp dir)")
+    ap.add_argument("--out", help="write the JSON report here (default: stdout)")
+    ap.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="diff two reports instead of running")
+    ap.add_argument("--max-regression", type=float, help="with --compare: exit 1 past this %% change")
+    args = ap.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as a, open(args.compare[1]) as b:
+            sys.exit(compare(json.load(a), json.load(b), args.max_regression))
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        ap.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    report = asyncio.run(bench(args))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+        print(f"wrote {args.out}", file=sys.stderr)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Fill DATABASE_URL with synthetic orders (1–3 line items each) for benchmarks.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m apps.api.bench.seed --orders 1000000
+
+Rows go in with executemany in batches and explicit ids, so 1M orders take
+about a minute on SQLite. Running it again only tops the table up to --orders.
+"""
+import time, random, datetime, argparse
+from sqlalchemy import func, insert, select
+from ..db import Base, engine
+from ..models import Order, LineItem
+from .. import migrations
+from ..services import summary
+from ..seed import policies
+from .fakes import ITEMS
+
+SEED_BATCH = 20000
+# A share of unknown merchants so the policy fallback path shows up too
+UNKNOWN_MERCHANTS = ["Corner Hardware", "Blue Fern Books", "Atlas Outdoor Co"]
+
+def seed(n:int, batch:int=SEED_BATCH, rng_seed:int=1) -> dict:
+    Base.metadata.create_all(bind=engine)
+    migrations.upgrade(engine)
+    merchants = [p["merchant"] for p in policies.index().data.values()] + UNKNOWN_MERCHANTS
+    rng = random.Random(rng_seed)
+    today = datetime.date.today()
+    now = datetime.datetime.utcnow()
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        have = conn.execute(select(func.count(Order.id))).scalar() or 0
+        next_id = (conn.execute(select(func.max(Order.id))).scalar() or 0) + 1
+        next_item = (conn.execute(select(func.max(LineItem.id))).scalar() or 0) + 1
+    added = 0
+    while have + added < n:
+        orders, items, deltas = [], [], {}
+        for _ in range(min(batch, n - have - added)):
+            merchant = rng.choice(merchants)
+            bought = today - datetime.timedelta(days=rng.randrange(0, 120))
+            total = 0.0
+            for _ in range(rng.randint(1, 3)):
+                qty, price = rng.randint(1, 3), round(rng.uniform(3, 200), 2)
+                items.append({"id": next_item, "order_id": next_id, "name": rng.choice(ITEMS), "sku": None,
+                              "quantity": qty, "unit_price": price})
+                total += qty * price
+                next_item += 1
+            orders.append({
+                "id": next_id, "merchant": merchant, "order_id_text": f"BENCH-{next_id:09d}",
+                "purchase_date": bought, "deadline_date": bought + datetime.timedelta(days=policies.window_for(merchant)),
+                "total_amount": round(total, 2), "source": "bench", "updated_at": now,
+            })
+            summary.add(deltas, None, (merchant, orders[-1]["deadline_date"], orders[-1]["total_amount"]))
+            next_id += 1
+        with engine.begin() as conn:
+            conn.execute(insert(Order), orders)
+            conn.execute(insert(LineItem), items)
+            summary.apply(conn, deltas)
+        added += len(orders)
+    return {"orders": have + added, "added": added, "seconds": round(time.perf_counter() - start, 2)}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--orders", type=int, default=10000)
+    ap.add_argument("--batch", type=int, default=SEED_BATCH)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+    import json
+    print(json.dumps(seed(args.orders, args.batch, args.seed)))
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,53 @@
 import os
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sendback.db")
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {})
+# Optional replica for reads; defaults to the primary
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or DATABASE_URL
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+def _make_engine(url:str, readonly:bool=False):
+    if url.startswith("sqlite"):
+        eng = create_engine(url, connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000})
+
+        @event.listens_for(eng, "connect")
+        def _sqlite_pragmas(dbapi_conn, _):
+            # WAL lets readers proceed while a writer holds the lock; NORMAL is durable enough under WAL
+            cur = dbapi_conn.cursor()
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute("PRAGMA synchronous=NORMAL")
+            cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            if readonly:
+                cur.execute("PRAGMA query_only=ON")
+            cur.close()
+            # pysqlite only sends BEGIN ahead of DML, so a SAVEPOINT opened first would start (and its
+            # RELEASE commit) the transaction on its own. Take over: no implicit BEGIN, ours below.
+            dbapi_conn.isolation_level = None
+
+        @event.listens_for(eng, "begin")
+        def _sqlite_begin(conn):
+            # writers take the lock up front (waiting out busy_timeout) rather than failing on upgrade
+            conn.exec_driver_sql("BEGIN" if readonly else "BEGIN IMMEDIATE")
+        return eng
+
+    eng = create_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=True, pool_recycle=1800)
+    if readonly and url.startswith("postgres"):
+        @event.listens_for(eng, "connect")
+        def _pg_readonly(dbapi_conn, _):
+            cur = dbapi_conn.cursor()
+            cur.execute("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+            cur.close()
+    return eng
+
+engine = _make_engine(DATABASE_URL)
+read_engine = _make_engine(DATABASE_READ_URL, readonly=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Separate pool for read-only handlers so they never queue behind ingest writes
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 Base = declarative_base()
 
 def get_db():
@@ -12,4 +55,24 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+@contextmanager
+def session_scope():
+    """For code outside a request (job workers, scripts): commit on success, roll back on error, always close."""
+    db = SessionLocal()
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
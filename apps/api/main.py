@@ -1,9 +1,24 @@
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import ingest, policy, orders
+from .routers import ingest, policy, orders, reminders as reminders_router
+from .services import providers, jobs, telemetry, reminders
 
-app = FastAPI(title="sendback API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # in-process workers for /ingest/receipt?background=true (INGEST_WORKERS=0 to run them elsewhere)
+    jobs.start_workers({"receipt": ingest.process_receipt_job})
+    # 7/3/1-day reminder heap, loaded once here and fed by ingest afterwards
+    await reminders.start()
+    yield
+    await reminders.stop()
+    await jobs.stop_workers()
+    # drop pooled keep-alive connections to LLM/OCR providers
+    await providers.aclose_all()
+
+app = FastAPI(title="sendback API", lifespan=lifespan)
 
 # allow local web app
 app.add_middleware(
@@ -14,13 +29,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# per-route latency histograms (+ elastic-apm when ELASTIC_APM_SERVER_URL is set)
+telemetry.instrument(app)
+
 app.include_router(ingest.router)
 app.include_router(policy.router)
 app.include_router(orders.router)
+app.include_router(reminders_router.router)
 
 @app.get("/health")
 def health():
-    return {"ok": True}
+    return {"ok": True, "providers": providers.breaker_states()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition: stage/request latency histograms, extraction tiers, cache hit ratios."""
+    return PlainTextResponse(telemetry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 async def list_routes():
@@ -0,0 +1,143 @@
+"""
+Idempotent, in-process schema upgrades (there is no Alembic here).
+
+create_all only creates missing tables, so anything added to an existing
+table — indexes, columns, type changes — gets a step in upgrade().
+"""
+import re, datetime
+from sqlalchemy import Date, inspect, text
+from .db import Base
+
+_done = set()
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+def _to_iso(value):
+    from .services.receipt_parser import find_date
+    if value is None:
+        return None
+    s = str(value).strip()
+    if ISO_DATE.match(s):
+        try:
+            return datetime.date.fromisoformat(s).isoformat()
+        except ValueError:
+            return None
+    return find_date(s)
+
+def _typed_dates(conn):
+    """purchase_date / deadline_date: ISO strings → DATE. days_remaining is now computed on read."""
+    cols = {c["name"]: c for c in inspect(conn).get_columns("orders")}
+    if conn.dialect.name == "sqlite":
+        # SQLite keeps DATE as 'YYYY-MM-DD' text, so only values in another shape need rewriting
+        rows = conn.execute(text(
+            "SELECT id, purchase_date, deadline_date FROM orders WHERE "
+            "purchase_date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]' OR "
+            "deadline_date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'"
+        )).fetchall()
+        for oid, p, d in rows:
+            conn.execute(text("UPDATE orders SET purchase_date=:p, deadline_date=:d WHERE id=:id"),
+                         {"p": _to_iso(p), "d": _to_iso(d), "id": oid})
+        _fill_deadlines(conn)
+        return
+    for name in ("purchase_date", "deadline_date"):
+        if name in cols and not isinstance(cols[name]["type"], Date):
+            conn.execute(text(
+                f"ALTER TABLE orders ALTER COLUMN {name} TYPE DATE USING "
+                f"(CASE WHEN {name} ~ '^\\d{{4}}-\\d{{2}}-\\d{{2}}$' THEN {name}::date END)"
+            ))
+    if "days_remaining" in cols:
+        conn.execute(text("ALTER TABLE orders DROP COLUMN days_remaining"))
+    _fill_deadlines(conn)
+
+def _fill_deadlines(conn):
+    """Deadlines that were unparseable are recomputed from the purchase date, as ingest would."""
+    from .seed import policies
+    rows = conn.execute(text(
+        "SELECT id, merchant, purchase_date FROM orders WHERE deadline_date IS NULL AND purchase_date IS NOT NULL"
+    )).fetchall()
+    for oid, merchant, p in rows:
+        purchased = datetime.date.fromisoformat(str(p)[:10])
+        deadline = purchased + datetime.timedelta(days=policies.window_for(merchant or ""))
+        conn.execute(text("UPDATE orders SET deadline_date=:d WHERE id=:id"), {"d": deadline.isoformat(), "id": oid})
+
+def _dedupe_orders(conn):
+    """'N/A' order ids become NULL; repeated (merchant, order_id_text) rows fold into the oldest one."""
+    conn.execute(text(
+        "UPDATE orders SET order_id_text=NULL "
+        "WHERE LOWER(TRIM(COALESCE(order_id_text, ''))) IN ('', 'n/a', 'na', 'none', 'null', 'unknown')"
+    ))
+    groups = conn.execute(text(
+        "SELECT merchant, order_id_text, MIN(id) FROM orders "
+        "WHERE merchant IS NOT NULL AND order_id_text IS NOT NULL "
+        "GROUP BY merchant, order_id_text HAVING COUNT(*) > 1"
+    )).fetchall()
+    for merchant, order_id_text, keep in groups:
+        seen = {(n, s or "") for n, s in conn.execute(
+            text("SELECT name, sku FROM line_items WHERE order_id=:k"), {"k": keep})}
+        dupes = [r[0] for r in conn.execute(
+            text("SELECT id FROM orders WHERE merchant=:m AND order_id_text=:o AND id<>:k"),
+            {"m": merchant, "o": order_id_text, "k": keep})]
+        for dupe in dupes:
+            for item_id, name, sku in conn.execute(
+                    text("SELECT id, name, sku FROM line_items WHERE order_id=:d ORDER BY id"), {"d": dupe}).fetchall():
+                if (name, sku or "") in seen:
+                    conn.execute(text("DELETE FROM line_items WHERE id=:i"), {"i": item_id})
+                else:
+                    seen.add((name, sku or ""))
+                    conn.execute(text("UPDATE line_items SET order_id=:k WHERE id=:i"), {"k": keep, "i": item_id})
+            conn.execute(text("DELETE FROM orders WHERE id=:d"), {"d": dupe})
+
+def _order_updated_at(conn):
+    cols = {c["name"] for c in inspect(conn).get_columns("orders")}
+    if "updated_at" not in cols:
+        kind = "DATETIME" if conn.dialect.name == "sqlite" else "TIMESTAMP"
+        conn.execute(text(f"ALTER TABLE orders ADD COLUMN updated_at {kind}"))
+    conn.execute(text("UPDATE orders SET updated_at=:now WHERE updated_at IS NULL"), {"now": datetime.datetime.utcnow()})
+
+def _order_receipt_sha256(conn):
+    cols = {c["name"] for c in inspect(conn).get_columns("orders")}
+    if "receipt_sha256" not in cols:
+        conn.execute(text("ALTER TABLE orders ADD COLUMN receipt_sha256 VARCHAR"))
+
+def _order_totals(conn):
+    """total_amount was always written as 0.0: compute it from the line items, then build order_summary."""
+    from .services import summary
+    conn.execute(text(
+        "UPDATE orders SET total_amount = ROUND(CAST(COALESCE((SELECT SUM(quantity * unit_price) FROM line_items "
+        "WHERE line_items.order_id = orders.id), 0) AS NUMERIC), 2)"
+    ))
+    summary.rebuild(conn)
+
+# (version, step) — append only; each runs once per database
+STEPS = [
+    (1, _typed_dates),
+    (2, _dedupe_orders),
+    (3, _order_updated_at),
+    (4, _order_receipt_sha256),
+    (5, _order_totals),
+]
+
+def _run_steps(engine):
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY)"))
+        done = {r[0] for r in conn.execute(text("SELECT version FROM schema_migrations"))}
+    for version, step in STEPS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            step(conn)
+            conn.execute(text("INSERT INTO schema_migrations (version) VALUES (:v)"), {"v": version})
+
+def _ensure_indexes(engine):
+    for table in Base.metadata.sorted_tables:
+        for idx in table.indexes:
+            idx.create(bind=engine, checkfirst=True)
+
+def upgrade(engine):
+    if engine.url in _done:
+        return
+    from . import models  # noqa: F401  (register tables on Base.metadata)
+    from .services import summary  # noqa: F401  (order_summary upkeep on every flush)
+    Base.metadata.create_all(bind=engine)
+    _run_steps(engine)
+    _ensure_indexes(engine)
+    _done.add(engine.url)
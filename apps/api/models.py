@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Date, Float, ForeignKey, Boolean
+import datetime
+from sqlalchemy import Column, Integer, String, Date, DateTime, Float, ForeignKey, Boolean, Index, Text
 from sqlalchemy.orm import relationship
 from .db import Base
 
@@ -6,20 +7,71 @@ class Order(Base):
     __tablename__ = "orders"
     id = Column(Integer, primary_key=True, index=True)
     merchant = Column(String, index=True)
-    order_id_text = Column(String)
-    purchase_date = Column(String)  # ISO date string
-    deadline_date = Column(String)  # ISO date
-    days_remaining = Column(Integer)
+    order_id_text = Column(String)  # NULL when the receipt has no order number
+    purchase_date = Column(Date)
+    deadline_date = Column(Date)
     total_amount = Column(Float, default=0.0)
     source = Column(String, default="upload")
+    # bumped on every change; versions cached renderings such as calendar events
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    # raw receipt in the blob store, for re-extraction (NULL for orders ingested before it existed)
+    receipt_sha256 = Column(String, index=True)
     items = relationship("LineItem", back_populates="order", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # keyset pagination: (deadline_date, id) is the sort key for /orders?sort=deadline
+        Index("ix_orders_deadline_id", "deadline_date", "id"),
+        Index("ix_orders_merchant_deadline_id", "merchant", "deadline_date", "id"),
+        # re-ingesting the same order merges into it; NULL order ids never collide
+        Index("uq_orders_merchant_order_id", "merchant", "order_id_text", unique=True),
+    )
+
+    @property
+    def days_remaining(self):
+        # derived at read time; a stored value would be wrong by tomorrow
+        if self.deadline_date is None:
+            return None
+        return (self.deadline_date - datetime.date.today()).days
+
 class LineItem(Base):
     __tablename__ = "line_items"
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"))
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)
     name = Column(String)
     sku = Column(String)
     quantity = Column(Integer, default=1)
     unit_price = Column(Float, default=0.0)
     order = relationship("Order", back_populates="items")
+
+class IdempotencyKey(Base):
+    """Response recorded for an Idempotency-Key so a retried ingest replays it instead of re-running."""
+    __tablename__ = "idempotency_keys"
+    key = Column(String, primary_key=True)
+    request_hash = Column(String, nullable=False)
+    status_code = Column(Integer, default=200)
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+class ReceiptBlob(Base):
+    """A raw receipt kept in the blob store (services/blobs.py), keyed by the sha256 of its bytes."""
+    __tablename__ = "receipt_blobs"
+    sha256 = Column(String, primary_key=True)
+    filename = Column(String)
+    content_type = Column(String)
+    size = Column(Integer)
+    stored_size = Column(Integer)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # refreshed when the same receipt is uploaded again; retention counts from here
+    last_seen_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    # model/prompt version of the extraction the orders currently reflect; the backfill checkpoint
+    extraction_version = Column(String, index=True)
+    extracted_at = Column(DateTime)
+
+class OrderSummary(Base):
+    """Order count and value per merchant and deadline week; kept current by services/summary.py."""
+    __tablename__ = "order_summary"
+    merchant = Column(String, primary_key=True)
+    week_start = Column(Date, primary_key=True)  # Monday of the week the deadline falls in
+    orders = Column(Integer, nullable=False, default=0)
+    # integer cents, so a long run of increments can't drift
+    amount_cents = Column(Integer, nullable=False, default=0)
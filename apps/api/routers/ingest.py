@@ -1,83 +1,425 @@
-import time, datetime, json, mimetypes
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from ..services import ocr_reka, extract_claude
-from ..db import SessionLocal, engine
-from ..models import Order, LineItem
+import os, time, datetime, json, hashlib, mimetypes, asyncio, zipfile
+from typing import Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Depends, Header
+from fastapi.responses import JSONResponse, StreamingResponse
+from ..services import extract_claude, jobs, uploads, telemetry, reminders, blobs
+from ..services.uploads import Upload
+from ..db import engine, get_db, session_scope
+from ..models import Order, LineItem, IdempotencyKey
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from ..seed import policies
 
 router = APIRouter()
-from ..db import Base
-Base.metadata.create_all(bind=engine)
 
-def compute_deadline(purchase_date_iso:str, merchant:str)->tuple[str,int]:
-    today = datetime.date.today()
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "8"))
+MAX_BATCH_FILES = int(os.getenv("INGEST_MAX_BATCH_FILES", "500"))
+MAX_ZIP_BYTES = int(os.getenv("INGEST_MAX_ZIP_BYTES", str(512 * 1024 * 1024)))
+# The archive as uploaded; its members are still held to MAX_UPLOAD_BYTES each
+MAX_ZIP_UPLOAD_BYTES = int(os.getenv("INGEST_MAX_ZIP_UPLOAD_BYTES", str(512 * 1024 * 1024)))
+ZIP_TYPES = ("application/zip", "application/x-zip-compressed")
+RECEIPT_EXTS = (".txt", ".pdf", ".png", ".jpg", ".jpeg")
+IDEMPOTENCY_TTL_S = float(os.getenv("IDEMPOTENCY_TTL_S", str(24 * 3600)))
+NO_ORDER_ID = {"", "n/a", "na", "none", "null", "unknown"}
+from .. import migrations
+migrations.upgrade(engine)
+
+def compute_deadline(purchase_date:datetime.date, merchant:str)->datetime.date:
+    window = policies.window_for(merchant)
+    return purchase_date + datetime.timedelta(days=window)
+
+def _parse_date(value) -> Optional[datetime.date]:
     try:
-        pdate = datetime.date.fromisoformat(purchase_date_iso)
+        return datetime.date.fromisoformat(str(value))
     except Exception:
-        pdate = today
-    window = policies.window_for(merchant)
-    deadline = pdate + datetime.timedelta(days=window)
-    return (deadline.isoformat(), (deadline - today).days)
+        return None
 
-@router.post("/ingest/receipt")
-async def ingest_receipt(file: UploadFile = File(...)):
-    b = await file.read()
-    fn = (file.filename or "").lower()
+async def _extract_fields(upload:Upload, refresh:bool=False) -> dict:
+    fn = upload.filename.lower()
     # Guess media type
-    mime = file.content_type or mimetypes.guess_type(fn)[0] or ""
+    mime = upload.content_type or mimetypes.guess_type(fn)[0] or ""
 
-    # Get text if we can (txt or pdf via local extractor), but also pass bytes for Vision
+    # Get text if we can (txt or pdf via local extractor), but also pass the file for Vision
     text = ""
     if fn.endswith(".txt"):
         try:
-            text = b.decode(errors="ignore")
+            text = upload.text()
         except Exception:
             text = ""
     elif fn.endswith(".pdf"):
         # Let extractor handle PDF text internally
         pass
     elif fn.endswith((".png", ".jpg", ".jpeg")):
-        # If you have REKA key, use OCR; otherwise we'll rely on Vision
-        try:
-            text = ocr_reka.ocr_image_to_text(b) or ""
-        except Exception:
-            text = ""
+        # Images: the extractor races Reka OCR against Vision itself
+        mime = mime or "image/jpeg"
+
+    # Call the extractor with both text and the spooled file; it is read lazily, never whole
+    with telemetry.span("extract"):
+        return await extract_claude.extract_order_fields(text, media_type=mime, source=upload.file, digest=upload.sha256,
+                                                         refresh=refresh)
+
+async def _stash(upload:Upload) -> Optional[dict]:
+    """Keep the raw receipt in the blob store for later re-extraction. Never fails the ingest."""
+    if not blobs.BLOB_STORE_ENABLED:
+        return None
+    try:
+        info = await asyncio.to_thread(blobs.put, upload)
+    except Exception as e:
+        telemetry.warn("ingest.blob_failed", file=upload.filename, error=repr(e))
+        return None
+    return {**info, "filename": upload.filename, "content_type": upload.content_type}
+
+def _order_id(value) -> Optional[str]:
+    value = str(value or "").strip()
+    return None if value.lower() in NO_ORDER_ID else value
+
+def _item_rows(fields:dict) -> list[dict]:
+    return [
+        {
+            "name": it.get("name","Item"),
+            "sku": it.get("sku") or "",
+            "quantity": int(it.get("qty") or 1),
+            "unit_price": float(it.get("unit_price") or 0.0),
+        }
+        for it in fields.get("items", []) or []
+    ]
 
-    # Call the extractor with both text and (optional) bytes
-    fields = extract_claude.extract_order_fields(text, image_bytes=b, media_type=mime)
+def _total(items:list[dict]) -> float:
+    return round(sum(row["quantity"] * row["unit_price"] for row in items), 2)
 
+def _build_order(fields:dict, receipt_sha256:Optional[str]=None) -> tuple[Order, list[dict]]:
+    """The order row plus its item rows; items are bulk-inserted once the order has an id."""
     merchant = fields.get("merchant") or "Unknown"
-    purchase_date = fields.get("purchase_date") or datetime.date.today().isoformat()
-    deadline_iso, days_remaining = compute_deadline(purchase_date, merchant)
+    purchase_date = _parse_date(fields.get("purchase_date")) or datetime.date.today()
+    items = _item_rows(fields)
 
-    db: Session = SessionLocal()
     order = Order(
         merchant=merchant,
-        order_id_text=fields.get("order_id") or "N/A",
+        order_id_text=_order_id(fields.get("order_id")),
         purchase_date=purchase_date,
-        deadline_date=deadline_iso,
-        days_remaining=days_remaining,
-        total_amount=0.0
+        deadline_date=compute_deadline(purchase_date, merchant),
+        total_amount=_total(items),
+        receipt_sha256=receipt_sha256,
     )
-    db.add(order); db.commit(); db.refresh(order)
-
-    for it in fields.get("items", []) or []:
-        li = LineItem(
-            order_id=order.id,
-            name=it.get("name","Item"),
-            sku=it.get("sku") or "",
-            quantity=int(it.get("qty") or 1),
-            unit_price=float(it.get("unit_price") or 0.0)
-        )
-        db.add(li)
-    db.commit()
-
-    return {"ok": True, "order": {
+    return order, items
+
+def _order_summary(order:Order) -> dict:
+    return {
         "id": order.id,
         "merchant": order.merchant,
         "order_id_text": order.order_id_text,
-        "purchase_date": order.purchase_date,
-        "deadline_date": order.deadline_date,
-        "days_remaining": order.days_remaining
-    }}
+        "purchase_date": order.purchase_date.isoformat(),
+        "deadline_date": order.deadline_date.isoformat(),
+        "days_remaining": order.days_remaining,
+        "total_amount": order.total_amount,
+    }
+
+def _existing(db:Session, order:Order) -> Optional[Order]:
+    if order.order_id_text is None:
+        return None
+    return (db.query(Order)
+            .filter(Order.merchant == order.merchant, Order.order_id_text == order.order_id_text)
+            .first())
+
+def _upsert_order(db:Session, order:Order, items:list[dict]) -> tuple[Order, bool]:
+    """
+    Insert the order, or merge into the one already stored for (merchant, order_id_text):
+    items it doesn't have yet are added, the rest left alone. Flushes but never commits.
+    Returns (order, created).
+    """
+    existing = _existing(db, order)
+    created = existing is None
+    if created:
+        try:
+            with db.begin_nested():
+                db.add(order)
+                db.flush()
+        except IntegrityError:
+            # a concurrent ingest inserted the same order between our SELECT and INSERT
+            existing, created = _existing(db, order), False
+    if not created:
+        have = {(n, s or "") for n, s in db.query(LineItem.name, LineItem.sku).filter(LineItem.order_id == existing.id)}
+        fresh = []
+        for row in items:
+            if (row["name"], row["sku"]) not in have:
+                have.add((row["name"], row["sku"]))
+                fresh.append(row)
+        if existing.receipt_sha256 is None:
+            existing.receipt_sha256 = order.receipt_sha256
+        items, order = fresh, existing
+        if items:
+            order.total_amount = round((order.total_amount or 0.0) + _total(items), 2)
+            order.updated_at = datetime.datetime.utcnow()
+    if items:
+        db.execute(insert(LineItem), [{**row, "order_id": order.id} for row in items])
+    return order, created
+
+def _replay(db:Session, key:str, request_hash:str) -> Optional[IdempotencyKey]:
+    rec = db.get(IdempotencyKey, key)
+    if rec is None:
+        return None
+    if (datetime.datetime.utcnow() - rec.created_at).total_seconds() > IDEMPOTENCY_TTL_S:
+        return None
+    if rec.request_hash != request_hash:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    return rec
+
+def _remember(db:Session, key:Optional[str], request_hash:str, body:dict, status_code:int=200):
+    if key:
+        db.merge(IdempotencyKey(key=key, request_hash=request_hash, status_code=status_code,
+                                response=json.dumps(body), created_at=datetime.datetime.utcnow()))
+
+def _replayed(rec:IdempotencyKey) -> JSONResponse:
+    return JSONResponse(status_code=rec.status_code, content=json.loads(rec.response), headers={"Idempotent-Replayed": "true"})
+
+async def _check_idempotency(db:Session, key:Optional[str], request_hash:str) -> Optional[JSONResponse]:
+    if not key:
+        return None
+
+    def lookup():
+        try:
+            rec = _replay(db, key, request_hash)
+            return _replayed(rec) if rec else None
+        finally:
+            db.rollback()  # don't hold the write transaction open across extraction
+    return await asyncio.to_thread(lookup)
+
+def _scheduled(body:dict) -> dict:
+    """Hand freshly saved orders to the reminder scheduler (on the event loop, after commit)."""
+    orders = [body["order"]] if body.get("order") else [r["order"] for r in body.get("results", []) if r.get("ok")]
+    for o in orders:
+        reminders.schedule(o["id"], o["merchant"], o["deadline_date"])
+    return body
+
+def _record_blob(db:Session, receipt:Optional[dict]):
+    if receipt:
+        blobs.record(db, receipt, receipt["filename"], receipt["content_type"], extract_claude.EXTRACTION_VERSION)
+
+def _save_order(db:Session, fields:dict, idempotency_key:Optional[str]=None, request_hash:str="",
+                receipt:Optional[dict]=None) -> dict:
+    """Order, items, the stored-receipt row and the idempotency record go out in one transaction."""
+    order, items = _build_order(fields, receipt and receipt["sha256"])
+    order, created = _upsert_order(db, order, items)
+    _record_blob(db, receipt)
+    body = {"ok": True, "created": created, "order": _order_summary(order)}
+    _remember(db, idempotency_key, request_hash, body)
+    try:
+        with telemetry.span("db_commit"):
+            db.commit()
+    except IntegrityError:
+        # the same Idempotency-Key raced us to the commit; answer with what it recorded
+        db.rollback()
+        rec = _replay(db, idempotency_key, request_hash) if idempotency_key else None
+        if rec is None:
+            raise
+        return json.loads(rec.response)
+    return body
+
+@router.post("/ingest/receipt")
+async def ingest_receipt(file: UploadFile = File(...), background: bool = Query(False), db: Session = Depends(get_db),
+                         idempotency_key: Optional[str] = Header(None)):
+    """
+    A retry carrying the same Idempotency-Key (and the same file) gets the first
+    response back without extracting again; re-uploading a receipt for an order
+    we already have merges into that order instead of duplicating it.
+    """
+    upload = await uploads.from_upload_file(file)
+    key = f"receipt:{idempotency_key}" if idempotency_key else None
+    replay = await _check_idempotency(db, key, upload.sha256)
+    if replay:
+        return replay
+
+    if background:
+        # hand off to the job queue; the client polls /ingest/jobs/{id}
+        payload = await asyncio.to_thread(upload.read)
+        job_id = await jobs.enqueue("receipt", payload, {"filename": file.filename, "content_type": file.content_type})
+        body = {"ok": True, "job_id": job_id, "status": "queued", "status_url": f"/ingest/jobs/{job_id}"}
+        if key:
+            def remember():
+                _remember(db, key, upload.sha256, body, 202)
+                db.commit()
+            await asyncio.to_thread(remember)
+        return JSONResponse(status_code=202, content=body)
+
+    receipt = await _stash(upload)
+    fields = await _extract_fields(upload)
+    # SQLAlchemy is blocking; write from a worker thread so the loop keeps serving
+    return _scheduled(await asyncio.to_thread(_save_order, db, fields, key, upload.sha256, receipt))
+
+_streaming: set[asyncio.Task] = set()  # strong refs so detached ingests aren't garbage-collected
+
+def _sse(event:str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.post("/ingest/receipt/stream")
+async def ingest_receipt_stream(file: UploadFile = File(...)):
+    """
+    Same pipeline as /ingest/receipt, reported as server-sent events:
+      received → stage (pdf_text, image_prep, ocr_done, extraction_started, …)
+      → llm_started / token (model output as it streams) / partial (merchant,
+      order_id, purchase_date, then items, as each becomes parseable)
+      → extracted → done (the saved order; its id comes last) | error.
+    """
+    # FastAPI closes the multipart upload once this handler returns, so take our own spooled copy first
+    upload = await asyncio.to_thread(uploads.from_stream, file.filename or "", file.file, file.content_type)
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def work():
+        try:
+            receipt = await _stash(upload)
+            with extract_claude.progress(lambda kind, data: events.put_nowait((kind, data))):
+                fields = await _extract_fields(upload)
+            events.put_nowait(("extracted", {"fields": fields}))
+
+            def save():
+                with session_scope() as db:
+                    return _save_order(db, fields, receipt=receipt)
+            events.put_nowait(("done", _scheduled(await asyncio.to_thread(save))))
+        except Exception as e:
+            telemetry.warn("ingest.stream_failed", file=upload.filename, error=repr(e))
+            detail = e.detail if isinstance(e, HTTPException) else "Extraction failed"
+            events.put_nowait(("error", {"ok": False, "error": detail}))
+        finally:
+            upload.close()
+            events.put_nowait((None, None))
+
+    async def stream():
+        yield _sse("received", {"filename": upload.filename, "size": upload.size, "sha256": upload.sha256})
+        # runs to completion (and saves the order) even if the client goes away
+        task = asyncio.create_task(work())
+        _streaming.add(task)
+        task.add_done_callback(_streaming.discard)
+        while True:
+            kind, data = await events.get()
+            if kind is None:
+                break
+            yield _sse(kind, data)
+        await task
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def process_receipt_job(payload:bytes, meta:dict) -> dict:
+    upload = uploads.from_bytes(meta.get("filename") or "", payload, meta.get("content_type"))
+    try:
+        receipt = await _stash(upload)
+        fields = await _extract_fields(upload)
+    finally:
+        upload.close()
+
+    def save():
+        with session_scope() as db:
+            return _save_order(db, fields, receipt=receipt)
+    return {"order": _scheduled(await asyncio.to_thread(save))["order"]}
+
+@router.get("/ingest/jobs/{job_id}")
+async def ingest_job_status(job_id: str):
+    job = await jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    result = job.pop("result") or {}
+    return {**job, "ok": job["status"] != "failed", "order": result.get("order")}
+
+def _unzip(archive:Upload) -> list[Upload]:
+    """Stream each member into its own spooled file; the archive is never inflated in memory."""
+    out, total = [], 0
+    archive.file.seek(0)
+    with zipfile.ZipFile(archive.file) as zf:
+        for info in zf.infolist():
+            base = info.filename.rsplit("/", 1)[-1]
+            if info.is_dir() or not base or base.startswith(".") or info.filename.startswith("__MACOSX/"):
+                continue
+            if not base.lower().endswith(RECEIPT_EXTS):
+                continue
+            total += info.file_size
+            if total > MAX_ZIP_BYTES:
+                raise HTTPException(status_code=413, detail=f"{archive.filename}: archive expands beyond {MAX_ZIP_BYTES} bytes")
+            with zf.open(info) as member:
+                out.append(uploads.from_stream(base, member))
+    return out
+
+@router.post("/ingest/receipts")
+async def ingest_receipts(files: list[UploadFile] = File(...), concurrency: Optional[int] = Query(None, ge=1, le=64),
+                          db: Session = Depends(get_db), idempotency_key: Optional[str] = Header(None)):
+    """
+    Many receipts (or one .zip of them) in a single request. Extraction runs
+    concurrently up to `concurrency`; all orders are written in one commit.
+    """
+    received: list[Upload] = []
+    for f in files:
+        archive = (f.filename or "").lower().endswith(".zip") or f.content_type in ZIP_TYPES
+        upload = await uploads.from_upload_file(f, MAX_ZIP_UPLOAD_BYTES if archive else None)
+        fn = upload.filename
+        if archive:
+            try:
+                received.extend(await asyncio.to_thread(_unzip, upload))
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"{fn}: not a valid zip archive")
+        else:
+            received.append(upload)
+    if not received:
+        raise HTTPException(status_code=400, detail="No receipts found")
+    if len(received) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_FILES} receipts per batch")
+
+    key = f"receipts:{idempotency_key}" if idempotency_key else None
+    request_hash = hashlib.sha256("".join(u.sha256 for u in received).encode()).hexdigest()
+    replay = await _check_idempotency(db, key, request_hash)
+    if replay:
+        for u in received:
+            u.close()
+        return replay
+
+    sem = asyncio.Semaphore(concurrency or INGEST_CONCURRENCY)
+
+    async def run(upload:Upload):
+        async with sem:
+            try:
+                receipt = await _stash(upload)
+                return await _extract_fields(upload), None, receipt
+            except Exception as e:
+                telemetry.warn("ingest.extraction_failed", file=upload.filename, error=repr(e))
+                return None, "Extraction failed", None
+            finally:
+                upload.close()
+
+    extracted = await asyncio.gather(*(run(u) for u in received))
+
+    built, errors = [], []
+    for fields, err, receipt in extracted:
+        order = None
+        if fields is not None:
+            try:
+                order = _build_order(fields, receipt and receipt["sha256"])
+            except Exception as e:
+                err = f"Unusable extraction: {e!r}"
+        built.append(order)
+        errors.append(err)
+
+    def save() -> dict:
+        # orders without an order id can't collide: one batched INSERT for all of them.
+        # The rest go through the upsert, which also folds duplicates within this batch.
+        receipt_of = {id(b[0]): r for b, (_, _, r) in zip(built, extracted) if b is not None}
+        fresh = [b for b in built if b is not None and b[0].order_id_text is None]
+        db.add_all([o for o, _ in fresh])
+        db.flush()
+        for o, items in fresh:
+            if items:
+                db.execute(insert(LineItem), [{**row, "order_id": o.id} for row in items])
+        fresh_ids = {id(o) for o, _ in fresh}
+        results = []
+        for upload, b, err in zip(received, built, errors):
+            if b is None:
+                results.append({"file": upload.filename, "ok": False, "error": err})
+                continue
+            order, created = (b[0], True) if id(b[0]) in fresh_ids else _upsert_order(db, *b)
+            _record_blob(db, receipt_of[id(b[0])])
+            results.append({"file": upload.filename, "ok": True, "created": created, "order": _order_summary(order)})
+        body = {"ok": all(r["ok"] for r in results), "count": len(results), "results": results}
+        _remember(db, key, request_hash, body)
+        with telemetry.span("db_commit"):
+            db.commit()
+        return body
+
+    return _scheduled(await asyncio.to_thread(save))
@@ -1,15 +1,21 @@
-from fastapi import APIRouter, HTTPException, Depends, Response
-from sqlalchemy.orm import Session
-from ..db import SessionLocal, engine
+import os, json, base64, hashlib
+from typing import Literal, Optional
+from fastapi import APIRouter, HTTPException, Depends, Response, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, selectinload
+from ..db import engine
 from ..models import Order, LineItem
 from ..seed import policies
-from datetime import datetime, timedelta
-from ..db import get_db
+from ..services import telemetry, summary
+from ..services.cache import LRUStore
+from datetime import date, datetime, timedelta
+from ..db import get_read_db, ReadSessionLocal
 from ..models import Order
 
 router = APIRouter()
-from ..db import Base
-Base.metadata.create_all(bind=engine)
+from .. import migrations
+migrations.upgrade(engine)
 
 def _get_order_or_404(db: Session, oid: int) -> Order:
     o = db.query(Order).filter(Order.id == oid).first()
@@ -17,23 +23,26 @@ def _get_order_or_404(db: Session, oid: int) -> Order:
         raise HTTPException(status_code=404, detail="Order not found")
     return o
 
-# apps/api/routers/orders.py (replace _eligibility_reason + /eligibility)
-def _eligibility_reason(order: Order) -> tuple[bool, str]:
-    today = datetime.date.today()
+_LOOKUP = object()
+
+def _merchant_policy(merchant: str) -> Optional[dict]:
+    # Policy-level constraints (defensive)
     try:
-        deadline = datetime.date.fromisoformat(order.deadline_date)
+        pol = getattr(policies, "policy_for", None)
+        return pol(merchant) if callable(pol) else None
     except Exception:
-        deadline = today
+        return None
+
+# apps/api/routers/orders.py (replace _eligibility_reason + /eligibility)
+def _eligibility_reason(order: Order, pol=_LOOKUP) -> tuple[bool, str]:
+    today = date.today()
+    deadline = order.deadline_date or today
 
     if today > deadline:
         return (False, "Past the return window")
 
-    # Policy-level constraints (defensive)
-    try:
-        pol = getattr(policies, "policy_for", None)
-        pol = pol(order.merchant) if callable(pol) else None
-    except Exception:
-        pol = None
+    if pol is _LOOKUP:
+        pol = _merchant_policy(order.merchant)
 
     if pol is None:
         # If we don't know, allow user to try (the UI still enforces deadline).
@@ -45,9 +54,8 @@ def _eligibility_reason(order: Order) -> tuple[bool, str]:
     return (True, "")
 
 @router.get("/order/{order_id}/eligibility")
-def order_eligibility(order_id: int):
+def order_eligibility(order_id: int, db: Session = Depends(get_read_db)):
     try:
-        db = SessionLocal()
         o = _get_order_or_404(db, order_id)
         ok, reason = _eligibility_reason(o)
         return {"ok": ok, "reason": reason}
@@ -60,8 +68,7 @@ def order_eligibility(order_id: int):
 
 
 @router.get("/order/{order_id}/items")
-def order_items(order_id: int):
-    db = SessionLocal()
+def order_items(order_id: int, db: Session = Depends(get_read_db)):
     o = _get_order_or_404(db, order_id)
     items = (
         db.query(LineItem)
@@ -69,24 +76,13 @@ def order_items(order_id: int):
         .order_by(LineItem.id.asc())
         .all()
     )
-    return {"items": [
-        {"id": it.id, "name": it.name, "sku": it.sku, "quantity": it.quantity, "unit_price": float(it.unit_price)}
-        for it in items
-    ]}
+    return {"items": [item_json(it) for it in items]}
 
-@router.get("/order/{order_id}/eligibility")
-def order_eligibility(order_id: int):
-    db = SessionLocal()
-    o = _get_order_or_404(db, order_id)
-    ok, reason = _eligibility_reason(o)
-    return {"ok": ok, "reason": reason}
-
-@router.get("/order/{order_id}/options")
-def order_options(order_id: int):
-    db: Session = SessionLocal()
-    o = _get_order_or_404(db, order_id)
-    pol = getattr(policies, "policy_for", lambda m: {})(o.merchant) or {}
+def item_json(it: LineItem):
+    return {"id": it.id, "name": it.name, "sku": it.sku, "quantity": it.quantity, "unit_price": float(it.unit_price)}
 
+def _options_for(o: Order, pol: Optional[dict]) -> list[dict]:
+    pol = pol or {}
     opts = []
     if pol.get("mail_allowed"):
         opts.append({"id": "mail", "label": "Mail-in return", "cta": "Set up mail return"})
@@ -104,17 +100,20 @@ def order_options(order_id: int):
             "cta": "Open return site",
             "url": url
         })
+    return opts
 
-    return {"options": opts}
+@router.get("/order/{order_id}/options")
+def order_options(order_id: int, db: Session = Depends(get_read_db)):
+    o = _get_order_or_404(db, order_id)
+    return {"options": _options_for(o, _merchant_policy(o.merchant))}
 
 
 @router.post("/order/{order_id}/initiate")
-def order_initiate(order_id: int, payload: dict):
+def order_initiate(order_id: int, payload: dict, db: Session = Depends(get_read_db)):
     """
     Body: { "item_ids": [int], "method": "mail" | "dropoff" }
     Returns a next_step url or instructions.
     """
-    db = SessionLocal()
     o = _get_order_or_404(db, order_id)
     ok, reason = _eligibility_reason(o)
     if not ok:
@@ -137,20 +136,161 @@ def order_initiate(order_id: int, payload: dict):
     else:
         return {"ok": True, "next": f"/order/{order_id}/dropoff"}
 
+def _iso(d: Optional[date]) -> Optional[str]:
+    return d.isoformat() if d else None
+
 def order_json(o: Order):
     return {"id": o.id, "merchant": o.merchant, "order_id_text": o.order_id_text,
-            "purchase_date": o.purchase_date, "deadline_date": o.deadline_date,
-            "days_remaining": o.days_remaining}
+            "purchase_date": _iso(o.purchase_date), "deadline_date": _iso(o.deadline_date),
+            "days_remaining": o.days_remaining, "total_amount": o.total_amount}
+
+def _encode_cursor(o: Order, sort: str) -> str:
+    key = [_iso(o.deadline_date), o.id] if sort == "deadline" else [o.id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def _decode_cursor(cursor: str) -> list:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _orders_query(db: Session, sort: str, merchant: Optional[str], deadline_from: Optional[date],
+                  deadline_to: Optional[date], returnable: bool):
+    q = db.query(Order)
+    if merchant:
+        q = q.filter(Order.merchant == merchant)
+    if deadline_from:
+        q = q.filter(Order.deadline_date >= deadline_from)
+    if deadline_to:
+        q = q.filter(Order.deadline_date <= deadline_to)
+    if returnable:
+        q = q.filter(Order.deadline_date >= date.today())
+    if sort == "deadline":
+        # NULL deadlines (unparseable dates) lead on every backend, as they do in SQLite's index order
+        return q.order_by(Order.deadline_date.asc().nulls_first(), Order.id.asc())
+    return q.order_by(Order.id.desc())
+
+def _after_cursor(q, sort: str, key: list):
+    """Keyset seek: rows strictly after the last one the client saw; O(limit) via the (deadline, id) index."""
+    try:
+        if sort == "deadline":
+            i = int(key[1])
+            if key[0] is None:
+                # still inside the leading NULL-deadline block
+                return q.filter(or_(and_(Order.deadline_date.is_(None), Order.id > i), Order.deadline_date.isnot(None)))
+            d = date.fromisoformat(key[0])
+            return q.filter(or_(Order.deadline_date > d, and_(Order.deadline_date == d, Order.id > i)))
+        return q.filter(Order.id < int(key[0]))
+    except (TypeError, ValueError, IndexError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @router.get("/orders")
-def list_orders():
-    db: Session = SessionLocal()
-    arr = db.query(Order).order_by(Order.id.desc()).all()
-    return {"orders":[order_json(o) for o in arr]}
+def list_orders(
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    merchant: Optional[str] = None,
+    deadline_from: Optional[date] = None,
+    deadline_to: Optional[date] = None,
+    returnable: bool = False,
+    sort: Literal["id", "deadline"] = "id",
+    format: Literal["json", "ndjson"] = "json",
+    db: Session = Depends(get_read_db),
+):
+    """
+    Keyset-paginated: pass back `next_cursor` to get the following page.
+    format=ndjson streams every matching order (one JSON object per line) for exports.
+    """
+    if format == "ndjson":
+        def rows():
+            # own session: request-scoped ones are closed before a streamed body finishes
+            s = ReadSessionLocal()
+            try:
+                q = _orders_query(s, sort, merchant, deadline_from, deadline_to, returnable)
+                if cursor:
+                    q = _after_cursor(q, sort, _decode_cursor(cursor))
+                for o in q.yield_per(500):
+                    yield json.dumps(order_json(o)) + "\n"
+            finally:
+                s.close()
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+    q = _orders_query(db, sort, merchant, deadline_from, deadline_to, returnable)
+    if cursor:
+        q = _after_cursor(q, sort, _decode_cursor(cursor))
+    arr = q.limit(limit + 1).all()
+    next_cursor = _encode_cursor(arr[limit - 1], sort) if len(arr) > limit else None
+    return {"orders": [order_json(o) for o in arr[:limit]], "next_cursor": next_cursor}
+
+@router.get("/orders/expiring")
+def expiring_orders(within: int = Query(7, ge=0, le=365), limit: int = Query(500, ge=1, le=5000),
+                    db: Session = Depends(get_read_db)):
+    """Orders whose deadline falls in [today, today + within] — a range scan on ix_orders_deadline_id."""
+    today = date.today()
+    arr = (
+        db.query(Order)
+        .filter(Order.deadline_date >= today, Order.deadline_date <= today + timedelta(days=within))
+        .order_by(Order.deadline_date.asc(), Order.id.asc())
+        .limit(limit)
+        .all()
+    )
+    return {"within": within, "orders": [order_json(o) for o in arr]}
+
+@router.get("/orders/summary")
+def orders_summary(weeks: int = Query(8, ge=1, le=104), merchant: Optional[str] = None,
+                   db: Session = Depends(get_read_db)):
+    """
+    Money at risk: order count and value whose deadline falls in this week or the next
+    `weeks - 1`, per week and per merchant. Reads order_summary, never the orders themselves.
+    """
+    return summary.read(db, weeks, merchant)
+
+def _order_full(o: Order) -> dict:
+    pol = _merchant_policy(o.merchant)  # looked up once for both eligibility and options
+    ok, reason = _eligibility_reason(o, pol)
+    return {
+        "order": order_json(o),
+        "items": [item_json(it) for it in sorted(o.items, key=lambda it: it.id)],
+        "eligibility": {"ok": ok, "reason": reason},
+        "options": _options_for(o, pol),
+    }
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    inm = request.headers.get("if-none-match")
+    return bool(inm) and (inm.strip() == "*" or etag in [t.strip() for t in inm.split(",")])
+
+def _etag_json(request: Request, payload) -> Response:
+    """Strong ETag over the exact body; a matching If-None-Match gets an empty 304."""
+    body = json.dumps(payload, separators=(",", ":"), sort_keys=True).encode()
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@router.get("/order/{order_id}/full")
+def order_full(order_id: int, request: Request, db: Session = Depends(get_read_db)):
+    """Order + items + eligibility + options in one round trip (items via one selectin query)."""
+    o = db.query(Order).options(selectinload(Order.items)).filter(Order.id == order_id).first()
+    if not o:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return _etag_json(request, _order_full(o))
+
+@router.get("/orders/full")
+def orders_full(request: Request, ids: str = Query(..., description="comma-separated order ids"),
+                db: Session = Depends(get_read_db)):
+    try:
+        wanted = list(dict.fromkeys(int(x) for x in ids.split(",") if x.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be integers")
+    if not wanted or len(wanted) > 200:
+        raise HTTPException(status_code=400, detail="Pass between 1 and 200 ids")
+    found = {o.id: o for o in db.query(Order).options(selectinload(Order.items)).filter(Order.id.in_(wanted))}
+    return _etag_json(request, {
+        "orders": [_order_full(found[i]) for i in wanted if i in found],
+        "missing": [i for i in wanted if i not in found],
+    })
 
 @router.get("/order/{order_id}")
-def get_order(order_id: int):
-    db: Session = SessionLocal()
+def get_order(order_id: int, db: Session = Depends(get_read_db)):
     o = db.get(Order, order_id)
     if not o: raise HTTPException(404, "No such order")
     return order_json(o)
@@ -170,67 +310,100 @@ def get_order(order_id: int):
 #     return {"order_id": order_id, "options": opts}
 
 
+ICS_CACHE_BYTES = int(os.getenv("ICS_CACHE_BYTES", str(4 * 1024 * 1024)))
+# Rendered VEVENT blocks keyed by (order id, updated_at): an edited order simply gets a new key
+_events = LRUStore(ICS_CACHE_BYTES)
+
+def _ics_escape(value) -> str:
+    return str(value or "").replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+def _vevent(order_id: int, merchant: str, deadline: date, updated_at: Optional[datetime]) -> str:
+    key = f"{order_id}:{updated_at.isoformat() if updated_at else ''}:{deadline.isoformat()}"
+    hit = _events.get(key)
+    if hit is not None:
+        return hit
+    # Format dates for ICS (YYYYMMDD format); DTSTAMP is the last change so a block never changes under a key
+    start_date = deadline.strftime('%Y%m%d')
+    end_date = (deadline + timedelta(days=1)).strftime('%Y%m%d')
+    stamp = (updated_at or datetime(2000, 1, 1)).strftime('%Y%m%dT%H%M%SZ')
+    m = _ics_escape(merchant)
+    block = "\r\n".join([
+        "BEGIN:VEVENT",
+        f"UID:{order_id}@yourapp.com",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART;VALUE=DATE:{start_date}",
+        f"DTEND;VALUE=DATE:{end_date}",
+        f"SUMMARY:Return Deadline - {m}",
+        f"DESCRIPTION:Return items from {m} by this date. Order ID: {order_id}",
+        f"LOCATION:{m}",
+        "STATUS:CONFIRMED",
+        *[line for days, label in ((7, "7 days"), (3, "3 days"), (1, "1 day")) for line in (
+            "BEGIN:VALARM", f"TRIGGER:-P{days}D", f"DESCRIPTION:Return reminder: {label} left", "ACTION:DISPLAY", "END:VALARM",
+        )],
+        "END:VEVENT",
+    ]) + "\r\n"
+    _events.put(key, block)
+    return block
+
+ICS_HEADER = "\r\n".join([
+    "BEGIN:VCALENDAR",
+    "VERSION:2.0",
+    "PRODID:-//Your App//Return Reminder//EN",
+    "CALSCALE:GREGORIAN",
+    "METHOD:PUBLISH",
+]) + "\r\n"
+ICS_FOOTER = "END:VCALENDAR\r\n"
+
 def generate_return_reminder(order):
     # Convert string date to datetime object
     if isinstance(order.deadline_date, str):
         return_by = datetime.strptime(order.deadline_date, '%Y-%m-%d').date()
     else:
         return_by = order.deadline_date
-    
-    # Format dates for ICS (YYYYMMDD format)
-    start_date = return_by.strftime('%Y%m%d')
-    end_date = (return_by + timedelta(days=1)).strftime('%Y%m%d')
-    
-    ics_content = f"""BEGIN:VCALENDAR
-VERSION:2.0
-PRODID:-//Your App//Return Reminder//EN
-CALSCALE:GREGORIAN
-METHOD:PUBLISH
-BEGIN:VEVENT
-UID:{order.id}@yourapp.com
-DTSTAMP:{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}
-DTSTART;VALUE=DATE:{start_date}
-DTEND;VALUE=DATE:{end_date}
-SUMMARY:Return Deadline - {order.merchant}
-DESCRIPTION:Return items from {order.merchant} by this date. Order ID: {order.id}
-LOCATION:{order.merchant}
-STATUS:CONFIRMED
-BEGIN:VALARM
-TRIGGER:-P7D
-DESCRIPTION:Return reminder: 7 days left
-ACTION:DISPLAY
-END:VALARM
-BEGIN:VALARM
-TRIGGER:-P3D
-DESCRIPTION:Return reminder: 3 days left
-ACTION:DISPLAY
-END:VALARM
-BEGIN:VALARM
-TRIGGER:-P1D
-DESCRIPTION:Return reminder: 1 day left
-ACTION:DISPLAY
-END:VALARM
-END:VEVENT
-END:VCALENDAR"""
-    
-    return ics_content
+    return ICS_HEADER + _vevent(order.id, order.merchant, return_by, order.updated_at) + ICS_FOOTER
+
+@router.get("/orders/calendar.ics")
+def orders_calendar(request: Request, db: Session = Depends(get_read_db)):
+    """
+    One subscribable feed with a VEVENT per open order. The ETag is derived from
+    (id, updated_at, deadline) of the rows alone, so a client polling with
+    If-None-Match gets a 304 without anything being rendered; otherwise each
+    event comes from the per-order cache and is only re-rendered after a change.
+    """
+    rows = (
+        db.query(Order.id, Order.merchant, Order.deadline_date, Order.updated_at)
+        .filter(Order.deadline_date >= date.today())
+        .order_by(Order.deadline_date.asc(), Order.id.asc())
+        .all()
+    )
+    h = hashlib.sha256()
+    for oid, _, deadline, updated_at in rows:
+        h.update(f"{oid}:{updated_at.isoformat() if updated_at else ''}:{deadline.isoformat()};".encode())
+    etag = '"' + h.hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    def body():
+        yield ICS_HEADER + "X-WR-CALNAME:Return deadlines\r\nREFRESH-INTERVAL;VALUE=DURATION:PT1H\r\n"
+        for oid, merchant, deadline, updated_at in rows:
+            yield _vevent(oid, merchant, deadline, updated_at)
+        yield ICS_FOOTER
+    return StreamingResponse(body(), media_type="text/calendar; charset=utf-8", headers=headers)
 
 
 @router.get("/order/{order_id}/calendar")
-async def download_calendar(order_id: int, db: Session = Depends(get_db)):
+def download_calendar(order_id: int, db: Session = Depends(get_read_db)):
     """Generate and download a calendar reminder for return deadline"""
-    print(f"📅 Calendar endpoint hit for order {order_id}")
-    
     order = db.query(Order).filter(Order.id == order_id).first()
     
     if not order:
-        print(f"❌ Order {order_id} not found")
         raise HTTPException(status_code=404, detail="Order not found")
     
     if not hasattr(order, 'deadline_date') or order.deadline_date is None:
         raise HTTPException(status_code=400, detail="Order has no return deadline")
     
-    print(f"✅ Generating calendar for order {order_id}")
+    telemetry.log("calendar.generate", order_id=order_id)
     ics_content = generate_return_reminder(order)
     
     return Response(
@@ -1,46 +1,97 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
 from ..services import extract_claude
 from ..seed import policies
-import os
+import os, asyncio
 
 router = APIRouter()
 
+MAX_POLICY_BATCH = int(os.getenv("MAX_POLICY_BATCH", "100"))
+POLICY_BATCH_CONCURRENCY = int(os.getenv("POLICY_BATCH_CONCURRENCY", "4"))
+
+def _seeded(merchant_data: dict) -> dict:
+    return {
+        "window_days": merchant_data.get("window_days", 30),
+        "restocking_fee_pct": merchant_data.get("restocking_fee_pct", 0),
+        "in_store_allowed": merchant_data.get("in_store_allowed", True),
+        "mail_allowed": merchant_data.get("mail_allowed", True),
+        "return_bar_supported": merchant_data.get("return_bar_supported", False),
+        "requires_rma": merchant_data.get("requires_rma", False),
+        "notes": merchant_data.get("text", "")
+    }
+
+# Fallback for totally unknown merchants so UI doesn't explode.
+FALLBACK = {
+    "window_days": 30,
+    "restocking_fee_pct": 0,
+    "in_store_allowed": True,
+    "mail_allowed": True,
+    "return_bar_supported": False,
+    "requires_rma": False,
+    "notes": "30-day returns (demo fallback)"
+}
+
 @router.get("/policy")
-def policy(merchant: str, text: str | None = None):
+async def policy(merchant: str, text: str | None = None):
     # If we have an Anthropic key, call the LLM summarizer for live parsing.
     if os.getenv("ANTHROPIC_API_KEY"):
         snippet = text or policies.text_for(merchant)
-        data = extract_claude.summarize_policy(snippet)
+        data = await extract_claude.summarize_policy(snippet)
         return {"merchant": merchant, "policy": data}
     else:
         # Otherwise, serve deterministic structured data so the frontend still works.
-        merchant_data = policies.DATA.get(merchant.lower())
+        merchant_data = policies.policy_for(merchant)
 
         if merchant_data:
             # Return actual seeded data for known merchants.
-            return {
-                "merchant": merchant,
-                "policy": {
-                    "window_days": merchant_data.get("window_days", 30),
-                    "restocking_fee_pct": merchant_data.get("restocking_fee_pct", 0),
-                    "in_store_allowed": merchant_data.get("in_store_allowed", True),
-                    "mail_allowed": merchant_data.get("mail_allowed", True),
-                    "return_bar_supported": merchant_data.get("return_bar_supported", False),
-                    "requires_rma": merchant_data.get("requires_rma", False),
-                    "notes": merchant_data.get("text", "")
-                }
-            }
+            return {"merchant": merchant, "policy": _seeded(merchant_data)}
+        else:
+            return {"merchant": merchant, "policy": dict(FALLBACK)}
+
+class PolicyQuery(BaseModel):
+    merchant: str
+    text: str | None = None
+
+class PolicyBatch(BaseModel):
+    merchants: list[PolicyQuery]
+
+@router.post("/policy/batch")
+async def policy_batch(body: PolicyBatch):
+    """
+    Return terms for a whole cart in one round trip. Queries are deduplicated
+    (different spellings of a seeded merchant count once); seeded merchants are
+    answered from the index, and only supplied policy texts go to the LLM —
+    concurrently, through the same cache and single-flight as GET /policy.
+    """
+    if len(body.merchants) > MAX_POLICY_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_POLICY_BATCH} merchants per batch")
+    use_llm = bool(os.getenv("ANTHROPIC_API_KEY"))
+
+    keys, unique = [], {}
+    for q in body.merchants:
+        entry = policies.policy_for(q.merchant)
+        if q.text and use_llm:
+            key = ("text", q.text)
+        elif entry:
+            key = ("seed", entry["merchant"].lower())
         else:
-            # Fallback for totally unknown merchants so UI doesn't explode.
-            return {
-                "merchant": merchant,
-                "policy": {
-                    "window_days": 30,
-                    "restocking_fee_pct": 0,
-                    "in_store_allowed": True,
-                    "mail_allowed": True,
-                    "return_bar_supported": False,
-                    "requires_rma": False,
-                    "notes": "30-day returns (demo fallback)"
-                }
-            }
+            key = ("unknown", policies.normalize(q.merchant) or q.merchant.lower())
+        keys.append(key)
+        unique.setdefault(key, entry)
+
+    sem = asyncio.Semaphore(POLICY_BATCH_CONCURRENCY)
+    async def resolve(key, entry):
+        kind, value = key
+        if kind == "text":
+            async with sem:
+                return "llm", await extract_claude.summarize_policy(value)
+        if kind == "seed":
+            return "seed", _seeded(entry)
+        return "fallback", dict(FALLBACK)
+
+    resolved = dict(zip(unique, await asyncio.gather(*(resolve(k, e) for k, e in unique.items()))))
+    results = []
+    for q, key in zip(body.merchants, keys):
+        source, data = resolved[key]
+        results.append({"merchant": q.merchant, "source": source, "policy": data})
+    return {"results": results, "unique": len(unique)}
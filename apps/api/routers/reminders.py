@@ -0,0 +1,34 @@
+import json, asyncio
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import StreamingResponse
+from ..services import reminders
+
+router = APIRouter()
+
+KEEPALIVE_S = 15.0
+
+@router.get("/reminders/upcoming")
+def upcoming_reminders(limit: int = Query(50, ge=1, le=500)):
+    return {"pending": len(reminders.scheduler), "sent": reminders.scheduler.sent,
+            "reminders": reminders.scheduler.upcoming(limit)}
+
+@router.get("/reminders/stream")
+async def reminder_stream(request: Request):
+    """SSE: one `reminder` event per due reminder (needs `sse` in REMINDER_SINKS)."""
+    q = reminders.subscribe()
+
+    async def events():
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(q.get(), timeout=KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: reminder\ndata: {json.dumps(event)}\n\n"
+        finally:
+            reminders.unsubscribe(q)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
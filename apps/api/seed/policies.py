@@ -1,21 +1,128 @@
-import json, os
+"""
+Seeded return policies, compiled into a lookup index.
 
-DATA = {}
-path = os.path.join(os.path.dirname(__file__), "policies.json")
-with open(path, "r") as f:
-    arr = json.load(f)
-    for x in arr:
-        DATA[x["merchant"].lower()] = x
+Extractors hand us names like "Amazon.com", "AMZN Mktp US" or "Best Buy #123",
+so lookups normalize the name, then try exact name/alias, the longest leading
+run of words, and finally trigram fuzzy matching. Resolved lookups are memoized
+per index, and the index is rebuilt when policies.json changes on disk.
+"""
+import json, os, re, time, threading
+from collections import Counter
+from functools import lru_cache
+from typing import Optional
+from ..services import telemetry
+
+path = os.getenv("POLICIES_PATH") or os.path.join(os.path.dirname(__file__), "policies.json")
+FUZZY_MIN_SCORE = float(os.getenv("POLICY_FUZZY_MIN_SCORE", "0.6"))
+RELOAD_CHECK_S = float(os.getenv("POLICY_RELOAD_CHECK_S", "2"))
+MEMO_SIZE = int(os.getenv("POLICY_MEMO_SIZE", "4096"))
+
+# Words that say nothing about which merchant it is
+NOISE = {"inc", "llc", "ltd", "co", "corp", "company", "the", "store", "stores", "shop", "online",
+         "mktp", "marketplace", "us", "usa", "com", "www", "pos", "purchase"}
+
+def normalize(name:str) -> str:
+    s = (name or "").lower().replace("&", " and ")
+    s = re.sub(r"\b(https?://)?(www\.)?([a-z0-9-]+)\.(com|net|org|co|us|shop)\b", r"\3", s)
+    s = re.sub(r"[#*]\s*\w*\d\w*", " ", s)  # store / terminal numbers
+    s = re.sub(r"[^a-z0-9 ]+", " ", s)
+    words = [w for w in s.split() if w not in NOISE and not any(ch.isdigit() for ch in w)]
+    return " ".join(words)
+
+def _trigrams(s:str) -> set[str]:
+    s = f"  {s} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+class PolicyIndex:
+    """Immutable once built; a reload swaps in a new instance (and with it a fresh memo)."""
+    def __init__(self, entries:list[dict]):
+        self.data: dict[str, dict] = {}    # merchant.lower() -> entry, as before
+        self.keys: dict[str, dict] = {}    # normalized name or alias -> entry
+        for x in entries:
+            self.data[x["merchant"].lower()] = x
+            for name in [x["merchant"], *x.get("aliases", [])]:
+                key = normalize(name)
+                if key:
+                    self.keys.setdefault(key, x)
+                    self.keys.setdefault(key.replace(" ", ""), x)
+        self._names = list(self.keys)
+        self._grams = [len(_trigrams(k)) for k in self._names]
+        self._postings: dict[str, list[int]] = {}
+        for i, key in enumerate(self._names):
+            for g in _trigrams(key):
+                self._postings.setdefault(g, []).append(i)
+        self.lookup = lru_cache(maxsize=MEMO_SIZE)(self._lookup)
+
+    def _lookup(self, merchant:str) -> Optional[dict]:
+        key = normalize(merchant)
+        if not key:
+            return None
+        hit = self.keys.get(key) or self.keys.get(key.replace(" ", ""))
+        if hit:
+            return hit
+        words = key.split()
+        for n in range(len(words) - 1, 0, -1):
+            hit = self.keys.get(" ".join(words[:n]))
+            if hit:
+                return hit
+        return self._fuzzy(key)
+
+    def _fuzzy(self, key:str) -> Optional[dict]:
+        grams = _trigrams(key)
+        shared = Counter(i for g in grams for i in self._postings.get(g, ()))
+        best, best_score = None, FUZZY_MIN_SCORE
+        for i, n in shared.items():
+            score = 2 * n / (len(grams) + self._grams[i])  # Dice coefficient
+            if score >= best_score:
+                best, best_score = i, score
+        return self.keys[self._names[best]] if best is not None else None
+
+def _load() -> PolicyIndex:
+    with open(path, "r") as f:
+        return PolicyIndex(json.load(f))
+
+_index = _load()
+_mtime = os.path.getmtime(path)
+_checked = time.monotonic()
+_lock = threading.Lock()
+# Kept for callers that read the raw mapping; updated in place on reload
+DATA = dict(_index.data)
+
+def index() -> PolicyIndex:
+    """The current index, rebuilt if policies.json changed (mtime polled at most every RELOAD_CHECK_S)."""
+    global _index, _mtime, _checked
+    if time.monotonic() - _checked < RELOAD_CHECK_S:
+        return _index
+    with _lock:
+        if time.monotonic() - _checked < RELOAD_CHECK_S:
+            return _index
+        _checked = time.monotonic()
+        try:
+            mtime = os.path.getmtime(path)
+            if mtime != _mtime:
+                _mtime = mtime  # a broken file is retried once it is written again, not on every poll
+                fresh = _load()
+                _index = fresh
+                DATA.clear()
+                DATA.update(fresh.data)
+                telemetry.log("policies.reloaded", merchants=len(fresh.data), path=path)
+        except Exception as e:
+            # Keep serving the last good index if the file is mid-write or invalid
+            telemetry.warn("policies.reload_failed", path=path, error=repr(e))
+    return _index
+
+def policy_for(merchant:str) -> Optional[dict]:
+    return index().lookup(merchant or "")
 
 def text_for(merchant:str)->str:
-    return DATA.get(merchant.lower(), {"text":"30-day returns (demo)."})["text"]
+    return (policy_for(merchant) or {"text":"30-day returns (demo)."})["text"]
 
 def window_for(merchant:str)->int:
-    return DATA.get(merchant.lower(), {"window_days":30}).get("window_days", 30)
+    return (policy_for(merchant) or {"window_days":30}).get("window_days", 30)
 
 def supports_return_bar(merchant:str)->bool:
-    return DATA.get(merchant.lower(), {}).get("return_bar_supported", False)
+    return (policy_for(merchant) or {}).get("return_bar_supported", False)
 
 def supports_label_broker(merchant:str)->bool:
     # Simplified demo heuristic: many merchants using USPS labels support Label Broker
-    return DATA.get(merchant.lower(), {}).get("mail_allowed", True)
+    return (policy_for(merchant) or {}).get("mail_allowed", True)
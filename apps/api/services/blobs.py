@@ -0,0 +1,188 @@
+"""
+Content-addressed store for raw receipts, so orders can be re-extracted later.
+
+Files live at BLOB_STORE_DIR/<sha[:2]>/<sha>.<codec>, named by the sha256 of the
+original bytes: uploading a receipt again only refreshes its mtime. Text and most
+PDFs go through zlib; JPEG/PNG (and anything else that doesn't shrink on a
+sample) are stored as-is. Writes go to a temp file in the same directory and are
+renamed into place, so a reader never sees a partial blob.
+
+Retention: `prune` drops blobs not uploaded again for BLOB_RETENTION_DAYS, unless
+an order made from them is still inside its return window.
+
+    python -m apps.api.services.blobs stats
+    python -m apps.api.services.blobs prune [--dry-run]
+"""
+import os, zlib, tempfile, datetime
+from typing import BinaryIO, Optional
+from . import telemetry, uploads
+from .uploads import Upload
+
+BLOB_STORE_ENABLED = os.getenv("BLOB_STORE_ENABLED", "1") == "1"
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "./blobs")
+BLOB_RETENTION_DAYS = float(os.getenv("BLOB_RETENTION_DAYS", "365"))  # 0 keeps everything
+BLOB_ZLIB_LEVEL = int(os.getenv("BLOB_ZLIB_LEVEL", "6"))
+# Compress only when a sample of the file shrinks by at least this share
+BLOB_MIN_SAVING = 0.1
+CODECS = ("z", "raw")
+CHUNK = uploads.CHUNK
+
+telemetry.counter("sendback_blob_writes_total", "Receipt blobs stored (new) or already present (dedup)")
+
+def _path(sha256:str, codec:str) -> str:
+    return os.path.join(BLOB_STORE_DIR, sha256[:2], f"{sha256}.{codec}")
+
+def locate(sha256:str) -> Optional[str]:
+    for codec in CODECS:
+        p = _path(sha256, codec)
+        if os.path.exists(p):
+            return p
+    return None
+
+def _worth_compressing(sample:bytes) -> bool:
+    return bool(sample) and len(zlib.compress(sample, 1)) <= len(sample) * (1 - BLOB_MIN_SAVING)
+
+def put(upload:Upload) -> dict:
+    """Store the upload's bytes (blocking). {"sha256", "size", "stored_size", "new"}"""
+    existing = locate(upload.sha256)
+    if existing:
+        os.utime(existing)
+        telemetry.count("sendback_blob_writes_total", outcome="dedup")
+        return {"sha256": upload.sha256, "size": upload.size, "stored_size": os.path.getsize(existing), "new": False}
+
+    f = upload.file
+    f.seek(0)
+    first = f.read(CHUNK)
+    codec = "z" if _worth_compressing(first) else "raw"
+    final = _path(upload.sha256, codec)
+    os.makedirs(os.path.dirname(final), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(final), prefix=".tmp-")
+    try:
+        with telemetry.span("blob_put"), os.fdopen(fd, "wb") as out:
+            z = zlib.compressobj(BLOB_ZLIB_LEVEL) if codec == "z" else None
+            chunk = first
+            while chunk:
+                out.write(z.compress(chunk) if z else chunk)
+                chunk = f.read(CHUNK)
+            if z:
+                out.write(z.flush())
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, final)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    finally:
+        f.seek(0)
+    telemetry.count("sendback_blob_writes_total", outcome="new")
+    return {"sha256": upload.sha256, "size": upload.size, "stored_size": os.path.getsize(final), "new": True}
+
+class _Inflate:
+    """Read-only file object that decompresses a .z blob as it is read."""
+    def __init__(self, f:BinaryIO):
+        self.f, self.z, self.buf = f, zlib.decompressobj(), b""
+
+    def read(self, n:int=-1) -> bytes:
+        while n < 0 or len(self.buf) < n:
+            chunk = self.f.read(CHUNK)
+            if not chunk:
+                self.buf += self.z.flush()
+                break
+            self.buf += self.z.decompress(chunk)
+        out, self.buf = (self.buf, b"") if n < 0 else (self.buf[:n], self.buf[n:])
+        return out
+
+def open_upload(sha256:str, filename:str="", content_type:Optional[str]=None) -> Upload:
+    """The stored receipt as an Upload (spooled, re-hashed). Raises FileNotFoundError or ValueError on a bad blob."""
+    path = locate(sha256)
+    if path is None:
+        raise FileNotFoundError(f"blob {sha256} not in {BLOB_STORE_DIR}")
+    with open(path, "rb") as f:
+        upload = uploads.from_stream(filename, _Inflate(f) if path.endswith(".z") else f, content_type)
+    if upload.sha256 != sha256:
+        upload.close()
+        raise ValueError(f"blob {sha256} is corrupt (content hashes to {upload.sha256})")
+    return upload
+
+def delete(sha256:str) -> int:
+    """Remove the blob file; returns the bytes freed (0 if it was already gone)."""
+    path = locate(sha256)
+    if path is None:
+        return 0
+    try:
+        size = os.path.getsize(path)
+        os.unlink(path)
+    except FileNotFoundError:
+        return 0
+    return size
+
+# --- bookkeeping in the main database ---
+
+def record(db, info:dict, filename:str, content_type:Optional[str], extraction_version:str):
+    """Upsert the receipt_blobs row for a stored upload (inside the caller's transaction)."""
+    from sqlalchemy.exc import IntegrityError
+    from ..models import ReceiptBlob
+    now = datetime.datetime.utcnow()
+    row = db.get(ReceiptBlob, info["sha256"])
+    if row is None:
+        try:
+            with db.begin_nested():
+                db.add(ReceiptBlob(sha256=info["sha256"], filename=filename, content_type=content_type,
+                                   size=info["size"], stored_size=info["stored_size"], created_at=now,
+                                   last_seen_at=now, extraction_version=extraction_version, extracted_at=now))
+                db.flush()
+            return
+        except IntegrityError:
+            row = db.get(ReceiptBlob, info["sha256"])  # the same receipt landed concurrently
+    row.last_seen_at = now
+
+def prune(db, now:Optional[datetime.datetime]=None, dry_run:bool=False) -> dict:
+    """Apply BLOB_RETENTION_DAYS. Receipts of orders that can still be returned are always kept."""
+    from sqlalchemy import exists, and_
+    from ..models import ReceiptBlob, Order
+    if BLOB_RETENTION_DAYS <= 0:
+        return {"deleted": 0, "bytes": 0}
+    now = now or datetime.datetime.utcnow()
+    cutoff = now - datetime.timedelta(days=BLOB_RETENTION_DAYS)
+    open_order = exists().where(and_(Order.receipt_sha256 == ReceiptBlob.sha256, Order.deadline_date >= now.date()))
+    shas = [r[0] for r in db.query(ReceiptBlob.sha256).filter(ReceiptBlob.last_seen_at < cutoff, ~open_order)]
+    freed = 0
+    if not dry_run:
+        for i in range(0, len(shas), 500):
+            part = shas[i:i + 500]
+            db.query(Order).filter(Order.receipt_sha256.in_(part)).update({Order.receipt_sha256: None}, synchronize_session=False)
+            db.query(ReceiptBlob).filter(ReceiptBlob.sha256.in_(part)).delete(synchronize_session=False)
+        # rows first: a failed commit leaves files nobody points at yet, never rows pointing at nothing
+        db.commit()
+        for sha in shas:
+            freed += delete(sha)
+    telemetry.log("blobs.pruned", deleted=len(shas), bytes=freed, dry_run=dry_run, retention_days=BLOB_RETENTION_DAYS)
+    return {"deleted": len(shas), "bytes": freed}
+
+def stats(db) -> dict:
+    from sqlalchemy import func
+    from ..models import ReceiptBlob
+    n, size, stored = db.query(func.count(ReceiptBlob.sha256), func.sum(ReceiptBlob.size), func.sum(ReceiptBlob.stored_size)).one()
+    return {"blobs": n, "bytes": size or 0, "stored_bytes": stored or 0,
+            "ratio": round((stored or 0) / size, 3) if size else None, "dir": BLOB_STORE_DIR}
+
+def main():
+    import argparse, json
+    from ..db import SessionLocal, engine
+    from .. import migrations
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("command", choices=["stats", "prune"])
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+    migrations.upgrade(engine)
+    db = SessionLocal()
+    try:
+        print(json.dumps(stats(db) if args.command == "stats" else prune(db, dry_run=args.dry_run)))
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import json, time, sqlite3, hashlib, asyncio, threading
+from collections import OrderedDict
+from typing import Any, Optional
+from . import telemetry
+
+def content_key(data: bytes, *parts: str, digest: Optional[str]=None) -> str:
+    """
+    sha256 of the payload, namespaced by whatever else changes the answer (model,
+    prompt version…). Pass a precomputed `digest` to avoid rehashing a large upload.
+    """
+    digest = digest or hashlib.sha256(data or b"").hexdigest()
+    return ":".join([digest, *parts])
+
+class LRUStore:
+    """In-memory LRU bounded by the serialized size of its values."""
+    def __init__(self, max_bytes:int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data: "OrderedDict[str, tuple[str, int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key:str) -> Optional[str]:
+        hit = self.get_item(key)
+        return hit[0] if hit else None
+
+    def get_item(self, key:str) -> Optional[tuple[str, float]]:
+        """(value, created_at)"""
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            self._data.move_to_end(key)
+            return hit[0], hit[2]
+
+    def put(self, key:str, value:str, created_at:Optional[float]=None):
+        n = len(value)
+        if n > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old:
+                self.size -= old[1]
+            self._data[key] = (value, n, created_at or time.time())
+            self.size += n
+            while self.size > self.max_bytes:
+                _, (_, sz, _) = self._data.popitem(last=False)
+                self.size -= sz
+
+    def delete(self, key:str):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old:
+                self.size -= old[1]
+
+    def __len__(self):
+        return len(self._data)
+
+class SQLiteStore:
+    """Persistent tier; evicts least-recently-accessed rows once the table exceeds max_bytes."""
+    def __init__(self, path:str, max_bytes:int, table:str="cache"):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_accessed ON {table}(accessed_at)")
+
+    def get(self, key:str) -> Optional[tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, created_at FROM {self.table} WHERE key=?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at=? WHERE key=?", (time.time(), key))
+            return row[0], row[1]
+
+    def put(self, key:str, value:str, created_at:Optional[float]=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table}(key, value, size, created_at, accessed_at) VALUES (?,?,?,?,?)",
+                (key, value, len(value), created_at or now, now),
+            )
+            self._evict()
+
+    def delete(self, key:str):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key=?", (key,))
+
+    def _evict(self):
+        total = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return
+        doomed = []
+        for key, size in self._conn.execute(f"SELECT key, size FROM {self.table} ORDER BY accessed_at"):
+            doomed.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._conn.executemany(f"DELETE FROM {self.table} WHERE key=?", doomed)
+
+class TieredCache:
+    """
+    JSON-valued cache: memory LRU in front of an optional SQLite tier.
+    Disk I/O runs in a worker thread so callers on the event loop never block on it.
+    """
+    def __init__(self, name:str, memory_bytes:int, disk_path:Optional[str]=None, disk_bytes:int=0, table:str="cache"):
+        self.name = name
+        self.memory = LRUStore(memory_bytes)
+        self.disk: Optional[SQLiteStore] = None
+        if disk_path:
+            try:
+                self.disk = SQLiteStore(disk_path, disk_bytes or memory_bytes * 8, table=table)
+            except Exception as e:
+                telemetry.warn("cache.disk_disabled", cache=name, error=repr(e))
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        CACHES.append(self)
+
+    async def get(self, key:str) -> Optional[Any]:
+        hit = await self.get_entry(key)
+        return hit[0] if hit else None
+
+    async def get_entry(self, key:str) -> Optional[tuple[Any, float]]:
+        """(value, created_at) — for callers that apply their own freshness rules."""
+        row = self.memory.get_item(key)
+        if row is not None:
+            self.hits_memory += 1
+            telemetry.count("sendback_cache_lookups_total", cache=self.name, result="memory")
+            return json.loads(row[0]), row[1]
+        if self.disk is not None:
+            try:
+                row = await asyncio.to_thread(self.disk.get, key)
+            except Exception:
+                row = None
+            if row is not None:
+                self.hits_disk += 1
+                telemetry.count("sendback_cache_lookups_total", cache=self.name, result="disk")
+                self.memory.put(key, row[0], created_at=row[1])
+                return json.loads(row[0]), row[1]
+        self.misses += 1
+        telemetry.count("sendback_cache_lookups_total", cache=self.name, result="miss")
+        return None
+
+    async def put(self, key:str, value:Any):
+        raw = json.dumps(value, separators=(",", ":"))
+        self.memory.put(key, raw)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.put, key, raw)
+            except Exception as e:
+                telemetry.warn("cache.disk_put_failed", cache=self.name, error=repr(e))
+
+    async def delete(self, key:str):
+        self.memory.delete(key)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.delete, key)
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_ratio": ((self.hits_memory + self.hits_disk) / lookups) if lookups else 0.0,
+            "memory_items": len(self.memory),
+            "memory_bytes": self.memory.size,
+        }
+
+CACHES: list[TieredCache] = []
+telemetry.counter("sendback_cache_lookups_total", "Cache lookups by tier that answered (memory, disk) or miss")
+telemetry.gauge_fn("sendback_cache_hit_ratio", "Hits / lookups per cache since start",
+                   lambda: {(("cache", c.name),): c.stats()["hit_ratio"] for c in CACHES})
+telemetry.gauge_fn("sendback_cache_memory_bytes", "Bytes held by each in-memory cache tier",
+                   lambda: {(("cache", c.name),): c.memory.size for c in CACHES})
+
+class SingleFlight:
+    """
+    Concurrent callers for the same key share one in-flight call. The call runs
+    as its own task, so a caller that gives up (timeout, disconnect) doesn't
+    cancel it for the others — or for the cache write at its end.
+    """
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    async def do(self, key:str, fn):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._inflight.pop(k, None) if self._inflight.get(k) is t else None)
+        return await asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._inflight)
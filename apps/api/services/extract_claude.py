@@ -1,65 +1,200 @@
-import os, json, datetime, re, base64, httpx
-from typing import Optional
-
-try:
-    from anthropic import Anthropic  # optional direct fallback
-except Exception:
-    Anthropic = None
+import os, io, json, time, datetime, re, mmap, base64, asyncio, contextvars
+from contextlib import contextmanager
+from typing import BinaryIO, Optional, Union
+from . import providers
+from . import receipt_parser, ocr_reka, image_prep, telemetry, prompts, uploads
+from .prompts import RECEIPT_SCHEMA, POLICY_SCHEMA
+from .cache import TieredCache, SingleFlight, content_key
 
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 LAVA_FORWARD_TOKEN = os.getenv("LAVA_FORWARD_TOKEN")
 ANTHROPIC_MODEL = "claude-3-5-sonnet-latest"
+# Bump whenever the extraction prompt changes so cached answers from the old prompt are ignored.
+PROMPT_VERSION = "2"
+# Recorded on stored receipts; the backfill re-extracts those made with anything else
+EXTRACTION_VERSION = f"{ANTHROPIC_MODEL}/{PROMPT_VERSION}"
+# Local parses scoring at least this much skip the LLM entirely.
+LOCAL_PARSE_MIN_CONFIDENCE = float(os.getenv("LOCAL_PARSE_MIN_CONFIDENCE", "0.8"))
+TIERS = "sendback_extraction_tier_total"
+telemetry.counter(TIERS, "Receipts answered by each extraction tier (cache, local, vision, lava_text, sdk_text, ocr_*, fallback)")
+# Start a duplicate vision request if no image extraction has won after this long (0 = off).
+HEDGE_DELAY_S = float(os.getenv("EXTRACT_HEDGE_DELAY_S", "0"))
+
+EXTRACTION_CACHE = TieredCache(
+    "extraction",
+    memory_bytes=int(os.getenv("EXTRACT_CACHE_MEMORY_BYTES", str(8 * 1024 * 1024))),
+    disk_path=os.getenv("EXTRACT_CACHE_PATH", "./extract_cache.db") or None,
+    disk_bytes=int(os.getenv("EXTRACT_CACHE_DISK_BYTES", str(256 * 1024 * 1024))),
+)
 
-RECEIPT_SCHEMA = {
-  "merchant":"string",
-  "order_id":"string|null",
-  "purchase_date":"YYYY-MM-DD|null",
-  "items":[{"name":"string","sku":"string|null","qty":1,"unit_price":0.0}]
-}
-
-POLICY_SCHEMA = {
-  "window_days": 0,
-  "restocking_fee_pct": 0,
-  "in_store_allowed": True,
-  "mail_allowed": True,
-  "return_bar_supported": False,
-  "requires_rma": False,
-  "notes": "string"
-}
+# Policy summaries: keyed by policy text + prompt version. Fresh for TTL; after that a
+# refresh is started and the stale answer served if the refresh takes longer than
+# POLICY_STALE_WAIT_S. Past MAX_STALE an entry is treated as a miss.
+POLICY_PROMPT_VERSION = "2"
+POLICY_CACHE_TTL_S = float(os.getenv("POLICY_CACHE_TTL_S", str(24 * 3600)))
+POLICY_CACHE_MAX_STALE_S = float(os.getenv("POLICY_CACHE_MAX_STALE_S", str(30 * 24 * 3600)))
+POLICY_STALE_WAIT_S = float(os.getenv("POLICY_STALE_WAIT_S", "1.0"))
+POLICY_CACHE = TieredCache(
+    "policy",
+    memory_bytes=int(os.getenv("POLICY_CACHE_MEMORY_BYTES", str(2 * 1024 * 1024))),
+    disk_path=os.getenv("POLICY_CACHE_PATH", os.getenv("EXTRACT_CACHE_PATH", "./extract_cache.db")) or None,
+    disk_bytes=int(os.getenv("POLICY_CACHE_DISK_BYTES", str(32 * 1024 * 1024))),
+    table="policy_summaries",
+)
+_policy_flights = SingleFlight()
 
 def _coerce_json(s: str) -> dict:
-    s = (s or "").strip()
-    m = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", s, flags=re.S)
-    if m:
-        s = m.group(1)
-    return json.loads(s)
+    with telemetry.span("json_coerce"):
+        s = (s or "").strip()
+        m = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", s, flags=re.S)
+        if m:
+            s = m.group(1)
+        return json.loads(s)
+
+def _local_parse(text: str) -> tuple[dict, float]:
+    with telemetry.span("local_parse"):
+        return receipt_parser.parse(text)
 
 def _fallback_parse(receipt_text:str) -> dict:
-    # very conservative fallback
-    return {"merchant": "Unknown", "order_id": None, "purchase_date": None, "items": []}
+    # best-effort local parse, whatever its confidence
+    fields, _ = _local_parse(receipt_text)
+    return fields
+
+# --- progress: stage / token / partial-field events for the streaming ingest endpoint ---
+
+_progress: contextvars.ContextVar = contextvars.ContextVar("extract_progress", default=None)
+
+@contextmanager
+def progress(callback):
+    """
+    Extractions started inside the block report callback(kind, data) events:
+    "stage", "llm_started", "token" and "partial". With a listener set, LLM
+    calls stream their output; otherwise nothing changes.
+    """
+    token = _progress.set(callback)
+    try:
+        yield
+    finally:
+        _progress.reset(token)
 
-def _lava_forward(payload: dict) -> dict:
+def _emit(kind: str, **data):
+    cb = _progress.get()
+    if cb is not None:
+        try:
+            cb(kind, data)
+        except Exception as e:
+            telemetry.warn("extract.progress_failed", error=repr(e))
+
+_PARTIAL_SCALARS = {k: re.compile(rf'"{k}"\s*:\s*(null|"(?:[^"\\]|\\.)*")') for k in ("merchant", "order_id", "purchase_date")}
+
+class PartialFields:
+    """Reads fields out of a JSON answer while it streams: scalars once their string closes, items as each object closes."""
+    def __init__(self):
+        self.buf = ""
+        self.found: set[str] = set()
+        self.items = 0
+
+    def feed(self, text: str) -> Optional[dict]:
+        self.buf += text
+        new = {}
+        for key, pat in _PARTIAL_SCALARS.items():
+            if key not in self.found:
+                m = pat.search(self.buf)
+                if m:
+                    self.found.add(key)
+                    new[key] = json.loads(m.group(1))
+        items = self._items()
+        if len(items) > self.items:
+            new["items"] = items[self.items:]
+            self.items = len(items)
+        return new or None
+
+    def _items(self) -> list[dict]:
+        start = self.buf.find('"items"')
+        start = self.buf.find("[", start) if start >= 0 else -1
+        if start < 0:
+            return []
+        out, depth, in_str, esc, obj_at = [], 0, False, False, None
+        for i in range(start + 1, len(self.buf)):
+            ch = self.buf[i]
+            if in_str:
+                esc = (ch == "\\") and not esc
+                in_str = not (ch == '"' and not esc)
+            elif ch == '"':
+                in_str, esc = True, False
+            elif ch == "{":
+                depth += 1
+                obj_at = i if depth == 1 else obj_at
+            elif ch == "}":
+                depth -= 1
+                if depth == 0 and obj_at is not None:
+                    try:
+                        out.append(json.loads(self.buf[obj_at:i + 1]))
+                    except ValueError:
+                        pass
+            elif ch == "]" and depth == 0:
+                break
+        return out
+
+def _on_delta(path: str, text: str, parts: list, partial: PartialFields):
+    parts.append(text)
+    _emit("token", path=path, text=text)
+    new = partial.feed(text)
+    if new:
+        _emit("partial", path=path, fields=new)
+
+def _lava_request(payload: dict) -> dict:
     if not LAVA_FORWARD_TOKEN:
         raise RuntimeError("LAVA_FORWARD_TOKEN not set")
-    url = "https://api.lavapayments.com/v1/forward"
     params = {"u": "https://api.anthropic.com/v1/messages"}
     headers = {
         "Authorization": f"Bearer {LAVA_FORWARD_TOKEN}",
         "Content-Type": "application/json",
         "anthropic-version": "2023-06-01",
     }
-    with httpx.Client(timeout=60.0) as client:
-        r = client.post(url, params=params, headers=headers, json=payload)
-        r.raise_for_status()
-        return r.json()
+    if prompts.PROMPT_CACHE:
+        headers["anthropic-beta"] = prompts.PROMPT_CACHE_BETA
+    return {"params": params, "headers": headers, "json": payload}
 
-def _anthropic_text_via_lava(prompt: str, max_tokens:int=800) -> str:
-    payload = {
-        "model": ANTHROPIC_MODEL,
-        "max_tokens": max_tokens,
-        "messages": [{"role":"user","content": prompt}]
-    }
-    resp = _lava_forward(payload)
+async def _lava_forward(payload: dict) -> dict:
+    return await providers.lava.post_json("/v1/forward", **_lava_request(payload))
+
+async def _lava_stream(payload: dict, path: str) -> tuple[str, dict]:
+    """The same forward call with stream=true; text deltas are reported as they arrive. (text, usage)"""
+    kwargs = _lava_request({**payload, "stream": True})
+    async def go():
+        _emit("llm_started", path=path)  # a retry starts over; listeners reset their buffer for `path`
+        parts, partial, usage = [], PartialFields(), {}
+        async with providers.lava.client.stream("POST", "/v1/forward", **kwargs) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                try:
+                    event = json.loads(line[5:])
+                except ValueError:
+                    continue
+                delta = event.get("delta") or {}
+                if event.get("type") == "content_block_delta" and delta.get("type") == "text_delta":
+                    _on_delta(path, delta.get("text", ""), parts, partial)
+                elif event.get("type") == "message_start":
+                    usage.update((event.get("message") or {}).get("usage") or {})
+                elif event.get("type") == "message_delta":
+                    usage.update(event.get("usage") or {})
+        return "".join(parts), usage
+    return await providers.lava.call(go)
+
+async def _lava_messages(payload: dict, path: str) -> str:
+    """One messages call through Lava (streamed when a progress listener is set); records token usage."""
+    if _progress.get() is not None:
+        text, usage = await _lava_stream(payload, path)
+    else:
+        resp = await _lava_forward(payload)
+        text, usage = _first_text(resp), resp.get("usage")
+    prompts.record_usage(path, usage)
+    return text
+
+def _first_text(resp: dict) -> str:
     content = resp.get("content") or []
     if content and isinstance(content, list):
         first = content[0]
@@ -67,7 +202,19 @@ def _anthropic_text_via_lava(prompt: str, max_tokens:int=800) -> str:
             return first.get("text","")
     return ""
 
-def _anthropic_vision_via_lava(prompt_text: str, image_bytes: bytes, media_type: str, max_tokens:int=800) -> str:
+async def _anthropic_text_via_lava(prompt: str, max_tokens:int=800, path:str="lava_text", system=None) -> str:
+    payload = {
+        "model": ANTHROPIC_MODEL,
+        "max_tokens": max_tokens,
+        "messages": [{"role":"user","content": prompt}]
+    }
+    if system:
+        payload["system"] = system
+    with telemetry.span("lava_text"):
+        return await _lava_messages(payload, path)
+
+async def _anthropic_vision_via_lava(prompt_text: str, image_bytes: bytes, media_type: str, max_tokens:int=800,
+                                     path:str="vision", system=None) -> str:
     b64 = base64.b64encode(image_bytes).decode()
     payload = {
         "model": ANTHROPIC_MODEL,
@@ -75,122 +222,323 @@ def _anthropic_vision_via_lava(prompt_text: str, image_bytes: bytes, media_type:
         "messages": [{
             "role":"user",
             "content":[
-                {"type":"text","text": prompt_text},
-                {"type":"image","source":{"type":"base64","media_type": media_type,"data": b64}}
+                {"type":"image","source":{"type":"base64","media_type": media_type,"data": b64}},
+                {"type":"text","text": prompt_text}
             ]
         }]
     }
-    resp = _lava_forward(payload)
-    content = resp.get("content") or []
-    if content and isinstance(content, list):
-        first = content[0]
-        if isinstance(first, dict) and first.get("type") == "text":
-            return first.get("text","")
-    return ""
+    if system:
+        payload["system"] = system
+    with telemetry.span("lava_vision"):
+        return await _lava_messages(payload, path)
+
+def _usage_dict(usage) -> dict:
+    return usage.model_dump() if hasattr(usage, "model_dump") else dict(usage or {})
+
+async def _anthropic_text_via_sdk(prompt: str, max_tokens:int=800, path:str="sdk_text", system=None) -> str:
+    client = providers.anthropic_sdk(ANTHROPIC_API_KEY)
+    # the prompt-caching resource sends the anthropic-beta header and reports cache token counts
+    messages = client.beta.prompt_caching.messages if prompts.PROMPT_CACHE else client.messages
+    kwargs = dict(model=ANTHROPIC_MODEL, max_tokens=max_tokens, messages=[{"role":"user","content": prompt}])
+    if system:
+        kwargs["system"] = system
+    if _progress.get() is not None:
+        async def go():
+            _emit("llm_started", path=path)
+            parts, partial = [], PartialFields()
+            async with messages.stream(**kwargs) as stream:
+                async for text in stream.text_stream:
+                    _on_delta(path, text, parts, partial)
+                final = await stream.get_final_message()
+            return "".join(parts), final.usage
+        with telemetry.span("anthropic_sdk"):
+            text, usage = await providers.anthropic_direct.call(go)
+        prompts.record_usage(path, _usage_dict(usage))
+        return text
+    with telemetry.span("anthropic_sdk"):
+        msg = await providers.anthropic_direct.call(lambda: messages.create(**kwargs))
+    prompts.record_usage(path, _usage_dict(msg.usage))
+    return msg.content[0].text
+
+@contextmanager
+def _pdf_stream(pdf: Union[bytes, BinaryIO]):
+    if isinstance(pdf, (bytes, bytearray)):
+        yield io.BytesIO(pdf)
+        return
+    pdf.seek(0, os.SEEK_END)
+    size = pdf.tell()
+    pdf.seek(0)
+    # Uploads up to the spool size are still in RAM and read as-is (fileno() would force
+    # them to disk); larger ones are on disk and get mapped, not copied.
+    if size > uploads.SPOOL_MEMORY_BYTES:
+        try:
+            mapped = mmap.mmap(pdf.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError, io.UnsupportedOperation):
+            mapped = None
+        if mapped is not None:
+            try:
+                yield mapped
+            finally:
+                mapped.close()
+            return
+    yield pdf
 
-def _extract_pdf_text(pdf_bytes: bytes) -> str:
+def _extract_pdf_text(pdf: Union[bytes, BinaryIO]) -> str:
     try:
-        import io
         from pypdf import PdfReader
-        reader = PdfReader(io.BytesIO(pdf_bytes))
-        out = []
-        for page in reader.pages[:10]:
-            out.append(page.extract_text() or "")
+        with _pdf_stream(pdf) as stream:
+            reader = PdfReader(stream)
+            out = []
+            for page in reader.pages[:10]:
+                out.append(page.extract_text() or "")
+            del reader  # drop references into the map before it closes
         return "\n".join(out).strip()
     except Exception:
         return ""
 
-def extract_order_fields(receipt_text: str, image_bytes: Optional[bytes]=None, media_type: Optional[str]=None) -> dict:
+async def extract_order_fields(receipt_text: str, image_bytes: Optional[bytes]=None, media_type: Optional[str]=None,
+                               source: Optional[BinaryIO]=None, digest: Optional[str]=None, refresh: bool=False) -> dict:
     """
-    Order of attempts:
-      1) If image bytes (image/*) present → send to Claude Vision via Lava.
-      2) If PDF bytes present → extract text locally, then send as text.
-      3) If text present → send as text.
-      4) Fallback.
+    Content-addressed: the same upload (bytes + model + prompt version) is only
+    sent to the LLM once; repeats are answered from EXTRACTION_CACHE.
+
+    Large uploads can be passed as a seekable `source` file with its sha256
+    `digest` instead of image_bytes, so they are never held in memory whole.
+    refresh=True skips the cache lookup (the new answer is still cached).
     """
-    sys_prompt = (
-        "You are a precise parser. Output MUST be valid JSON with NO extra text or fences.\n"
-        f"Return EXACTLY one JSON object with keys {json.dumps(RECEIPT_SCHEMA)}.\n"
-        "- Dates MUST be YYYY-MM-DD; use null if unknown.\n"
-        "- Items is an array; each item has name, optional sku, qty (int), unit_price (float).\n"
-        "- Do not invent fields; prefer null over guessing.\n"
-    )
-
-    # 1) Vision (images)
-    if image_bytes and media_type and media_type.startswith("image/") and LAVA_FORWARD_TOKEN:
+    if image_bytes is not None or source is None:
+        digest = None  # hash what we were actually given
+    key = content_key(image_bytes or (receipt_text or "").encode(), ANTHROPIC_MODEL, PROMPT_VERSION, digest=digest)
+    cached = None if refresh else await EXTRACTION_CACHE.get(key)
+    if cached is not None:
+        telemetry.count(TIERS, tier="cache")
+        telemetry.log("extract.cache_hit")
+        _emit("stage", stage="cache_hit")
+        return cached
+
+    fields, from_llm = await _extract_uncached(receipt_text, image_bytes if image_bytes is not None else source, media_type)
+    if from_llm:
+        # fallback answers are cheap to recompute and may improve once a provider is back
+        await EXTRACTION_CACHE.put(key, fields)
+    return fields
+
+def _valid_receipt(d) -> bool:
+    """Structural check against RECEIPT_SCHEMA; anything failing this loses the race."""
+    if not isinstance(d, dict) or not isinstance(d.get("merchant"), str) or not d["merchant"].strip():
+        return False
+    for k in ("order_id", "purchase_date"):
+        if d.get(k) is not None and not isinstance(d[k], str):
+            return False
+    if d.get("purchase_date"):
         try:
-            print("[extract_order_fields] using LAVA vision path")
-            text = _anthropic_vision_via_lava(sys_prompt + "\nExtract fields from this receipt image.", image_bytes, media_type, 800)
-            print("[extract_order_fields] vision text:", (text or "")[:200].replace("\n"," "))
-            return _coerce_json(text)
-        except Exception as e:
-            print("[extract_order_fields] vision path failed:", repr(e))
+            datetime.date.fromisoformat(d["purchase_date"])
+        except ValueError:
+            return False
+    items = d.get("items")
+    if items is None:
+        return True
+    if not isinstance(items, list):
+        return False
+    for it in items:
+        if not isinstance(it, dict) or not isinstance(it.get("name"), str):
+            return False
+        try:
+            int(it.get("qty") or 1); float(it.get("unit_price") or 0.0)
+        except (TypeError, ValueError):
+            return False
+    return True
 
-    # 2) PDF → text
-    if (not receipt_text) and image_bytes and media_type == "application/pdf":
-        extracted = _extract_pdf_text(image_bytes)
-        if extracted:
-            receipt_text = extracted
+# Attempts return (fields, tier) so the tier that answered can be counted.
+
+async def _vision(image_bytes: bytes, media_type: str, path: str="vision") -> tuple[dict, str]:
+    telemetry.log("extract.attempt", path="lava_vision")
+    text = await _anthropic_vision_via_lava("Extract fields from this receipt image.", image_bytes, media_type, 800,
+                                            path=path, system=prompts.RECEIPT_SYSTEM)
+    telemetry.log("extract.llm_text", path="lava_vision", preview=(text or "")[:200])
+    return _coerce_json(text), "vision"
 
-    prompt = (
-        sys_prompt +
-        "\nReceipt text:\n---\n" +
-        (receipt_text or "") +
-        "\n---"
-    )
+async def _text_llm(receipt_text: str, prefix: str="") -> Optional[tuple[dict, str]]:
+    # compacted once here; both providers get the same turn behind the same cached system prefix
+    prompt = prompts.receipt_text_turn(receipt_text)
 
-    # 3) Text via Lava
-    if LAVA_FORWARD_TOKEN and (receipt_text or media_type == "application/pdf"):
+    # Text via Lava
+    if LAVA_FORWARD_TOKEN:
         try:
-            print("[extract_order_fields] using LAVA forward (text)")
-            text = _anthropic_text_via_lava(prompt, max_tokens=800)
-            print("[extract_order_fields] lava text:", (text or "")[:200].replace("\n"," "))
-            return _coerce_json(text)
+            telemetry.log("extract.attempt", path=prefix + "lava_text")
+            text = await _anthropic_text_via_lava(prompt, max_tokens=800, path=prefix + "lava_text", system=prompts.RECEIPT_SYSTEM)
+            telemetry.log("extract.llm_text", path=prefix + "lava_text", preview=(text or "")[:200])
+            return _coerce_json(text), prefix + "lava_text"
         except Exception as e:
-            print("[extract_order_fields] lava text path failed:", repr(e))
+            telemetry.warn("extract.failed", path="lava_text", error=repr(e))
 
-    # 4) Direct Anthropic SDK fallback (text)
-    if ANTHROPIC_API_KEY and Anthropic and (receipt_text or media_type == "application/pdf"):
+    # Direct Anthropic SDK fallback (text)
+    if ANTHROPIC_API_KEY and providers.AsyncAnthropic:
         try:
-            print("[extract_order_fields] using direct Anthropic SDK (text)")
-            client = Anthropic(api_key=ANTHROPIC_API_KEY)
-            msg = client.messages.create(
-                model=ANTHROPIC_MODEL, max_tokens=800,
-                messages=[{"role":"user","content": prompt}]
-            )
-            return _coerce_json(msg.content[0].text)
+            telemetry.log("extract.attempt", path=prefix + "sdk_text")
+            text = await _anthropic_text_via_sdk(prompt, max_tokens=800, path=prefix + "sdk_text", system=prompts.RECEIPT_SYSTEM)
+            return _coerce_json(text), prefix + "sdk_text"
         except Exception as e:
-            print("[extract_order_fields] anthropic sdk failed:", repr(e))
+            telemetry.warn("extract.failed", path="sdk_text", error=repr(e))
+    return None
+
+async def _ocr_then_text(image_bytes: bytes, media_type: str) -> Optional[tuple[dict, str]]:
+    with telemetry.span("reka_ocr"):
+        text = await ocr_reka.ocr_image_to_text(image_bytes, media_type)
+    if not text:
+        return None
+    _emit("stage", stage="ocr_done", chars=len(text))
+    local, confidence = _local_parse(text)
+    if confidence >= LOCAL_PARSE_MIN_CONFIDENCE:
+        telemetry.log("extract.local_parse", source="ocr", confidence=confidence)
+        return local, "ocr_local"
+    return await _text_llm(text, prefix="ocr_")
 
-    print("[extract_order_fields] falling back parser")
-    return _fallback_parse(receipt_text or "")
+async def _first_valid(attempts: list, hedge=None, hedge_delay: float=0.0) -> Optional[tuple[dict, str]]:
+    """
+    Run every (name, factory) in `attempts` at once and return the first
+    (fields, tier) whose fields pass _valid_receipt; the losers are cancelled (a cancelled
+    half-open probe gives its slot back, see Provider.call). If nothing has won
+    after hedge_delay seconds, `hedge` is started as one extra duplicate attempt.
+    """
+    loop = asyncio.get_running_loop()
+    tasks = {asyncio.create_task(factory()): name for name, factory in attempts}
+    hedge_at = loop.time() + hedge_delay if hedge and hedge_delay > 0 else None
+    try:
+        while tasks:
+            timeout = max(0.0, hedge_at - loop.time()) if hedge_at is not None else None
+            done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                telemetry.log("extract.hedge", attempt=hedge[0])
+                tasks[asyncio.create_task(hedge[1]())] = hedge[0]
+                hedge_at = None
+                continue
+            for t in done:
+                name = tasks.pop(t)
+                if t.exception() is not None:
+                    telemetry.warn("extract.failed", attempt=name, error=repr(t.exception()))
+                elif t.result() is not None and _valid_receipt(t.result()[0]):
+                    telemetry.log("extract.won", attempt=name, tier=t.result()[1])
+                    return t.result()
+                elif t.result() is not None:
+                    telemetry.warn("extract.invalid_receipt", attempt=name)
+        return None
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _extract_uncached(receipt_text: str, blob: Union[bytes, BinaryIO, None], media_type: Optional[str]) -> tuple[dict, bool]:
+    """
+    Order of attempts:
+      0) If PDF bytes present → extract text locally; if the text parses with
+         enough confidence → done, no LLM call.
+      1) Images: Claude Vision via Lava and Reka OCR → text LLM race; the first
+         schema-valid answer wins (optionally hedged with a second vision call).
+      2) Text: Lava forward, then the direct Anthropic SDK.
+      3) Fallback.
+    """
+    # 0) PDF → text, then the local parser
+    if (not receipt_text) and blob is not None and media_type == "application/pdf":
+        # pypdf is CPU-bound; keep it off the event loop
+        with telemetry.span("pdf_parse"):
+            extracted = await asyncio.to_thread(_extract_pdf_text, blob)
+        _emit("stage", stage="pdf_text", chars=len(extracted))
+        if extracted:
+            receipt_text = extracted
+
+    if receipt_text:
+        local, confidence = _local_parse(receipt_text)
+        if confidence >= LOCAL_PARSE_MIN_CONFIDENCE:
+            telemetry.count(TIERS, tier="local")
+            telemetry.log("extract.local_parse", source="text", confidence=confidence)
+            _emit("stage", stage="local_parse", confidence=confidence)
+            return local, False
+
+    # 1) Images: fan out
+    if blob is not None and media_type and media_type.startswith("image/"):
+        # orient/crop/gray/downscale off the event loop; the cache key above still uses the original bytes
+        with telemetry.span("image_prep"):
+            image_bytes, media_type, prep = await asyncio.to_thread(image_prep.preprocess, blob, media_type)
+        telemetry.log("extract.image_prep", bytes_in=prep["bytes_in"], bytes_out=prep["bytes_out"], steps=prep["steps"])
+        _emit("stage", stage="image_prep", bytes_in=prep["bytes_in"], bytes_out=prep["bytes_out"])
+        attempts = []
+        if LAVA_FORWARD_TOKEN:
+            attempts.append(("vision", lambda: _vision(image_bytes, media_type)))
+        if ocr_reka.REKA_API_KEY and not receipt_text:
+            attempts.append(("ocr+text", lambda: _ocr_then_text(image_bytes, media_type)))
+        if receipt_text:
+            attempts.append(("text", lambda: _text_llm(receipt_text)))
+        hedge = ("vision-hedge", lambda: _vision(image_bytes, media_type, "vision-hedge")) if LAVA_FORWARD_TOKEN else None
+        if attempts:
+            _emit("stage", stage="extraction_started", attempts=[name for name, _ in attempts])
+        answer = await _first_valid(attempts, hedge, HEDGE_DELAY_S) if attempts else None
+        if answer is not None:
+            telemetry.count(TIERS, tier=answer[1])
+            return answer[0], True
+
+    # 2) Text
+    elif receipt_text:
+        if LAVA_FORWARD_TOKEN or ANTHROPIC_API_KEY:
+            _emit("stage", stage="extraction_started", attempts=["text"])
+        answer = await _text_llm(receipt_text)
+        if answer is not None:
+            telemetry.count(TIERS, tier=answer[1])
+            return answer[0], True
+
+    telemetry.count(TIERS, tier="fallback")
+    telemetry.warn("extract.fallback_parser")
+    _emit("stage", stage="fallback")
+    return _fallback_parse(receipt_text or ""), False
+
+async def summarize_policy(policy_text: str) -> dict:
+    """
+    Cached and coalesced: one LLM call per distinct policy text (per prompt
+    version), shared by every concurrent request for it.
+    """
+    key = content_key((policy_text or "").encode(), ANTHROPIC_MODEL, "policy", POLICY_PROMPT_VERSION)
+    hit = await POLICY_CACHE.get_entry(key)
+    age = time.time() - hit[1] if hit else None
+    if hit and age < POLICY_CACHE_TTL_S:
+        return hit[0]
+    if hit and age > POLICY_CACHE_MAX_STALE_S:
+        await POLICY_CACHE.delete(key)
+        hit = None
+
+    async def refresh():
+        data, from_llm = await _summarize_uncached(policy_text)
+        if from_llm:
+            await POLICY_CACHE.put(key, data)
+        return data, from_llm
+
+    if hit is None:
+        data, _ = await _policy_flights.do(key, refresh)
+        return data
+    # Stale: revalidate, but don't make the caller wait on a slow upstream
+    try:
+        data, from_llm = await asyncio.wait_for(_policy_flights.do(key, refresh), POLICY_STALE_WAIT_S)
+    except asyncio.TimeoutError:
+        telemetry.log("policy.serve_stale")
+        return hit[0]
+    return data if from_llm else hit[0]
 
-def summarize_policy(policy_text: str) -> dict:
-    prompt = (
-        "You are a precise parser. Output MUST be valid JSON with NO extra text or fences.\n"
-        f"Return EXACTLY one JSON object with keys {json.dumps(POLICY_SCHEMA)}.\n"
-        "Be conservative; if unstated, set false/0 and add a helpful note.\n\n"
-        "Policy snippet:\n---\n" + (policy_text or "") + "\n---"
-    )
+async def _summarize_uncached(policy_text: str) -> tuple[dict, bool]:
+    """(summary, from_llm)"""
+    prompt = prompts.policy_text_turn(policy_text)
 
     if LAVA_FORWARD_TOKEN:
         try:
-            print("[summarize_policy] using LAVA forward")
-            text = _anthropic_text_via_lava(prompt, max_tokens=600)
-            return _coerce_json(text)
+            telemetry.log("policy.attempt", path="lava_text")
+            text = await _anthropic_text_via_lava(prompt, max_tokens=600, path="policy_lava_text", system=prompts.POLICY_SYSTEM)
+            return _coerce_json(text), True
         except Exception as e:
-            print("[summarize_policy] lava policy failed:", repr(e))
+            telemetry.warn("policy.failed", path="lava_text", error=repr(e))
 
-    if ANTHROPIC_API_KEY and Anthropic:
+    if ANTHROPIC_API_KEY and providers.AsyncAnthropic:
         try:
-            print("[summarize_policy] using direct Anthropic SDK")
-            client = Anthropic(api_key=ANTHROPIC_API_KEY)
-            msg = client.messages.create(
-                model=ANTHROPIC_MODEL, max_tokens=600,
-                messages=[{"role":"user","content": prompt}]
-            )
-            return _coerce_json(msg.content[0].text)
+            telemetry.log("policy.attempt", path="sdk_text")
+            text = await _anthropic_text_via_sdk(prompt, max_tokens=600, path="policy_sdk_text", system=prompts.POLICY_SYSTEM)
+            return _coerce_json(text), True
         except Exception as e:
-            print("[summarize_policy] anthropic sdk failed:", repr(e))
+            telemetry.warn("policy.failed", path="sdk_text", error=repr(e))
 
-    return {**POLICY_SCHEMA, "window_days":30, "notes":"Demo policy (fallback)"}
+    return {**POLICY_SCHEMA, "window_days":30, "notes":"Demo policy (fallback)"}, False
@@ -0,0 +1,110 @@
+"""
+Shrinks receipt photos before they are base64'd into a vision / OCR request.
+
+auto-orient (EXIF) → crop to the bright paper → grayscale → downscale to
+VISION_MAX_EDGE → JPEG recompress. Anything that fails leaves the original
+bytes untouched, so this stage can only make payloads smaller.
+
+Measure it on a folder of photos with:
+    python -m apps.api.services.image_prep path/to/images
+"""
+import io, os, sys, json, time
+from typing import BinaryIO, Optional, Union
+
+try:
+    from PIL import Image, ImageOps
+except Exception:
+    Image = None
+
+# Anthropic downsizes anything with a long edge above ~1568px anyway
+VISION_MAX_EDGE = int(os.getenv("VISION_MAX_EDGE", "1568"))
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "80"))
+PREP_GRAYSCALE = os.getenv("PREP_GRAYSCALE", "1") == "1"
+PREP_CROP = os.getenv("PREP_CROP", "1") == "1"
+
+def _document_box(img) -> Optional[tuple[int, int, int, int]]:
+    """Bounding box of the bright region (the receipt) on a darker background, or None."""
+    probe = ImageOps.autocontrast(img.convert("L").resize((256, max(1, 256 * img.height // img.width))))
+    hist = probe.histogram()
+    mean = sum(i * n for i, n in enumerate(hist)) / max(1, sum(hist))
+    mask = probe.point(lambda v: 255 if v > max(mean, 128) else 0)
+    box = mask.getbbox()
+    if not box:
+        return None
+    sx, sy = img.width / probe.width, img.height / probe.height
+    pad = 0.02
+    x0, y0, x1, y1 = box
+    x0, x1 = max(0, (x0 - pad * probe.width) * sx), min(img.width, (x1 + pad * probe.width) * sx)
+    y0, y1 = max(0, (y0 - pad * probe.height) * sy), min(img.height, (y1 + pad * probe.height) * sy)
+    frac = ((x1 - x0) * (y1 - y0)) / (img.width * img.height)
+    # Too small means we found a glare spot; too large means there is nothing to crop.
+    if frac < 0.2 or frac > 0.95:
+        return None
+    return int(x0), int(y0), int(x1), int(y1)
+
+def _raw(image: Union[bytes, BinaryIO]) -> bytes:
+    if isinstance(image, (bytes, bytearray)):
+        return image
+    image.seek(0)
+    return image.read()
+
+def preprocess(image: Union[bytes, BinaryIO], media_type: str) -> tuple[bytes, str, dict]:
+    """
+    Returns (bytes, media_type, stats) ready for the vision call. `image` may be
+    bytes or a seekable file; a file is decoded in place and only read whole if
+    it has to be sent as-is.
+    """
+    if isinstance(image, (bytes, bytearray)):
+        size_in, src = len(image), io.BytesIO(image)
+    else:
+        size_in = image.seek(0, io.SEEK_END)
+        image.seek(0)
+        src = image
+    stats = {"bytes_in": size_in, "bytes_out": size_in, "size_in": None, "size_out": None, "steps": []}
+    if Image is None or not size_in:
+        return _raw(image), media_type, stats
+    t0 = time.perf_counter()
+    try:
+        img = Image.open(src)
+        stats["size_in"] = img.size
+        if img.getexif().get(0x0112, 1) != 1:  # EXIF Orientation
+            img = ImageOps.exif_transpose(img)
+            stats["steps"].append("orient")
+        if PREP_CROP:
+            box = _document_box(img)
+            if box:
+                img = img.crop(box)
+                stats["steps"].append("crop")
+        if PREP_GRAYSCALE:
+            img = img.convert("L")
+            stats["steps"].append("gray")
+        elif img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        if max(img.size) > VISION_MAX_EDGE:
+            img.thumbnail((VISION_MAX_EDGE, VISION_MAX_EDGE), Image.LANCZOS)
+            stats["steps"].append("resize")
+        out = io.BytesIO()
+        img.save(out, "JPEG", quality=VISION_JPEG_QUALITY, optimize=True)
+        data = out.getvalue()
+    except Exception as e:
+        stats["error"] = repr(e)
+        return _raw(image), media_type, stats
+    stats["ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    if len(data) >= size_in:
+        # already small (e.g. a screenshot); recompressing would only cost quality
+        return _raw(image), media_type, stats
+    stats.update(bytes_out=len(data), size_out=img.size)
+    return data, "image/jpeg", stats
+
+if __name__ == "__main__":
+    root = sys.argv[1] if len(sys.argv) > 1 else "."
+    rows, tin, tout = [], 0, 0
+    for name in sorted(os.listdir(root)):
+        if not name.lower().endswith((".png", ".jpg", ".jpeg", ".webp")):
+            continue
+        with open(os.path.join(root, name), "rb") as f:
+            _, _, st = preprocess(f, "image/jpeg")
+        rows.append({"file": name, **st})
+        tin += st["bytes_in"]; tout += st["bytes_out"]
+    print(json.dumps({"files": rows, "bytes_in": tin, "bytes_out": tout,
+                      "ratio": round(tout / tin, 3) if tin else None}, indent=2, default=list))
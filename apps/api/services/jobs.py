@@ -0,0 +1,208 @@
+"""
+Durable local job queue for receipt processing.
+
+Jobs live in a SQLite file (no outside broker). Workers claim a job by taking
+a time-limited lease, so a worker that dies mid-job only delays it: once the
+lease expires any other worker (in this process or another) picks it up again.
+Every claim counts as an attempt, so a job that keeps killing or hanging its
+worker is marked failed once its lease expires on attempt JOBS_MAX_ATTEMPTS.
+complete()/fail() only apply while the caller still holds the lease.
+A failed attempt is retried after an exponential backoff (JOBS_RETRY_BASE_S * 2^attempts,
+capped at JOBS_RETRY_MAX_S), so an upstream outage doesn't burn every attempt at once.
+
+Run extra workers next to the API with:
+    python -m apps.api.services.jobs
+"""
+import os, json, time, uuid, sqlite3, asyncio, threading
+from typing import Awaitable, Callable, Optional
+from . import telemetry
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "./sendback_jobs.db")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+POLL_INTERVAL_S = float(os.getenv("JOBS_POLL_INTERVAL_S", "0.5"))
+LEASE_S = float(os.getenv("JOBS_LEASE_S", "300"))
+MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+RETRY_BASE_S = float(os.getenv("JOBS_RETRY_BASE_S", "5"))
+RETRY_MAX_S = float(os.getenv("JOBS_RETRY_MAX_S", "300"))
+
+Handler = Callable[[bytes, dict], Awaitable[dict]]
+
+class JobQueue:
+    def __init__(self, path:str=JOBS_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, "
+            "payload BLOB, meta TEXT, result TEXT, error TEXT, "
+            "attempts INTEGER NOT NULL DEFAULT 0, lease_until REAL, available_at REAL, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        cols = {r[1] for r in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "available_at" not in cols:  # queue files from before retry backoff
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN available_at REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status_created ON jobs(status, created_at)")
+
+    def enqueue(self, kind:str, payload:bytes, meta:Optional[dict]=None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs(id, kind, status, payload, meta, created_at, updated_at) VALUES (?,?,?,?,?,?,?)",
+                (job_id, kind, "queued", payload, json.dumps(meta or {}), now, now),
+            )
+        return job_id
+
+    def claim(self, kinds:list[str]) -> Optional[dict]:
+        """Lease the oldest runnable job: queued and past its retry backoff, or running with an expired lease."""
+        now = time.time()
+        marks = ",".join("?" * len(kinds))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # the worker died or hung on its last attempt: give up rather than lease it again
+                self._conn.execute(
+                    "UPDATE jobs SET status='failed', error='lease expired on attempt ' || attempts, "
+                    "lease_until=NULL, available_at=NULL, updated_at=? "
+                    "WHERE status='running' AND lease_until < ? AND attempts >= ?",
+                    (now, now, MAX_ATTEMPTS),
+                )
+                row = self._conn.execute(
+                    f"SELECT id, kind, payload, meta, attempts FROM jobs WHERE kind IN ({marks}) AND "
+                    "((status='queued' AND (available_at IS NULL OR available_at <= ?)) "
+                    "OR (status='running' AND lease_until < ?)) "
+                    "ORDER BY created_at LIMIT 1",
+                    (*kinds, now, now),
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status='running', attempts=attempts+1, lease_until=?, updated_at=? WHERE id=?",
+                    (now + LEASE_S, now, row[0]),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {"id": row[0], "kind": row[1], "payload": row[2], "meta": json.loads(row[3] or "{}"), "attempts": row[4] + 1}
+
+    # A lease is (id, attempts): each claim bumps attempts, so a worker whose lease expired and was
+    # re-claimed no longer matches and its late complete()/fail() changes nothing. Both return
+    # whether the caller still held the lease.
+
+    def complete(self, job_id:str, result:dict, attempts:int) -> bool:
+        with self._lock:
+            # the payload is no longer needed once the order exists
+            cur = self._conn.execute(
+                "UPDATE jobs SET status='done', result=?, payload=NULL, error=NULL, lease_until=NULL, updated_at=? "
+                "WHERE id=? AND status='running' AND attempts=?",
+                (json.dumps(result), time.time(), job_id, attempts),
+            )
+        return cur.rowcount > 0
+
+    def fail(self, job_id:str, error:str, attempts:int) -> bool:
+        status = "queued" if attempts < MAX_ATTEMPTS else "failed"
+        now = time.time()
+        retry_at = now + min(RETRY_MAX_S, RETRY_BASE_S * 2 ** attempts) if status == "queued" else None
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status=?, error=?, lease_until=NULL, available_at=?, updated_at=? "
+                "WHERE id=? AND status='running' AND attempts=?",
+                (status, error, retry_at, now, job_id, attempts),
+            )
+        return cur.rowcount > 0
+
+    def get(self, job_id:str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, result, error, attempts, created_at, updated_at, available_at FROM jobs WHERE id=?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0], "kind": row[1], "status": row[2],
+            "result": json.loads(row[3]) if row[3] else None,
+            "error": row[4], "attempts": row[5],
+            "created_at": row[6], "updated_at": row[7],
+            "retry_at": row[8] if row[2] == "queued" else None,
+        }
+
+_queue: Optional[JobQueue] = None
+
+def queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        _queue = JobQueue()
+    return _queue
+
+async def enqueue(kind:str, payload:bytes, meta:Optional[dict]=None) -> str:
+    return await asyncio.to_thread(queue().enqueue, kind, payload, meta)
+
+async def get(job_id:str) -> Optional[dict]:
+    return await asyncio.to_thread(queue().get, job_id)
+
+async def _worker(name:str, handlers:dict[str, Handler], stop:asyncio.Event):
+    q = queue()
+    kinds = list(handlers)
+    while not stop.is_set():
+        try:
+            job = await asyncio.to_thread(q.claim, kinds)
+        except Exception as e:
+            telemetry.warn("jobs.claim_failed", worker=name, error=repr(e))
+            job = None
+        if job is None:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=POLL_INTERVAL_S)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        try:
+            result = await handlers[job["kind"]](job["payload"] or b"", job["meta"])
+        except Exception as e:
+            telemetry.warn("jobs.failed", worker=name, job_id=job["id"], attempt=job["attempts"], error=repr(e))
+            held = await asyncio.to_thread(q.fail, job["id"], repr(e), job["attempts"])
+        else:
+            held = await asyncio.to_thread(q.complete, job["id"], result, job["attempts"])
+        if not held:
+            telemetry.warn("jobs.lease_lost", worker=name, job_id=job["id"], attempt=job["attempts"])
+
+_stop: Optional[asyncio.Event] = None
+_tasks: list[asyncio.Task] = []
+
+def start_workers(handlers:dict[str, Handler], n:int=INGEST_WORKERS):
+    global _stop
+    if n <= 0:
+        return
+    _stop = asyncio.Event()
+    for i in range(n):
+        _tasks.append(asyncio.create_task(_worker(f"w{i}", handlers, _stop)))
+
+async def stop_workers():
+    if _stop is not None:
+        _stop.set()
+    # in-flight jobs keep their lease and are retried after it expires
+    for t in _tasks:
+        t.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+
+async def _main():
+    from ..routers import ingest
+    from . import providers
+    start_workers({"receipt": ingest.process_receipt_job}, max(INGEST_WORKERS, 1))
+    telemetry.log("jobs.started", workers=len(_tasks), db=JOBS_DB_PATH)
+    try:
+        await asyncio.gather(*_tasks)
+    finally:
+        await providers.aclose_all()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        pass
@@ -1,20 +1,23 @@
 import os, base64
-try:
-    import reka
-except Exception:
-    reka = None
+from . import providers
 
 REKA_API_KEY = os.getenv("REKA_API_KEY")
+REKA_MODEL = "reka-flash"
 
-def ocr_image_to_text(image_bytes: bytes) -> str:
-    if not reka or not REKA_API_KEY:
+async def ocr_image_to_text(image_bytes: bytes, media_type: str = "image/jpeg") -> str:
+    if not REKA_API_KEY:
         # Fallback: pretend it's already text
         return ""
-    reka.API_KEY = REKA_API_KEY
     b64 = base64.b64encode(image_bytes).decode()
-    # Simplified call; adjust according to your account's SDK version
-    resp = reka.chat(messages=[{"role":"user","content":[
-        {"type":"input_text","text":"Extract line-broken text from this receipt image."},
-        {"type":"input_image","image_data": b64}
-    ]}], model="reka-flash")
-    return resp.get("text", "")
\ No newline at end of file
+    # Reka chat API over the shared pooled client (retries + circuit breaker live in providers)
+    resp = await providers.reka_api.post_json("/v1/chat", headers={"X-Api-Key": REKA_API_KEY}, json={
+        "model": REKA_MODEL,
+        "messages": [{"role": "user", "content": [
+            {"type": "image_url", "image_url": f"data:{media_type};base64,{b64}"},
+            {"type": "text", "text": "Extract line-broken text from this receipt image."},
+        ]}],
+    })
+    responses = resp.get("responses") or []
+    if responses and isinstance(responses[0], dict):
+        return (responses[0].get("message") or {}).get("content") or ""
+    return resp.get("text", "")
@@ -0,0 +1,137 @@
+"""
+Prompt construction for the extraction and policy LLM calls.
+
+The instructions and schema are a constant system block. It is marked
+cache_control=ephemeral so the provider can reuse it across calls; Anthropic
+only caches prefixes above a minimum length, and shorter ones are simply billed
+as normal input. Receipt text is compacted before it goes in the user turn:
+whitespace is collapsed, repeated headers/footers and boilerplate are dropped,
+and long receipts keep only lines that carry a price, date, order id or merchant
+cue (plus the line just before each, which is usually the item name or label).
+Token usage is recorded for every call.
+"""
+import os, re, json
+from typing import Optional, Union
+from . import telemetry
+from .receipt_parser import PRICE, DATE_PATTERNS, ORDER_ID, DATE_LABEL, MERCHANT_LABEL, MERCHANT_PHRASE, SKU
+
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "1") == "1"
+PROMPT_CACHE_BETA = "prompt-caching-2024-07-31"
+# Receipts shorter than this are only deduped and de-boilerplated, never filtered by relevance
+PROMPT_COMPACT_MIN_CHARS = int(os.getenv("PROMPT_COMPACT_MIN_CHARS", "1200"))
+PROMPT_MAX_CHARS = int(os.getenv("PROMPT_MAX_CHARS", "8000"))
+# Leading lines kept regardless of content: that's where the merchant name usually is
+HEAD_LINES = 6
+
+TOKENS = "sendback_llm_tokens_total"
+telemetry.counter(TOKENS, "LLM tokens by call path and kind (input, output, cache_read, cache_write)")
+PROMPT_CHARS = "sendback_prompt_chars_total"
+telemetry.counter(PROMPT_CHARS, "Receipt text characters before (raw) and after (sent) compaction")
+
+RECEIPT_SCHEMA = {
+  "merchant":"string",
+  "order_id":"string|null",
+  "purchase_date":"YYYY-MM-DD|null",
+  "items":[{"name":"string","sku":"string|null","qty":1,"unit_price":0.0}]
+}
+
+POLICY_SCHEMA = {
+  "window_days": 0,
+  "restocking_fee_pct": 0,
+  "in_store_allowed": True,
+  "mail_allowed": True,
+  "return_bar_supported": False,
+  "requires_rma": False,
+  "notes": "string"
+}
+
+RECEIPT_INSTRUCTIONS = (
+    "You are a precise parser. Output MUST be valid JSON with NO extra text or fences.\n"
+    f"Return EXACTLY one JSON object with keys {json.dumps(RECEIPT_SCHEMA)}.\n"
+    "- Dates MUST be YYYY-MM-DD; use null if unknown.\n"
+    "- Items is an array; each item has name, optional sku, qty (int), unit_price (float).\n"
+    "- Do not invent fields; prefer null over guessing.\n"
+    "- The receipt text may be abridged to the lines that matter; do not infer anything from omissions.\n"
+)
+
+POLICY_INSTRUCTIONS = (
+    "You are a precise parser. Output MUST be valid JSON with NO extra text or fences.\n"
+    f"Return EXACTLY one JSON object with keys {json.dumps(POLICY_SCHEMA)}.\n"
+    "Be conservative; if unstated, set false/0 and add a helpful note.\n"
+)
+
+def system(text:str) -> Union[str, list]:
+    """The system parameter for a messages call: one cacheable block, or plain text with caching off."""
+    if not PROMPT_CACHE:
+        return text
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+
+# Built once; every call sends the identical prefix, which is what makes it cacheable
+RECEIPT_SYSTEM = system(RECEIPT_INSTRUCTIONS)
+POLICY_SYSTEM = system(POLICY_INSTRUCTIONS)
+
+BOILERPLATE = re.compile(
+    r"terms (?:and|&) conditions|terms of (?:use|sale|service)|privacy (?:policy|notice|statement)|"
+    r"all rights reserved|copyright|©|unsubscribe|do not reply|this (?:e-?mail|message) was sent|"
+    r"view (?:this email )?in (?:your )?browser|manage (?:your )?(?:preferences|subscriptions)|"
+    r"follow us|download (?:our|the) app|^page \d+(?: of \d+)?$|^\s*(?:https?://|www\.)\S+\s*$",
+    re.I)
+_QTY = re.compile(r"\b(?:qty|quantity)\b|\bx\s?\d{1,3}\b|\b\d{1,3}\s?x\b", re.I)
+RELEVANT = [ORDER_ID, DATE_LABEL, MERCHANT_LABEL, MERCHANT_PHRASE, SKU, _QTY, PRICE,
+            *(pat for pat, _ in DATE_PATTERNS)]
+
+def _relevant(line:str) -> bool:
+    return any(p.search(line) for p in RELEVANT)
+
+def compact_receipt(text:str) -> tuple[str, dict]:
+    """(compacted text, {"chars_in", "chars_out", "lines_in", "lines_out"})"""
+    raw = (text or "").splitlines()
+    lines, seen = [], set()
+    for line in raw:
+        line = " ".join(line.split())
+        if not line or BOILERPLATE.search(line):
+            continue
+        key = line.lower()
+        # repeated page headers/footers go; a repeated priced line may be a second unit of an item
+        if key in seen and not PRICE.search(line):
+            continue
+        seen.add(key)
+        lines.append(line)
+
+    if sum(len(l) + 1 for l in lines) > PROMPT_COMPACT_MIN_CHARS:
+        keep = set(range(min(HEAD_LINES, len(lines))))
+        for i, line in enumerate(lines):
+            if i not in keep and _relevant(line):
+                keep.add(i)
+                if i > 0:
+                    keep.add(i - 1)
+        lines = [l for i, l in enumerate(lines) if i in keep]
+
+    out = "\n".join(lines)
+    if len(out) > PROMPT_MAX_CHARS:
+        out = out[:PROMPT_MAX_CHARS].rsplit("\n", 1)[0]
+    stats = {"chars_in": len(text or ""), "chars_out": len(out), "lines_in": len(raw), "lines_out": out.count("\n") + 1 if out else 0}
+    telemetry.count(PROMPT_CHARS, stats["chars_in"], stage="raw")
+    telemetry.count(PROMPT_CHARS, stats["chars_out"], stage="sent")
+    return out, stats
+
+def receipt_text_turn(text:str) -> str:
+    compacted, stats = compact_receipt(text)
+    telemetry.log("prompt.compacted", **stats)
+    return "Receipt text:\n---\n" + compacted + "\n---"
+
+def policy_text_turn(text:str) -> str:
+    return "Policy snippet:\n---\n" + (text or "") + "\n---"
+
+def record_usage(path:str, usage:Optional[dict]):
+    """Count input/output/cache tokens from a messages response (or the merged stream events)."""
+    if not usage:
+        return
+    kinds = {
+        "input": usage.get("input_tokens"), "output": usage.get("output_tokens"),
+        "cache_read": usage.get("cache_read_input_tokens"), "cache_write": usage.get("cache_creation_input_tokens"),
+    }
+    for kind, n in kinds.items():
+        if n:
+            telemetry.count(TOKENS, n, path=path, kind=kind)
+    telemetry.log("llm.usage", path=path, **{k: v or 0 for k, v in kinds.items()})
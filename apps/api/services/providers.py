@@ -0,0 +1,187 @@
+import os, time, random, asyncio, httpx
+from typing import Awaitable, Callable, Optional, TypeVar
+from . import telemetry
+
+try:
+    import h2  # optional: enables HTTP/2 on the pooled clients
+except Exception:
+    h2 = None
+
+try:
+    import anthropic
+    from anthropic import AsyncAnthropic
+except Exception:
+    anthropic = None
+    AsyncAnthropic = None
+
+T = TypeVar("T")
+
+HTTP2 = os.getenv("PROVIDER_HTTP2", "1") == "1" and h2 is not None
+MAX_RETRIES = int(os.getenv("PROVIDER_MAX_RETRIES", "2"))
+BACKOFF_BASE = float(os.getenv("PROVIDER_BACKOFF_BASE", "0.25"))
+BACKOFF_MAX = float(os.getenv("PROVIDER_BACKOFF_MAX", "4.0"))
+BREAKER_THRESHOLD = int(os.getenv("PROVIDER_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET_S = float(os.getenv("PROVIDER_BREAKER_RESET_S", "30"))
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+
+telemetry.counter("sendback_provider_calls_total", "Provider call outcomes: ok, retry, error, circuit_open")
+
+class CircuitOpen(RuntimeError):
+    pass
+
+class CircuitBreaker:
+    """
+    closed    → calls flow; consecutive failures are counted.
+    open      → calls are rejected immediately until reset_after elapses.
+    half-open → one probe call is let through; success closes, failure re-opens.
+    """
+    def __init__(self, threshold:int=BREAKER_THRESHOLD, reset_after:float=BREAKER_RESET_S):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        st = self.state
+        if st == "closed":
+            return True
+        if st == "half-open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """The probe ended without a verdict (cancelled, or a caller error): let the next call probe instead."""
+        self.probing = False
+
+def _status_of(exc: Exception) -> Optional[int]:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code
+    return getattr(exc, "status_code", None)
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    if anthropic is not None and isinstance(exc, anthropic.APIConnectionError):
+        return True
+    return _status_of(exc) in RETRYABLE_STATUS
+
+def _backoff(attempt:int) -> float:
+    # "full jitter": uniform in [0, min(cap, base * 2^attempt)]
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+class Provider:
+    """A long-lived pooled client for one upstream, plus retries and a circuit breaker."""
+    def __init__(self, name:str, base_url:str="", timeout:float=60.0, retries:int=MAX_RETRIES, headers:Optional[dict]=None):
+        self.name = name
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.headers = headers or {}
+        self.breaker = CircuitBreaker()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0),
+                http2=HTTP2,
+            )
+        return self._client
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn with bounded, jittered retries; fail fast while the breaker is open."""
+        probe = self.breaker.state == "half-open"
+        if not self.breaker.allow():
+            telemetry.count("sendback_provider_calls_total", provider=self.name, outcome="circuit_open")
+            raise CircuitOpen(f"{self.name} circuit open")
+        attempt = 0
+        try:
+            while True:
+                try:
+                    result = await fn()
+                except Exception as e:
+                    if is_retryable(e):
+                        if attempt < self.retries:
+                            telemetry.count("sendback_provider_calls_total", provider=self.name, outcome="retry")
+                            await asyncio.sleep(_backoff(attempt))
+                            attempt += 1
+                            continue
+                        self.breaker.record_failure()
+                    # caller errors (4xx) say nothing about upstream health: the breaker is left as it was
+                    telemetry.count("sendback_provider_calls_total", provider=self.name, outcome="error")
+                    raise
+                self.breaker.record_success()
+                telemetry.count("sendback_provider_calls_total", provider=self.name, outcome="ok")
+                return result
+        finally:
+            # a probe that ends without a verdict (cancelled by a lost race or hedge, or a caller
+            # error) must not hold the half-open slot forever
+            if probe:
+                self.breaker.release_probe()
+
+    async def post_json(self, url:str, **kwargs) -> dict:
+        async def go():
+            r = await self.client.post(url, **kwargs)
+            r.raise_for_status()
+            return r.json()
+        return await self.call(go)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+lava = Provider("lava", os.getenv("LAVA_BASE_URL", "https://api.lavapayments.com"))
+anthropic_direct = Provider("anthropic", os.getenv("ANTHROPIC_BASE_URL", "https://api.anthropic.com"))
+reka_api = Provider("reka", os.getenv("REKA_BASE_URL", "https://api.reka.ai"))
+
+PROVIDERS = {p.name: p for p in (lava, anthropic_direct, reka_api)}
+
+_sdk_client = None
+
+def anthropic_sdk(api_key:str):
+    """Shared AsyncAnthropic bound to the pooled anthropic client; retries are ours, not the SDK's."""
+    global _sdk_client
+    if _sdk_client is None or _sdk_client._client.is_closed:
+        _sdk_client = AsyncAnthropic(
+            api_key=api_key,
+            base_url=anthropic_direct.base_url,
+            http_client=anthropic_direct.client,
+            max_retries=0,
+        )
+    return _sdk_client
+
+def breaker_states() -> dict:
+    return {name: p.breaker.state for name, p in PROVIDERS.items()}
+
+async def aclose_all():
+    global _sdk_client
+    _sdk_client = None
+    for p in PROVIDERS.values():
+        await p.aclose()
@@ -0,0 +1,149 @@
+"""
+Deterministic receipt parser.
+
+Reads the fields we need (merchant, order id, purchase date, line items) out of
+plain-text and PDF-extracted receipts with a handful of regexes, and scores how
+much of the receipt it understood. extract_claude only pays for an LLM call when
+the score is below LOCAL_PARSE_MIN_CONFIDENCE.
+"""
+import re, datetime
+from typing import Optional
+from ..seed import policies
+
+MONTHS = {m: i for i, m in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1)}
+
+_MONTH = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?"
+_CUR = r"(?:[$€£]|usd|us\$|eur|gbp)"
+_PRICE = rf"(?:{_CUR}\s?)?-?\d{{1,3}}(?:,\d{{3}})*(?:\.\d{{2}})(?:\s?{_CUR})?"
+PRICE = re.compile(_PRICE, re.I)
+
+DATE_PATTERNS = [
+    # 2025-10-10, 2025/10/10
+    (re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b"), lambda m: (m[1], m[2], m[3])),
+    # 10/10/2025, 10-10-25 (US month-first)
+    (re.compile(r"\b(\d{1,2})[/-](\d{1,2})[/-](\d{4}|\d{2})\b"), lambda m: (m[3], m[1], m[2])),
+    # 10.10.2025 (day-first, as printed on EU receipts)
+    (re.compile(r"\b(\d{1,2})\.(\d{1,2})\.(\d{4})\b"), lambda m: (m[3], m[2], m[1])),
+    # October 10, 2025 / Oct 10 2025
+    (re.compile(rf"\b{_MONTH}\s+(\d{{1,2}})(?:st|nd|rd|th)?,?\s+(\d{{4}})\b", re.I), lambda m: (m[3], m[1], m[2])),
+    # 10 October 2025 / 10 Oct, 2025
+    (re.compile(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+{_MONTH},?\s+(\d{{4}})\b", re.I), lambda m: (m[3], m[2], m[1])),
+]
+
+MERCHANT_LABEL = re.compile(r"^\s*(?:merchant|store|retailer|seller|sold by|vendor)\s*[:-]\s*([A-Za-z].*?)\s*$", re.I | re.M)
+MERCHANT_PHRASE = re.compile(
+    r"(?:thank you for (?:shopping|your order) (?:at|with)|your (?:order|purchase) (?:from|at)|welcome to)\s+([A-Z][\w&'. -]{1,40}?)(?:[!.,]|\s*$)",
+    re.I | re.M)
+ORDER_ID = re.compile(
+    r"\b(?:order|confirmation|invoice|transaction|receipt)\s*(?:#|no\.?|number|id)?\s*[:#]?\s*([A-Z0-9][A-Z0-9-]{4,})\b", re.I)
+DATE_LABEL = re.compile(r"\b(?:order date|ordered on|order placed|purchase date|purchased(?: on)?|placed on|date)\b\s*[:#-]?\s*(.+)$", re.I | re.M)
+
+# - Portable Blender x1 $29.99 / Portable Blender x 1 @ $29.99 / 2 x USB-C Cable $9.99 / USB-C Cable  Qty: 2  $9.99
+ITEM_PATTERNS = [
+    re.compile(rf"^\s*[-*•]?\s*(?P<name>.+?)\s+(?:x|qty:?)\s*(?P<qty>\d{{1,3}})\s*(?:@|at|each)?\s*(?P<price>{_PRICE})\s*(?:ea(?:ch)?)?\s*$", re.I),
+    re.compile(rf"^\s*[-*•]?\s*(?P<qty>\d{{1,3}})\s*(?:x|@|×)\s*(?P<name>.+?)\s+(?P<price>{_PRICE})\s*$", re.I),
+    re.compile(rf"^\s*[-*•]\s*(?P<name>[^\d$€£].+?)\s+(?P<price>{_PRICE})\s*$", re.I),
+]
+SKU = re.compile(r"\b(?:sku|item\s*#|model)\s*[:#]?\s*([A-Z0-9-]{4,})", re.I)
+# Receipts open with the store name; only these lines are looked up in the policy index
+HEADER_LINES = 5
+
+NOT_ITEMS = re.compile(
+    r"\b(sub-?total|total|tax|vat|shipping|delivery|discount|coupon|savings|tip|change|balance|payment|paid|visa|mastercard|amex|refund)\b", re.I)
+
+def _to_date(y:str, m:str, d:str) -> Optional[datetime.date]:
+    try:
+        year = int(y)
+        if year < 100:
+            year += 2000
+        month = int(m) if m.isdigit() else MONTHS.get(m[:3].lower(), 0)
+        return datetime.date(year, month, int(d))
+    except Exception:
+        return None
+
+def find_date(text:str) -> Optional[str]:
+    for pat, parts in DATE_PATTERNS:
+        for m in pat.finditer(text):
+            d = _to_date(*parts(m))
+            if d:
+                return d.isoformat()
+    return None
+
+def parse_price(s:str) -> float:
+    return float(re.sub(r"[^\d.\-]", "", s.replace(",", "")) or 0)
+
+def _merchant(text:str, lines:list[str]) -> tuple[Optional[str], float]:
+    m = MERCHANT_LABEL.search(text)
+    if m:
+        return m.group(1).strip(), 0.3
+    index = policies.index()
+    for line in lines[:HEADER_LINES]:
+        if len(line) > 60 or DATE_LABEL.search(line) or ORDER_ID.search(line):
+            continue
+        entry = index.lookup(line)
+        if entry:
+            return entry["merchant"], 0.3
+    m = MERCHANT_PHRASE.search(text)
+    if m:
+        return m.group(1).strip(), 0.25
+    # an unrecognized first line is as likely to be noise as a store name; leave it to the LLM
+    return None, 0.0
+
+def _items(lines:list[str]) -> list[dict]:
+    items = []
+    for line in lines:
+        if NOT_ITEMS.search(line):
+            continue
+        for pat in ITEM_PATTERNS:
+            m = pat.match(line)
+            if not m:
+                continue
+            name = m.group("name").strip(" -:")
+            sku = SKU.search(name)
+            if sku:
+                name = SKU.sub("", name).strip(" -:,")
+            qty = int(m.groupdict().get("qty") or 1)
+            items.append({
+                "name": name,
+                "sku": sku.group(1) if sku else None,
+                "qty": max(qty, 1),
+                "unit_price": parse_price(m.group("price")),
+            })
+            break
+    return items
+
+def parse(text:str) -> tuple[dict, float]:
+    """Returns (fields in RECEIPT_SCHEMA shape, confidence in [0, 1])."""
+    text = text or ""
+    lines = [l.strip() for l in text.splitlines() if l.strip()]
+    score = 0.0
+
+    merchant, s = _merchant(text, lines)
+    score += s
+
+    order_id = None
+    for m in ORDER_ID.finditer(text):
+        if re.search(r"\d", m.group(1)):
+            order_id = m.group(1)
+            score += 0.15
+            break
+
+    purchase_date = None
+    for m in DATE_LABEL.finditer(text):
+        purchase_date = find_date(m.group(1))
+        if purchase_date:
+            break
+    if purchase_date:
+        score += 0.25
+    else:
+        purchase_date = find_date(text)
+        if purchase_date:
+            score += 0.15
+
+    items = _items(lines)
+    if items:
+        score += 0.3
+
+    fields = {"merchant": merchant or "Unknown", "order_id": order_id, "purchase_date": purchase_date, "items": items}
+    return fields, round(min(score, 1.0), 2)
@@ -0,0 +1,255 @@
+"""
+Server-side return reminders (7/3/1 days out, mirroring the ICS VALARMs).
+
+Upcoming reminders live in a min-heap ordered by fire time. The heap is
+loaded once at startup with a range scan over ix_orders_deadline_id. Ingest
+calls schedule() to keep it current. Orders written by other processes
+(the standalone job worker, the backfill) are picked up by a re-scan of
+recently updated orders every REMINDER_RESCAN_S. Each reminder then costs one
+heap push and pop, however many orders there are. When a deadline changes, new entries
+are pushed. The old ones are skipped when popped, because they no longer match
+the deadline recorded for that order.
+
+Due reminders go to every configured sink (REMINDER_SINKS=log,webhook,sse).
+Each order's last delivered fire time is kept for REMINDER_GRACE_S, so a
+re-scan that sees the order again doesn't repeat it. That state is not
+persisted: after a restart, reminders that came due within REMINDER_GRACE_S
+are sent again, and older ones are dropped.
+"""
+import os, time, heapq, asyncio, datetime
+from typing import Awaitable, Callable, Optional
+from . import telemetry
+
+REMINDERS_ENABLED = os.getenv("REMINDERS_ENABLED", "1") == "1"
+REMINDER_DAYS = tuple(int(d) for d in os.getenv("REMINDER_DAYS", "7,3,1").split(",") if d.strip())
+# Local hour of day at which a reminder fires
+REMINDER_HOUR = int(os.getenv("REMINDER_HOUR", "9"))
+REMINDER_GRACE_S = float(os.getenv("REMINDER_GRACE_S", "3600"))
+REMINDER_SINKS = [s.strip() for s in os.getenv("REMINDER_SINKS", "log").split(",") if s.strip()]
+REMINDER_WEBHOOK_URL = os.getenv("REMINDER_WEBHOOK_URL")
+REMINDER_RESCAN_S = float(os.getenv("REMINDER_RESCAN_S", "60"))
+# Re-scans look back this much further than the last one, for transactions that commit
+# a while after setting updated_at and for clock skew between processes
+RESCAN_OVERLAP_S = 300
+
+Sink = Callable[[dict], Awaitable[None]]
+
+def fire_times(deadline:datetime.date) -> list[tuple[float, int]]:
+    at = datetime.time(hour=REMINDER_HOUR)
+    return [(datetime.datetime.combine(deadline - datetime.timedelta(days=d), at).timestamp(), d) for d in REMINDER_DAYS]
+
+class Scheduler:
+    def __init__(self):
+        self._heap: list[tuple[float, int, int, str]] = []  # (fire_at, order_id, days_left, deadline iso)
+        self._orders: dict[int, tuple[str, str, float]] = {}  # order_id -> (deadline iso, merchant, last fire_at)
+        self._fired: dict[int, float] = {}  # order_id -> fire_at of its last delivered reminder, oldest first
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.sinks: list[Sink] = []
+        self.sent = 0
+
+    def schedule(self, order_id:int, merchant:str, deadline:Optional[datetime.date], now:Optional[float]=None):
+        """(Re)schedule one order's reminders. O(k log n); safe to call for an unchanged order."""
+        if deadline is None:
+            self._orders.pop(order_id, None)
+            return
+        iso = deadline.isoformat()
+        known = self._orders.get(order_id)
+        if known is not None and known[0] == iso:
+            self._orders[order_id] = (iso, merchant, known[2])
+            return
+        now = time.time() if now is None else now
+        head = self._heap[0][0] if self._heap else None
+        fired = self._fired.get(order_id, float("-inf"))
+        pushed = [(fire_at, days) for fire_at, days in fire_times(deadline)
+                  if fire_at >= now - REMINDER_GRACE_S and fire_at > fired]
+        if not pushed:
+            self._orders.pop(order_id, None)  # every reminder is already behind us
+            return
+        self._orders[order_id] = (iso, merchant, max(fire_at for fire_at, _ in pushed))
+        for fire_at, days in pushed:
+            heapq.heappush(self._heap, (fire_at, order_id, days, iso))
+        if self._heap and self._heap[0][0] != head:
+            self._wake.set()  # new earliest reminder: re-arm the sleep
+
+    def cancel(self, order_id:int):
+        self._orders.pop(order_id, None)
+
+    def pop_due(self, now:float) -> list[dict]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, order_id, days, iso = heapq.heappop(self._heap)
+            current = self._orders.get(order_id)
+            if current is None or current[0] != iso:
+                continue  # deadline changed or order gone since this entry was pushed
+            if fire_at >= current[2]:
+                del self._orders[order_id]  # that was its last reminder
+            self._fired.pop(order_id, None)
+            self._fired[order_id] = fire_at
+            due.append({
+                "type": "return_reminder", "order_id": order_id, "merchant": current[1],
+                "deadline_date": iso, "days_left": days,
+                "fire_at": datetime.datetime.fromtimestamp(fire_at).isoformat(timespec="seconds"),
+            })
+        # past the grace window schedule() skips those fire times anyway
+        while self._fired:
+            order_id, fired = next(iter(self._fired.items()))
+            if fired >= now - REMINDER_GRACE_S:
+                break
+            del self._fired[order_id]
+        return due
+
+    def upcoming(self, limit:int=50) -> list[dict]:
+        out = []
+        for fire_at, order_id, days, iso in heapq.nsmallest(limit * 2, self._heap):
+            if self._orders.get(order_id, (None,))[0] == iso:
+                out.append({"order_id": order_id, "days_left": days, "deadline_date": iso,
+                            "fire_at": datetime.datetime.fromtimestamp(fire_at).isoformat(timespec="seconds")})
+        return out[:limit]
+
+    def __len__(self):
+        return len(self._heap)
+
+    async def _deliver(self, event:dict):
+        for sink in self.sinks:
+            try:
+                await sink(event)
+            except Exception as e:
+                telemetry.warn("reminders.sink_failed", sink=getattr(sink, "__name__", repr(sink)), error=repr(e))
+        self.sent += 1
+        telemetry.count("sendback_reminders_sent_total", days_left=event["days_left"])
+
+    async def run(self):
+        while True:
+            for event in self.pop_due(time.time()):
+                await self._deliver(event)
+            self._wake.clear()
+            timeout = max(0.0, self._heap[0][0] - time.time()) if self._heap else None
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+# --- sinks ---
+
+async def log_sink(event:dict):
+    telemetry.log("reminder.due", **event)
+
+_subscribers: set[asyncio.Queue] = set()
+
+async def sse_sink(event:dict):
+    for q in list(_subscribers):
+        try:
+            q.put_nowait(event)
+        except asyncio.QueueFull:
+            pass  # a stalled client drops reminders rather than holding memory
+
+def subscribe(maxsize:int=100) -> asyncio.Queue:
+    q: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+    _subscribers.add(q)
+    return q
+
+def unsubscribe(q:asyncio.Queue):
+    _subscribers.discard(q)
+
+_hooks: list = []
+
+def webhook_sink(url:str) -> Sink:
+    """POST each reminder as JSON; shares the provider retry/breaker policy."""
+    from .providers import Provider
+    # no base_url: httpx would join "" onto it, adding a trailing slash (after any query string)
+    hook = Provider("reminder-webhook", timeout=10.0)
+    _hooks.append(hook)
+    async def webhook_sink(event:dict):
+        async def go():
+            r = await hook.client.post(url, json=event)
+            r.raise_for_status()
+        await hook.call(go)
+    return webhook_sink
+
+def _sinks() -> list[Sink]:
+    out = []
+    for name in REMINDER_SINKS:
+        if name == "log":
+            out.append(log_sink)
+        elif name == "sse":
+            out.append(sse_sink)
+        elif name == "webhook" and REMINDER_WEBHOOK_URL:
+            out.append(webhook_sink(REMINDER_WEBHOOK_URL))
+        else:
+            telemetry.warn("reminders.unknown_sink", sink=name)
+    return out
+
+# --- module-level scheduler used by the app ---
+
+scheduler = Scheduler()
+telemetry.gauge_fn("sendback_reminders_pending", "Reminder entries in the heap", lambda: {(): len(scheduler)})
+
+def schedule(order_id:int, merchant:str, deadline):
+    """Called after ingest commits; accepts a date or an ISO string. No-op unless start() ran."""
+    if scheduler._task is None:
+        return
+    if isinstance(deadline, str):
+        deadline = datetime.date.fromisoformat(deadline)
+    scheduler.schedule(order_id, merchant, deadline)
+
+def _load_upcoming(since:Optional[datetime.datetime]=None) -> list[tuple]:
+    """Orders with a deadline still ahead; only those updated at or after `since` if given."""
+    from ..db import ReadSessionLocal
+    from ..models import Order
+    db = ReadSessionLocal()
+    try:
+        # past deadlines have nothing left to remind about
+        q = db.query(Order.id, Order.merchant, Order.deadline_date).filter(Order.deadline_date >= datetime.date.today())
+        if since is not None:
+            q = q.filter(Order.updated_at >= since)
+        return q.all()
+    finally:
+        db.close()
+
+def _load(rows:list[tuple]):
+    now = time.time()
+    for order_id, merchant, deadline in rows:
+        scheduler.schedule(order_id, merchant, deadline, now)
+
+_rescan: Optional[asyncio.Task] = None
+
+async def rescan(since:datetime.datetime) -> int:
+    rows = await asyncio.to_thread(_load_upcoming, since)
+    _load(rows)
+    return len(rows)
+
+async def _rescan_loop(last:datetime.datetime):
+    while True:
+        await asyncio.sleep(REMINDER_RESCAN_S)
+        started = datetime.datetime.utcnow()
+        try:
+            n = await rescan(last - datetime.timedelta(seconds=RESCAN_OVERLAP_S))
+            last = started
+            telemetry.log("reminders.rescanned", orders=n, pending=len(scheduler))
+        except Exception as e:
+            telemetry.warn("reminders.rescan_failed", error=repr(e))
+
+async def start():
+    global _rescan
+    if not REMINDERS_ENABLED or scheduler._task is not None:
+        return
+    scheduler.sinks = _sinks()
+    started = datetime.datetime.utcnow()
+    rows = await asyncio.to_thread(_load_upcoming)
+    _load(rows)
+    scheduler._task = asyncio.create_task(scheduler.run())
+    if REMINDER_RESCAN_S > 0:
+        _rescan = asyncio.create_task(_rescan_loop(started))
+    telemetry.log("reminders.started", orders=len(rows), pending=len(scheduler), sinks=REMINDER_SINKS)
+
+async def stop():
+    global _rescan
+    for task in (scheduler._task, _rescan):
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    scheduler._task = _rescan = None
+    for hook in _hooks:
+        await hook.aclose()
+    _hooks.clear()
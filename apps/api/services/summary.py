@@ -0,0 +1,166 @@
+"""
+Money at risk: how many orders, and how much value, per merchant and deadline week.
+
+order_summary holds one row per (merchant, Monday of the deadline week). It is
+updated incrementally in the same transaction as the order change. A before_flush
+hook turns each ORM insert, update or delete of an Order into -/+ deltas on the
+rows it leaves and enters. Bulk insert()/update()/delete() statements skip the ORM,
+so code that writes orders that way passes its own deltas to `apply`
+(backfill.py, bench/seed.py). Orders without a deadline are not counted.
+
+    python -m apps.api.services.summary check      # compare with a full aggregate over orders
+    python -m apps.api.services.summary rebuild
+"""
+import datetime
+from typing import Optional
+from sqlalchemy import Integer, and_, cast, delete, event, func, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from ..db import SessionLocal
+from ..models import Order, OrderSummary
+from . import telemetry
+
+T = OrderSummary.__table__
+FIELDS = ("merchant", "deadline_date", "total_amount")
+
+Key = tuple[str, datetime.date]
+
+def week_of(d:datetime.date) -> datetime.date:
+    return d - datetime.timedelta(days=d.weekday())
+
+def cents(amount:Optional[float]) -> int:
+    return int(round((amount or 0.0) * 100))
+
+def add(deltas:dict, old:Optional[tuple], new:Optional[tuple]):
+    """Accumulate the move of one order from `old` to `new`, each (merchant, deadline_date, total_amount) or None."""
+    for state, sign in ((old, -1), (new, 1)):
+        if state is None or state[1] is None:
+            continue
+        d = deltas.setdefault((state[0] or "", week_of(state[1])), [0, 0])
+        d[0] += sign
+        d[1] += sign * cents(state[2])
+
+def apply(conn, deltas:dict[Key, list[int]]):
+    """Add the deltas to order_summary, inside the caller's transaction."""
+    # a fixed row order, so concurrent writers lock summary rows in the same sequence
+    for (merchant, week), (n, amount) in sorted(deltas.items()):
+        if not n and not amount:
+            continue
+        where = and_(T.c.merchant == merchant, T.c.week_start == week)
+        bump = update(T).where(where).values(orders=T.c.orders + n, amount_cents=T.c.amount_cents + amount)
+        if not conn.execute(bump).rowcount:
+            try:
+                with conn.begin_nested():
+                    conn.execute(insert(T).values(merchant=merchant, week_start=week, orders=n, amount_cents=amount))
+            except IntegrityError:
+                conn.execute(bump)  # another writer created the row first
+        if n < 0:
+            conn.execute(delete(T).where(where, T.c.orders <= 0))
+
+def _committed(session, obj:Order) -> Optional[tuple]:
+    state = inspect(obj)
+    values = []
+    for name in FIELDS:
+        h = state.attrs[name].history
+        old = h.deleted or h.unchanged
+        if not old:
+            # expired, then assigned without a load: the old value is only in the database
+            row = session.connection().execute(
+                select(Order.merchant, Order.deadline_date, Order.total_amount).where(Order.id == obj.id)).first()
+            return tuple(row) if row else None
+        values.append(old[0])
+    return tuple(values)
+
+def _current(obj:Order) -> tuple:
+    return tuple(getattr(obj, name) for name in FIELDS)
+
+@event.listens_for(SessionLocal, "before_flush")
+def _on_flush(session, flush_context, instances):
+    deltas: dict[Key, list[int]] = {}
+    with session.no_autoflush:
+        for obj in session.new:
+            if isinstance(obj, Order):
+                add(deltas, None, _current(obj))
+        for obj in session.dirty:
+            if isinstance(obj, Order) and session.is_modified(obj):
+                add(deltas, _committed(session, obj), _current(obj))
+        for obj in session.deleted:
+            if isinstance(obj, Order):
+                add(deltas, _committed(session, obj), None)
+    if deltas:
+        apply(session.connection(), deltas)
+
+# --- full recomputation and reads ---
+
+def aggregate(conn) -> dict[Key, list[int]]:
+    """order_summary as a full scan of orders would compute it."""
+    rows = conn.execute(
+        select(Order.merchant, Order.deadline_date, func.count(Order.id),
+               func.sum(cast(func.round(Order.total_amount * 100), Integer)))
+        .where(Order.deadline_date.isnot(None))
+        .group_by(Order.merchant, Order.deadline_date))
+    out: dict[Key, list[int]] = {}
+    for merchant, deadline, n, amount in rows:
+        d = out.setdefault((merchant or "", week_of(deadline)), [0, 0])
+        d[0] += n
+        d[1] += int(amount or 0)
+    return out
+
+def rebuild(conn) -> int:
+    conn.execute(delete(T))
+    rows = [{"merchant": m, "week_start": w, "orders": n, "amount_cents": a} for (m, w), (n, a) in aggregate(conn).items()]
+    if rows:
+        conn.execute(insert(T), rows)
+    telemetry.log("summary.rebuilt", rows=len(rows))
+    return len(rows)
+
+def check(conn) -> dict:
+    stored = {(m, w): [n, a] for m, w, n, a in conn.execute(select(T.c.merchant, T.c.week_start, T.c.orders, T.c.amount_cents))}
+    expected = aggregate(conn)
+    wrong = sorted(k for k in stored.keys() | expected.keys() if stored.get(k, [0, 0]) != expected.get(k, [0, 0]))
+    return {"rows": len(stored), "mismatched": len(wrong),
+            "examples": [{"merchant": m, "week_start": w.isoformat(), "stored": stored.get((m, w)), "expected": expected.get((m, w))}
+                         for m, w in wrong[:10]]}
+
+def read(db, weeks:int, merchant:Optional[str]=None, today:Optional[datetime.date]=None) -> dict:
+    """Value whose deadline falls in this week or the next `weeks - 1`, per week and per merchant."""
+    today = today or datetime.date.today()
+    first = week_of(today)
+    starts = [first + datetime.timedelta(weeks=i) for i in range(weeks)]
+    q = db.query(OrderSummary).filter(OrderSummary.week_start >= first, OrderSummary.week_start <= starts[-1],
+                                      OrderSummary.orders > 0)
+    if merchant:
+        q = q.filter(OrderSummary.merchant == merchant)
+    by_week = {w: [0, 0] for w in starts}
+    by_merchant: dict[str, dict] = {}
+    for row in q:
+        by_week[row.week_start][0] += row.orders
+        by_week[row.week_start][1] += row.amount_cents
+        m = by_merchant.setdefault(row.merchant, {"merchant": row.merchant, "orders": 0, "cents": 0, "this_week_cents": 0})
+        m["orders"] += row.orders
+        m["cents"] += row.amount_cents
+        if row.week_start == first:
+            m["this_week_cents"] += row.amount_cents
+    merchants = sorted(by_merchant.values(), key=lambda m: (-m["cents"], m["merchant"]))
+    return {
+        "week_start": first.isoformat(),
+        "weeks": weeks,
+        "total": {"orders": sum(n for n, _ in by_week.values()), "amount": sum(a for _, a in by_week.values()) / 100},
+        "this_week": {"orders": by_week[first][0], "amount": by_week[first][1] / 100},
+        "by_week": [{"week_start": w.isoformat(), "orders": n, "amount": a / 100} for w, (n, a) in by_week.items()],
+        "by_merchant": [{"merchant": m["merchant"], "orders": m["orders"], "amount": m["cents"] / 100,
+                         "this_week_amount": m["this_week_cents"] / 100} for m in merchants],
+    }
+
+def main():
+    import argparse, json
+    from ..db import engine
+    from .. import migrations
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("command", choices=["check", "rebuild"])
+    args = ap.parse_args()
+    migrations.upgrade(engine)
+    with engine.begin() as conn:
+        print(json.dumps(check(conn) if args.command == "check" else {"rows": rebuild(conn)}))
+
+if __name__ == "__main__":
+    main()
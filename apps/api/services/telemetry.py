@@ -0,0 +1,199 @@
+"""
+Lightweight instrumentation: structured logs, stage timings, counters.
+
+    with telemetry.span("pdf_parse"):
+        ...
+    telemetry.count("sendback_extraction_tier_total", tier="vision")
+    telemetry.log("extract.won", attempt=name)
+
+Metrics are kept in-process and rendered in Prometheus text format by
+GET /metrics. When ELASTIC_APM_SERVER_URL is set and elastic-apm is
+installed, spans and requests are also sent to APM.
+"""
+import os, sys, json, time, logging, threading
+from contextlib import contextmanager
+from typing import Callable
+
+try:
+    import elasticapm
+except ImportError:  # optional
+    elasticapm = None
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+APM_SERVER_URL = os.getenv("ELASTIC_APM_SERVER_URL")
+APM_SECRET_TOKEN = os.getenv("ELASTIC_APM_SECRET_TOKEN")
+APM_SERVICE_NAME = os.getenv("ELASTIC_APM_SERVICE_NAME", "sendback-api")
+# Seconds; covers a local parse (ms) through a slow LLM call (tens of seconds)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        out = {"ts": round(record.created, 3), "level": record.levelname.lower(), "event": record.getMessage()}
+        out.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, default=str)
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = " ".join(f"{k}={v}" for k, v in getattr(record, "fields", {}).items())
+        return f"[{record.levelname.lower()}] {record.getMessage()} {fields}".rstrip()
+
+logger = logging.getLogger("sendback")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(_JsonFormatter() if LOG_FORMAT == "json" else _TextFormatter())
+    logger.addHandler(_handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+def log(event:str, level:int=logging.INFO, **fields):
+    """One event per line: {"ts", "level", "event", **fields}."""
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+def warn(event:str, **fields):
+    log(event, logging.WARNING, **fields)
+
+def _labels(labels:dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _fmt(labels:tuple, extra:tuple=()) -> str:
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    esc = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+class Counter:
+    def __init__(self, name:str, help:str):
+        self.name, self.help = name, help
+        self.values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, n:float=1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + n
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        out += [f"{self.name}{_fmt(k)} {v}" for k, v in sorted(self.values.items())]
+        return out
+
+class Histogram:
+    def __init__(self, name:str, help:str, buckets:tuple=BUCKETS):
+        self.name, self.help, self.buckets = name, help, buckets
+        self.values: dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value:float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            row = self.values.get(key)
+            if row is None:
+                row = self.values[key] = [0] * (len(self.buckets) + 2)
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            rows = sorted((k, list(v)) for k, v in self.values.items())
+        for key, row in rows:
+            for b, n in zip(self.buckets, row):
+                out.append(f"{self.name}_bucket{_fmt(key, (('le', repr(float(b))),))} {n}")
+            out.append(f"{self.name}_bucket{_fmt(key, (('le', '+Inf'),))} {row[-1]}")
+            out.append(f"{self.name}_sum{_fmt(key)} {row[-2]}")
+            out.append(f"{self.name}_count{_fmt(key)} {row[-1]}")
+        return out
+
+class GaugeFn:
+    """Read at scrape time: fn() -> {labels dict as tuple of pairs: value}."""
+    def __init__(self, name:str, help:str, fn:Callable[[], dict]):
+        self.name, self.help, self.fn = name, help, fn
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.fn()
+        except Exception as e:
+            warn("metrics.gauge_failed", gauge=self.name, error=repr(e))
+            return out
+        out += [f"{self.name}{_fmt(_labels(dict(k)))} {v}" for k, v in sorted(values.items())]
+        return out
+
+_metrics: dict[str, object] = {}
+
+def _get(name:str, cls, help:str, *args):
+    m = _metrics.get(name)
+    if m is None:
+        m = _metrics.setdefault(name, cls(name, help, *args))
+    return m
+
+STAGE = "sendback_stage_seconds"
+_get(STAGE, Histogram, "Time spent in each ingest/extraction stage")
+
+def counter(name:str, help:str="") -> Counter:
+    return _get(name, Counter, help or name)
+
+def histogram(name:str, help:str="", buckets:tuple=BUCKETS) -> Histogram:
+    return _get(name, Histogram, help or name, buckets)
+
+def gauge_fn(name:str, help:str, fn:Callable[[], dict]):
+    _metrics[name] = GaugeFn(name, help, fn)
+
+def count(name:str, n:float=1, **labels):
+    counter(name).inc(n, **labels)
+
+@contextmanager
+def span(stage:str, **labels):
+    """Time a stage into sendback_stage_seconds{stage, outcome}; mirrored as an APM span when enabled."""
+    apm = elasticapm.capture_span(stage, span_type="app") if (elasticapm and APM_SERVER_URL) else None
+    if apm:
+        apm.__enter__()
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        _metrics[STAGE].observe(time.perf_counter() - start, stage=stage, outcome=outcome, **labels)
+        if apm:
+            apm.__exit__(None, None, None)
+
+def render() -> str:
+    lines = []
+    for m in list(_metrics.values()):
+        lines += m.render()
+    return "\n".join(lines) + "\n"
+
+def instrument(app):
+    """Per-route request latency, plus the elastic-apm middleware when configured."""
+    http = histogram("sendback_http_request_seconds", "HTTP request latency by route")
+
+    @app.middleware("http")
+    async def _timed(request, call_next):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            http.observe(time.perf_counter() - start, route=path, method=request.method, status=status)
+
+    if elasticapm and APM_SERVER_URL:
+        from elasticapm.contrib.starlette import ElasticAPM, make_apm_client
+        app.add_middleware(ElasticAPM, client=make_apm_client({
+            "SERVICE_NAME": APM_SERVICE_NAME, "SERVER_URL": APM_SERVER_URL, "SECRET_TOKEN": APM_SECRET_TOKEN,
+        }))
+        log("apm.enabled", server=APM_SERVER_URL, service=APM_SERVICE_NAME)
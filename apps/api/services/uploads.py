@@ -0,0 +1,85 @@
+"""
+Memory-bounded handling of uploaded receipts.
+
+Receipts are kept in spooled temp files (RAM up to SPOOL_MEMORY_BYTES, then
+disk) and hashed chunk by chunk as they arrive, so a request never holds a
+whole large PDF or photo in memory just to read, hash or parse it.
+"""
+import os, hashlib, tempfile
+from typing import BinaryIO, Optional
+from fastapi import HTTPException, UploadFile
+from . import telemetry
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+SPOOL_MEMORY_BYTES = int(os.getenv("UPLOAD_SPOOL_MEMORY_BYTES", str(1024 * 1024)))
+MAX_TEXT_BYTES = 1024 * 1024
+CHUNK = 64 * 1024
+
+class Upload:
+    """A received receipt: a seekable file plus the size and sha256 learned while streaming it in."""
+    def __init__(self, filename:str, content_type:Optional[str], file:BinaryIO, size:int, sha256:str):
+        self.filename = filename or ""
+        self.content_type = content_type
+        self.file = file
+        self.size = size
+        self.sha256 = sha256
+
+    def read(self) -> bytes:
+        self.file.seek(0)
+        return self.file.read()
+
+    def text(self) -> str:
+        self.file.seek(0)
+        return self.file.read(MAX_TEXT_BYTES).decode(errors="ignore")
+
+    def close(self):
+        try:
+            self.file.close()
+        except Exception:
+            pass
+
+def _too_large(name:str, limit:int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"{name or 'upload'} is larger than {limit} bytes")
+
+async def from_upload_file(uf:UploadFile, max_bytes:Optional[int]=None) -> Upload:
+    """Starlette has already spooled the multipart body; hash it in chunks without reading it whole."""
+    max_bytes = max_bytes or MAX_UPLOAD_BYTES
+    if uf.size is not None and uf.size > max_bytes:
+        raise _too_large(uf.filename, max_bytes)
+    h, size = hashlib.sha256(), 0
+    with telemetry.span("upload_read"):
+        await uf.seek(0)
+        while True:
+            chunk = await uf.read(CHUNK)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise _too_large(uf.filename, max_bytes)
+            h.update(chunk)
+        await uf.seek(0)
+    return Upload(uf.filename, uf.content_type, uf.file, size, h.hexdigest())
+
+def from_stream(filename:str, stream:BinaryIO, content_type:Optional[str]=None, max_bytes:Optional[int]=None) -> Upload:
+    """Copy a stream (e.g. a zip member) into a spooled temp file, hashing as we go. Blocking."""
+    max_bytes = max_bytes or MAX_UPLOAD_BYTES
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+    h, size = hashlib.sha256(), 0
+    while True:
+        chunk = stream.read(CHUNK)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            out.close()
+            raise _too_large(filename, max_bytes)
+        h.update(chunk)
+        out.write(chunk)
+    out.seek(0)
+    return Upload(filename, content_type, out, size, h.hexdigest())
+
+def from_bytes(filename:str, data:bytes, content_type:Optional[str]=None) -> Upload:
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+    out.write(data)
+    out.seek(0)
+    return Upload(filename, content_type, out, len(data), hashlib.sha256(data).hexdigest())
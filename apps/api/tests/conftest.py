@@ -0,0 +1,21 @@
+"""
+Tests run against throwaway SQLite/cache/blob paths with no provider keys, so nothing
+leaves the machine. The environment has to be set before apps.api.db is imported.
+
+    python -m pytest apps/api/tests     # from the repo root
+"""
+import os, tempfile
+
+_work = tempfile.mkdtemp(prefix="sendback-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_work, 'test.db')}"
+os.environ.pop("DATABASE_READ_URL", None)
+os.environ["EXTRACT_CACHE_PATH"] = os.path.join(_work, "extract_cache.db")
+os.environ["JOBS_DB_PATH"] = os.path.join(_work, "jobs.db")
+os.environ["BLOB_STORE_DIR"] = os.path.join(_work, "blobs")
+for key in ("ANTHROPIC_API_KEY", "LAVA_FORWARD_TOKEN", "REKA_API_KEY"):
+    os.environ.pop(key, None)
+
+# tests that don't import the app still need the schema
+from apps.api import migrations
+from apps.api.db import engine
+migrations.upgrade(engine)
@@ -0,0 +1,56 @@
+import os, datetime
+import pytest
+from apps.api.db import SessionLocal
+from apps.api.models import ReceiptBlob
+from apps.api.services import blobs, uploads
+
+def _stored(body:bytes, name:str="r.txt") -> dict:
+    upload = uploads.from_bytes(name, body, "text/plain")
+    try:
+        return blobs.put(upload)
+    finally:
+        upload.close()
+
+def test_put_dedups_and_round_trips():
+    body = b"Merchant: Target\nDate: 2025-10-01\n" + b"- Widget x1 $3.00\n" * 200
+    first, again = _stored(body), _stored(body)
+    assert first["new"] and not again["new"]
+    assert blobs.locate(first["sha256"]).endswith(".z")
+    restored = blobs.open_upload(first["sha256"], "r.txt", "text/plain")
+    try:
+        assert restored.file.read() == body
+    finally:
+        restored.close()
+
+def _old_blob(db, body:bytes) -> str:
+    info = _stored(body)
+    blobs.record(db, info, "old.txt", "text/plain", "v")
+    db.get(ReceiptBlob, info["sha256"]).last_seen_at = datetime.datetime.utcnow() - datetime.timedelta(days=4000)
+    db.commit()
+    return info["sha256"]
+
+def test_prune_keeps_files_when_commit_fails(monkeypatch):
+    db = SessionLocal()
+    try:
+        sha = _old_blob(db, b"prune me, but the commit fails")
+        def boom():
+            raise RuntimeError("commit failed")
+        monkeypatch.setattr(db, "commit", boom)
+        with pytest.raises(RuntimeError):
+            blobs.prune(db)
+        db.rollback()
+        assert blobs.locate(sha) is not None
+        assert db.get(ReceiptBlob, sha) is not None
+    finally:
+        db.close()
+
+def test_prune_removes_rows_then_files_and_tolerates_missing_files():
+    db = SessionLocal()
+    try:
+        sha = _old_blob(db, b"prune me")
+        os.unlink(blobs.locate(sha))  # already gone: still a success
+        out = blobs.prune(db)
+        assert out["deleted"] >= 1
+        assert db.get(ReceiptBlob, sha) is None
+    finally:
+        db.close()
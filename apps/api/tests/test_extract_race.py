@@ -0,0 +1,61 @@
+import asyncio
+from apps.api.services import extract_claude
+from apps.api.services.providers import Provider
+
+FIELDS = {"merchant": "Target", "order_id": None, "purchase_date": "2025-10-01", "items": []}
+
+def _half_open(p:Provider):
+    p.breaker.opened_at = 0.0
+    assert p.breaker.state == "half-open"
+
+async def _hang():
+    await asyncio.sleep(10)
+
+def _slow_attempt(p:Provider, started:asyncio.Event):
+    async def attempt():
+        async def go():
+            started.set()
+            await _hang()
+        return await p.call(go)
+    return attempt
+
+def test_race_loser_on_half_open_provider_is_not_locked_out():
+    slow = Provider("slow", retries=0)
+    _half_open(slow)
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def fast():
+            await started.wait()  # let the loser take the probe slot first
+            return FIELDS, "ocr_sdk_text"
+
+        answer = await extract_claude._first_valid([("vision", _slow_attempt(slow, started)), ("ocr+text", fast)])
+        assert answer == (FIELDS, "ocr_sdk_text")
+        assert not slow.breaker.probing
+
+        async def ok():
+            return "ok"
+        assert await slow.call(ok) == "ok"
+
+    asyncio.run(scenario())
+    assert slow.breaker.state == "closed"
+
+def test_cancelled_hedge_releases_probe():
+    slow = Provider("slow", retries=0)
+    _half_open(slow)
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def primary():
+            await started.wait()  # answers only once the hedge is in flight
+            return FIELDS, "vision"
+
+        hedge = ("vision-hedge", _slow_attempt(slow, started))
+        answer = await extract_claude._first_valid([("vision", primary)], hedge, hedge_delay=0.01)
+        assert answer == (FIELDS, "vision")
+        assert not slow.breaker.probing
+        assert slow.breaker.allow()
+
+    asyncio.run(scenario())
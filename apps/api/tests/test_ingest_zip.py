@@ -0,0 +1,33 @@
+import io, zipfile
+from fastapi.testclient import TestClient
+from apps.api.main import app
+from apps.api.services import uploads
+
+client = TestClient(app)
+
+def _receipt(i:int) -> bytes:
+    return (f"Merchant: Zip Co\nOrder: Z-{i:04d}\nDate: 2026-10-01\n- Photo print x1 $1.00\n" + "#" * 300).encode()
+
+def _zip(members:dict[str, bytes]) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+def test_zip_larger_than_the_per_receipt_cap_is_accepted(monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_BYTES", 1000)
+    archive = _zip({f"r{i}.txt": _receipt(i) for i in range(6)})
+    assert len(archive) > uploads.MAX_UPLOAD_BYTES
+    r = client.post("/ingest/receipts", files=[("files", ("receipts.zip", archive, "application/zip"))])
+    assert r.status_code == 200, r.text
+    assert r.json()["count"] == 6
+
+def test_zip_members_keep_the_per_receipt_cap(monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_BYTES", 1000)
+    archive = _zip({"big.txt": _receipt(1) + b"#" * 1000})
+    r = client.post("/ingest/receipts", files=[("files", ("receipts.zip", archive, "application/zip"))])
+    assert r.status_code == 413
+    # and a plain receipt over the cap is still refused
+    r = client.post("/ingest/receipts", files=[("files", ("big.txt", _receipt(1) * 4, "text/plain"))])
+    assert r.status_code == 413
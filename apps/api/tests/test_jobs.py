@@ -0,0 +1,68 @@
+import os, sqlite3, tempfile
+from apps.api.services import jobs
+from apps.api.services.jobs import JobQueue
+
+def _queue() -> JobQueue:
+    return JobQueue(os.path.join(tempfile.mkdtemp(), "jobs.db"))
+
+def test_failed_job_waits_out_its_backoff(monkeypatch):
+    monkeypatch.setattr(jobs, "RETRY_BASE_S", 60.0)
+    q = _queue()
+    job_id = q.enqueue("receipt", b"x")
+    job = q.claim(["receipt"])
+    q.fail(job_id, "upstream 529", job["attempts"])
+    assert q.get(job_id)["status"] == "queued"
+    assert q.get(job_id)["retry_at"] is not None
+    assert q.claim(["receipt"]) is None  # still backing off
+
+    q._conn.execute("UPDATE jobs SET available_at=0 WHERE id=?", (job_id,))
+    again = q.claim(["receipt"])
+    assert again["id"] == job_id and again["attempts"] == 2
+
+def test_last_attempt_fails_for_good():
+    q = _queue()
+    job_id = q.enqueue("receipt", b"x")
+    q._conn.execute("UPDATE jobs SET status='running', attempts=? WHERE id=?", (jobs.MAX_ATTEMPTS, job_id))
+    assert q.fail(job_id, "boom", jobs.MAX_ATTEMPTS)
+    job = q.get(job_id)
+    assert job["status"] == "failed" and job["retry_at"] is None
+    assert q.claim(["receipt"]) is None
+
+def test_old_queue_file_gains_the_backoff_column():
+    path = os.path.join(tempfile.mkdtemp(), "jobs.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, "
+        "payload BLOB, meta TEXT, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+        "lease_until REAL, created_at REAL NOT NULL, updated_at REAL NOT NULL)")
+    conn.execute("INSERT INTO jobs(id, kind, status, created_at, updated_at) VALUES ('a', 'receipt', 'queued', 0, 0)")
+    conn.commit()
+    conn.close()
+    assert JobQueue(path).claim(["receipt"])["id"] == "a"
+
+def _expire_lease(q:JobQueue, job_id:str):
+    q._conn.execute("UPDATE jobs SET lease_until=0 WHERE id=?", (job_id,))
+
+def test_job_that_keeps_killing_its_worker_stops_being_retried():
+    q = _queue()
+    job_id = q.enqueue("receipt", b"x")
+    for attempt in range(1, jobs.MAX_ATTEMPTS + 1):
+        job = q.claim(["receipt"])
+        assert job["id"] == job_id and job["attempts"] == attempt
+        _expire_lease(q, job_id)  # the worker died without calling complete() or fail()
+    assert q.claim(["receipt"]) is None
+    job = q.get(job_id)
+    assert job["status"] == "failed" and job["attempts"] == jobs.MAX_ATTEMPTS
+    assert "lease expired" in job["error"]
+
+def test_worker_that_lost_its_lease_cannot_overwrite_the_job():
+    q = _queue()
+    job_id = q.enqueue("receipt", b"x")
+    slow = q.claim(["receipt"])
+    _expire_lease(q, job_id)
+    fast = q.claim(["receipt"])
+    assert q.complete(job_id, {"order": {"id": 1}}, fast["attempts"])
+    assert not q.fail(job_id, "timed out", slow["attempts"])
+    assert not q.complete(job_id, {"order": {"id": 2}}, slow["attempts"])
+    job = q.get(job_id)
+    assert job["status"] == "done" and job["result"] == {"order": {"id": 1}}
@@ -0,0 +1,39 @@
+import datetime
+from fastapi.testclient import TestClient
+from apps.api.main import app
+from apps.api.db import session_scope
+from apps.api.models import Order
+
+client = TestClient(app)
+
+def _pages(params:dict) -> list[list[int]]:
+    pages, cursor = [], None
+    while True:
+        r = client.get("/orders", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert r.status_code == 200, r.text
+        body = r.json()
+        pages.append([o["id"] for o in body["orders"]])
+        cursor = body["next_cursor"]
+        if not cursor:
+            return pages
+
+def test_deadline_sort_pages_through_null_deadlines():
+    today = datetime.date.today()
+    with session_scope() as db:
+        rows = [Order(merchant="Cursor Co", order_id_text=f"C-{n}", purchase_date=today,
+                      deadline_date=None if n % 3 == 0 else today + datetime.timedelta(days=n % 4))
+                for n in range(11)]
+        db.add_all(rows)
+        db.flush()
+        expected = [o.id for o in sorted(rows, key=lambda o: (o.deadline_date is not None, o.deadline_date or today, o.id))]
+
+    for limit in (1, 2, 4):
+        pages = _pages({"merchant": "Cursor Co", "sort": "deadline", "limit": limit})
+        assert [i for page in pages for i in page] == expected
+        assert all(len(page) <= limit for page in pages)
+
+def test_id_sort_pages_cover_everything_once():
+    with session_scope() as db:
+        db.add_all([Order(merchant="Id Co", order_id_text=f"I-{n}", deadline_date=None) for n in range(5)])
+    ids = [i for page in _pages({"merchant": "Id Co", "limit": 2}) for i in page]
+    assert ids == sorted(ids, reverse=True) and len(ids) == 5
@@ -0,0 +1,33 @@
+import io, mmap
+from pypdf import PdfReader, PdfWriter
+from apps.api.services import extract_claude, uploads
+
+def _pdf_bytes() -> bytes:
+    w = PdfWriter()
+    w.add_blank_page(width=200, height=200)
+    buf = io.BytesIO()
+    w.write(buf)
+    return buf.getvalue()
+
+def test_large_pdf_is_mapped_and_the_map_is_closed(monkeypatch):
+    body = _pdf_bytes()
+    monkeypatch.setattr(uploads, "SPOOL_MEMORY_BYTES", len(body) // 2)
+    upload = uploads.from_bytes("r.pdf", body, "application/pdf")
+    try:
+        with extract_claude._pdf_stream(upload.file) as stream:
+            assert isinstance(stream, mmap.mmap)
+            assert len(PdfReader(stream).pages) == 1
+        assert stream.closed
+        assert extract_claude._extract_pdf_text(upload.file) == ""
+    finally:
+        upload.close()
+
+def test_small_pdf_is_read_in_place():
+    body = _pdf_bytes()
+    upload = uploads.from_bytes("r.pdf", body, "application/pdf")
+    try:
+        with extract_claude._pdf_stream(upload.file) as stream:
+            assert stream is upload.file
+            assert stream.read(5) == b"%PDF-"
+    finally:
+        upload.close()
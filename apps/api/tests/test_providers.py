@@ -0,0 +1,87 @@
+import asyncio, httpx
+import pytest
+from apps.api.services.providers import CircuitOpen, Provider
+
+def _half_open(p:Provider):
+    p.breaker.opened_at = 0.0  # long past reset_after
+    assert p.breaker.state == "half-open"
+
+async def _ok():
+    return "ok"
+
+def test_cancelled_probe_releases_half_open_slot():
+    p = Provider("test", retries=0)
+    _half_open(p)
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(10)
+
+        probe = asyncio.create_task(p.call(slow))
+        await started.wait()
+        assert p.breaker.probing
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert not p.breaker.probing
+        assert p.breaker.state == "half-open"
+        # the next call gets to probe, and its success closes the breaker
+        assert await p.call(_ok) == "ok"
+
+    asyncio.run(scenario())
+    assert p.breaker.state == "closed"
+
+def test_half_open_admits_one_probe_at_a_time():
+    p = Provider("test", retries=0)
+    _half_open(p)
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def held():
+            await gate.wait()
+            return "ok"
+
+        probe = asyncio.create_task(p.call(held))
+        await asyncio.sleep(0)
+        with pytest.raises(CircuitOpen):
+            await p.call(_ok)
+        gate.set()
+        assert await probe == "ok"
+
+    asyncio.run(scenario())
+    assert p.breaker.state == "closed"
+
+def _status(code:int):
+    async def fail():
+        raise httpx.HTTPStatusError(str(code), request=httpx.Request("POST", "https://up.example"),
+                                    response=httpx.Response(code))
+    return fail
+
+def test_caller_errors_leave_the_breaker_alone():
+    p = Provider("test", retries=0)
+
+    async def scenario():
+        for code in [503, 400, 503, 401, 503, 400, 503, 503]:
+            with pytest.raises(httpx.HTTPStatusError):
+                await p.call(_status(code))
+
+    asyncio.run(scenario())
+    assert p.breaker.failures == 5
+    assert p.breaker.state == "open"
+
+def test_caller_error_on_a_probe_frees_the_slot_without_closing():
+    p = Provider("test", retries=0)
+    _half_open(p)
+
+    async def scenario():
+        with pytest.raises(httpx.HTTPStatusError):
+            await p.call(_status(401))
+        assert p.breaker.state == "half-open" and not p.breaker.probing
+        assert await p.call(_ok) == "ok"
+
+    asyncio.run(scenario())
+    assert p.breaker.state == "closed"
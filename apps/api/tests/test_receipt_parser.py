@@ -0,0 +1,32 @@
+import os
+from apps.api.services import receipt_parser
+from apps.api.services.extract_claude import LOCAL_PARSE_MIN_CONFIDENCE
+
+DEMO = os.path.join(os.path.dirname(__file__), "..", "seed", "demo-receipts", "amazon.txt")
+
+def test_demo_receipt_parses_fully():
+    fields, confidence = receipt_parser.parse(open(DEMO).read())
+    assert fields["merchant"] == "Amazon"
+    assert fields["order_id"] == "113-1234567-1234567"
+    assert fields["purchase_date"] == "2025-10-10"
+    assert [(i["name"], i["qty"], i["unit_price"]) for i in fields["items"]] == [
+        ("Portable Blender", 1, 29.99), ("USB-C Cable", 2, 9.99)]
+    assert confidence >= LOCAL_PARSE_MIN_CONFIDENCE
+
+def test_garbage_is_not_a_merchant():
+    fields, confidence = receipt_parser.parse("hello")
+    assert fields["merchant"] == "Unknown"
+    assert confidence < LOCAL_PARSE_MIN_CONFIDENCE
+
+def test_header_line_resolves_through_policy_index():
+    fields, _ = receipt_parser.parse("AMAZON.COM\nOrder #112-5550001\n- Phone case x1 $12.00")
+    assert fields["merchant"] == "Amazon"
+    fields, _ = receipt_parser.parse("Best Buy #123\nDate: 2025-10-01")
+    assert fields["merchant"] == "Best Buy"
+    assert fields["purchase_date"] == "2025-10-01"
+
+def test_labelled_merchant_wins():
+    fields, _ = receipt_parser.parse("Store: Corner Hardware\nDate: 10/02/2025\n- Hammer $19.99")
+    assert fields["merchant"] == "Corner Hardware"
+    assert fields["purchase_date"] == "2025-10-02"
+    assert fields["items"] == [{"name": "Hammer", "sku": None, "qty": 1, "unit_price": 19.99}]
@@ -0,0 +1,66 @@
+import asyncio, datetime
+from apps.api.db import session_scope
+from apps.api.models import Order
+from apps.api.services import reminders
+from apps.api.services.reminders import Scheduler, fire_times
+
+def test_order_forgotten_after_its_last_reminder():
+    s = Scheduler()
+    deadline = datetime.date.today() + datetime.timedelta(days=30)
+    times = [t for t, _ in fire_times(deadline)]
+    s.schedule(1, "Target", deadline, now=min(times) - 10)
+    assert 1 in s._orders
+
+    fired = s.pop_due(min(times))
+    assert [e["days_left"] for e in fired] == [max(reminders.REMINDER_DAYS)]
+    assert 1 in s._orders  # more to come
+    fired = s.pop_due(max(times))
+    assert [e["days_left"] for e in fired] == sorted(reminders.REMINDER_DAYS, reverse=True)[1:]
+    assert 1 not in s._orders and len(s) == 0
+
+def test_rescan_after_the_last_reminder_does_not_send_it_again():
+    s = Scheduler()
+    deadline = datetime.date.today() + datetime.timedelta(days=30)
+    last = max(t for t, _ in fire_times(deadline))
+    s.schedule(3, "Target", deadline, now=last - 10)
+    assert [e["days_left"] for e in s.pop_due(last)] == [min(reminders.REMINDER_DAYS)]
+    assert 3 not in s._orders
+
+    # a re-scan a minute later still finds the order, with that fire time inside the grace window
+    s.schedule(3, "Target", deadline, now=last + 60)
+    assert s.pop_due(last + 60) == []
+    # once the grace window has passed the order is forgotten entirely
+    s.pop_due(last + reminders.REMINDER_GRACE_S + 1)
+    assert 3 not in s._fired
+
+def test_past_deadline_is_not_tracked():
+    s = Scheduler()
+    s.schedule(2, "Target", datetime.date.today() - datetime.timedelta(days=30))
+    assert 2 not in s._orders and len(s) == 0
+
+def test_rescan_picks_up_orders_written_elsewhere():
+    since = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    deadline = datetime.date.today() + datetime.timedelta(days=20)
+    with session_scope() as db:
+        o = Order(merchant="Worker Co", order_id_text="W-1", purchase_date=datetime.date.today(), deadline_date=deadline)
+        db.add(o)
+        db.flush()
+        oid = o.id
+    reminders.scheduler._orders.pop(oid, None)
+    assert asyncio.run(reminders.rescan(since)) >= 1
+    assert reminders.scheduler._orders[oid][0] == deadline.isoformat()
+
+def test_webhook_posts_to_the_url_as_given():
+    import httpx
+    seen = []
+    sink = reminders.webhook_sink("https://hook.example/x?token=abc")
+    hook = reminders._hooks.pop()
+    hook._client = httpx.AsyncClient(transport=httpx.MockTransport(lambda req: seen.append(req) or httpx.Response(200)))
+
+    async def scenario():
+        await sink({"type": "return_reminder", "order_id": 1})
+        await hook.aclose()
+
+    asyncio.run(scenario())
+    assert [str(r.url) for r in seen] == ["https://hook.example/x?token=abc"]
+    assert seen[0].method == "POST"
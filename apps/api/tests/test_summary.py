@@ -0,0 +1,126 @@
+import datetime
+from fastapi.testclient import TestClient
+from apps.api.main import app
+from apps.api.db import engine, SessionLocal, session_scope
+from apps.api.models import Order, OrderSummary
+from apps.api.services import summary
+
+client = TestClient(app)
+TODAY = datetime.date.today()
+
+def _mismatched() -> int:
+    with engine.begin() as conn:
+        return summary.check(conn)["mismatched"]
+
+def _row(merchant:str, deadline:datetime.date):
+    db = SessionLocal()
+    try:
+        return db.get(OrderSummary, (merchant, summary.week_of(deadline)))
+    finally:
+        db.close()
+
+def test_insert_update_delete_keep_the_summary_exact():
+    deadline = TODAY + datetime.timedelta(days=10)
+    with session_scope() as db:
+        a = Order(merchant="Sum Co", order_id_text="S-1", deadline_date=deadline, total_amount=10.10)
+        b = Order(merchant="Sum Co", order_id_text="S-2", deadline_date=deadline, total_amount=0.2)
+        db.add_all([a, b])
+        db.flush()
+        a_id = a.id
+    assert _mismatched() == 0
+    row = _row("Sum Co", deadline)
+    assert (row.orders, row.amount_cents) == (2, 1030)
+
+    # change merchant, deadline week and amount of an expired (not yet loaded) instance
+    moved = deadline + datetime.timedelta(days=14)
+    with session_scope() as db:
+        a = db.get(Order, a_id)
+        db.expire(a)
+        a.merchant, a.deadline_date, a.total_amount = "Other Sum Co", moved, 5.0
+    assert _mismatched() == 0
+    assert _row("Sum Co", deadline).amount_cents == 20
+    assert _row("Other Sum Co", moved).amount_cents == 500
+
+    with session_scope() as db:
+        db.delete(db.get(Order, a_id))
+    assert _mismatched() == 0
+    assert _row("Other Sum Co", moved) is None  # emptied rows are removed
+
+def test_rolled_back_flush_leaves_no_trace():
+    deadline = TODAY + datetime.timedelta(days=3)
+    db = SessionLocal()
+    try:
+        db.add(Order(merchant="Rollback Co", order_id_text="R-1", deadline_date=deadline, total_amount=1.0))
+        db.flush()
+        db.rollback()
+    finally:
+        db.close()
+    assert _row("Rollback Co", deadline) is None
+    assert _mismatched() == 0
+
+def test_savepoints_do_not_commit_a_half_written_order():
+    from sqlalchemy import select
+    from apps.api.db import read_engine
+    from apps.api.models import ReceiptBlob
+    from apps.api.routers import ingest
+    from apps.api.services import blobs
+    sha = "5a" * 32
+    fields = {"merchant": "Savepoint Co", "order_id": "SP-1", "purchase_date": TODAY.isoformat(),
+              "items": [{"name": "Mug", "qty": 1, "unit_price": 4.5}]}
+    db = SessionLocal()
+    try:
+        # the order INSERT, the new summary row and the blob row each go through begin_nested()
+        order, created = ingest._upsert_order(db, *ingest._build_order(fields, sha))
+        blobs.record(db, {"sha256": sha, "size": 10, "stored_size": 10}, "sp.txt", "text/plain", "v")
+        assert created
+        deadline = order.deadline_date
+        with read_engine.connect() as other:
+            assert other.execute(select(Order.id).where(Order.merchant == "Savepoint Co")).first() is None
+        db.rollback()
+    finally:
+        db.close()
+    with session_scope() as db:
+        assert db.query(Order).filter(Order.merchant == "Savepoint Co").first() is None
+        assert db.get(ReceiptBlob, sha) is None
+    assert _row("Savepoint Co", deadline) is None
+    assert _mismatched() == 0
+
+def test_ingest_totals_merge_and_endpoint():
+    purchased = TODAY.isoformat()
+    first = f"Merchant: Amazon\nOrder: 114-0000001-0000001\nDate: {purchased}\n- Lamp x1 $20.00\n- Bulb x2 $2.50\n"
+    r = client.post("/ingest/receipt", files={"file": ("a.txt", first.encode(), "text/plain")})
+    assert r.status_code == 200, r.text
+    order = r.json()["order"]
+    assert order["total_amount"] == 25.0
+
+    # the same order again with one new item: merged, total grows by that item only
+    again = first + "- Shade x1 $7.25\n"
+    r = client.post("/ingest/receipt", files={"file": ("b.txt", again.encode(), "text/plain")})
+    assert r.json()["created"] is False
+    assert r.json()["order"]["total_amount"] == 32.25
+    assert _mismatched() == 0
+
+    deadline = datetime.date.fromisoformat(order["deadline_date"])
+    weeks = (summary.week_of(deadline) - summary.week_of(TODAY)).days // 7 + 1
+    body = client.get("/orders/summary", params={"weeks": weeks, "merchant": "Amazon"}).json()
+    assert body["by_merchant"][0]["merchant"] == "Amazon"
+    assert body["by_week"][-1]["amount"] >= 32.25
+
+def test_totals_migration_fills_existing_orders(tmp_path):
+    from sqlalchemy import create_engine, insert, select, text
+    from apps.api import migrations
+    from apps.api.models import LineItem
+    eng = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    migrations.upgrade(eng)
+    deadline = TODAY + datetime.timedelta(days=5)
+    with eng.begin() as conn:
+        conn.execute(insert(Order).values(id=1, merchant="Old Co", deadline_date=deadline, total_amount=0.0))
+        conn.execute(insert(LineItem), [{"order_id": 1, "name": "A", "quantity": 2, "unit_price": 1.25},
+                                        {"order_id": 1, "name": "B", "quantity": 1, "unit_price": 0.1}])
+        conn.execute(text("DELETE FROM schema_migrations WHERE version = 5"))
+    migrations._done.discard(eng.url)
+    migrations.upgrade(eng)
+    with eng.begin() as conn:
+        assert conn.execute(select(Order.total_amount)).scalar() == 2.6
+        assert summary.check(conn)["mismatched"] == 0
+        assert conn.execute(select(OrderSummary.amount_cents)).scalar() == 260
@@ -6,6 +6,14 @@ export async function POST(req: NextRequest){
   const fd = new FormData();
   fd.set("file", file);
   const api = process.env.NEXT_PUBLIC_API_BASE!;
+  // ?stream=1 relays the API's server-sent progress events as they arrive
+  if (req.nextUrl.searchParams.get("stream") === "1") {
+    const res = await fetch(`${api}/ingest/receipt/stream`, { method: "POST", body: fd });
+    return new Response(res.body, {
+      status: res.status,
+      headers: { "Content-Type": "text/event-stream", "Cache-Control": "no-cache" },
+    });
+  }
   const res = await fetch(`${api}/ingest/receipt`, { method: "POST", body: fd });
   const data = await res.json();
   return NextResponse.json(data, { status: res.status });
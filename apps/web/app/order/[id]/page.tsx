@@ -5,19 +5,11 @@ async function getAll(id: string) {
   const base = process.env.NEXT_PUBLIC_API_BASE!;
   const safe = encodeURIComponent(id);
 
-  const [oRes, itemsRes, eligRes, optsRes] = await Promise.all([
-    fetch(`${base}/order/${safe}`, { cache: "no-store" }),
-    fetch(`${base}/order/${safe}/items`, { cache: "no-store" }),
-    fetch(`${base}/order/${safe}/eligibility`, { cache: "no-store" }),
-    fetch(`${base}/order/${safe}/options`, { cache: "no-store" }),
-  ]);
+  // One round trip: order, items, eligibility and options together
+  const res = await fetch(`${base}/order/${safe}/full`, { cache: "no-store" });
+  if (!res.ok) notFound();
 
-  if (!oRes.ok) notFound();
-
-  const order = await oRes.json();
-  const items = itemsRes.ok ? (await itemsRes.json()).items ?? [] : [];
-  const eligibility = eligRes.ok ? await eligRes.json() : { ok: false };
-  const options = optsRes.ok ? (await optsRes.json()).options ?? [] : [];
+  const { order, items = [], eligibility = { ok: false }, options = [] } = await res.json();
 
   return { order, items, eligibility, options };
 }
@@ -36,7 +28,7 @@ export default async function OrderPage({
     <main className="max-w-3xl mx-auto p-6 space-y-4 mt-15">
       {/* ===== Header ===== */}
       <h1 className="text-xl font-semibold text-[#252dfa]">
-        {order.merchant} — {order.order_id_text}
+        {order.merchant} — {order.order_id_text || `#${order.id}`}
       </h1>
 
       <div className="text-zinc-600">
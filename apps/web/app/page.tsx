@@ -4,51 +4,70 @@ import { useEffect, useState, useMemo, useRef } from "react";
 import { useRouter } from "next/navigation";
 import Link from "next/link";
 
+type Tab = "active" | "history";
+type Feed = { orders: any[]; cursor: string | null };
+
+const PAGE_SIZE = 50;
+
+// Local calendar date, offset by whole days, as YYYY-MM-DD
+function isoDate(offsetDays: number) {
+  const d = new Date();
+  d.setDate(d.getDate() + offsetDays);
+  return `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, "0")}-${String(d.getDate()).padStart(2, "0")}`;
+}
+
 export default function Home() {
   const router = useRouter();
-  const [orders, setOrders] = useState<any[]>([]);
+  const [feeds, setFeeds] = useState<Record<Tab, Feed>>({
+    active: { orders: [], cursor: null },
+    history: { orders: [], cursor: null },
+  });
   const [loading, setLoading] = useState(true);
-  const [tab, setTab] = useState<"active" | "history">("active");
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [tab, setTab] = useState<Tab>("active");
 
   const uploadFormRef = useRef<HTMLFormElement | null>(null);
   const uploadInputRef = useRef<HTMLInputElement | null>(null);
 
-  async function fetchOrders() {
+  // One page of a tab, soonest deadline first; the server sorts, so pages just append
+  async function fetchPage(t: Tab, cursor: string | null): Promise<Feed | null> {
     const base = process.env.NEXT_PUBLIC_API_BASE!;
-    const res = await fetch(`${base}/orders`, { cache: "no-store" });
-    if (!res.ok) return { orders: [] };
-    return res.json();
+    const range = t === "active" ? `deadline_from=${isoDate(1)}` : `deadline_to=${isoDate(0)}`;
+    const qs = cursor ? `&cursor=${encodeURIComponent(cursor)}` : "";
+    const res = await fetch(`${base}/orders?sort=deadline&limit=${PAGE_SIZE}&${range}${qs}`, { cache: "no-store" });
+    if (!res.ok) return null;
+    const page = await res.json();
+    return { orders: page.orders || [], cursor: page.next_cursor || null };
   }
 
   useEffect(() => {
-    fetchOrders().then((data) => {
-      setOrders(data.orders || []);
+    Promise.all([fetchPage("active", null), fetchPage("history", null)]).then(([active, history]) => {
+      setFeeds((f) => ({ active: active || f.active, history: history || f.history }));
       setLoading(false);
     });
   }, []);
 
-  const activeOrders = useMemo(
-    () =>
-      orders
-        .filter((o) => o.days_remaining > 0)
-        .sort((a, b) => a.days_remaining - b.days_remaining),
-    [orders]
-  );
+  async function loadMore() {
+    const t = tab;
+    const cursor = feeds[t].cursor;
+    if (!cursor || loadingMore) return;
+    setLoadingMore(true);
+    const page = await fetchPage(t, cursor);
+    if (page) {
+      setFeeds((f) => ({ ...f, [t]: { orders: [...f[t].orders, ...page.orders], cursor: page.cursor } }));
+    }
+    setLoadingMore(false);
+  }
 
-  const expiredOrders = useMemo(
-    () =>
-      orders
-        .filter((o) => o.days_remaining <= 0)
-        .sort((a, b) => a.days_remaining - b.days_remaining),
-    [orders]
-  );
+  const activeOrders = feeds.active.orders;
+  const expiredOrders = feeds.history.orders;
+  // "50+" while there are pages we haven't fetched
+  const tabCount = (t: Tab) => `${feeds[t].orders.length}${feeds[t].cursor ? "+" : ""}`;
 
+  // active orders arrive soonest first, so the first page holds the ones expiring this week
   const expiringCount = useMemo(
-    () =>
-      orders.filter(
-        (o) => o.days_remaining > 0 && o.days_remaining <= 7
-      ).length,
-    [orders]
+    () => activeOrders.filter((o) => o.days_remaining <= 7).length,
+    [activeOrders]
   );
 
   const handleAddReceipt = () => router.push("/upload");
@@ -100,7 +119,7 @@ export default function Home() {
                 : "text-gray-400 border-transparent hover:text-[#252dfa]"
             }`}
           >
-            Active ({activeOrders.length})
+            Active ({tabCount("active")})
           </button>
 
           <button
@@ -111,7 +130,7 @@ export default function Home() {
                 : "text-gray-400 border-transparent hover:text-[#582630]"
             }`}
           >
-            History ({expiredOrders.length})
+            History ({tabCount("history")})
           </button>
         </div>
 
@@ -197,12 +216,34 @@ export default function Home() {
             </div>
           )}
 
+          {!loading && feeds[tab].cursor && (
+            <div className="text-center pb-2">
+              <button
+                onClick={loadMore}
+                disabled={loadingMore}
+                className="text-primary text-sm underline disabled:opacity-50"
+              >
+                {loadingMore ? "Loading..." : "Load more orders"}
+              </button>
+            </div>
+          )}
+
           {/* Policy link */}
-          <div className="mt-4 text-center pb-24">
+          <div className="mt-4 text-center pb-2">
             <Link href="/policy" className="underline text-primary text-sm">
               Check a store’s return policy →
             </Link>
           </div>
+
+          {/* Calendar feed: every open deadline, kept up to date by the calendar app */}
+          <div className="text-center pb-24">
+            <a
+              href={`${(process.env.NEXT_PUBLIC_API_BASE || "").replace(/^https?:/, "webcal:")}/orders/calendar.ics`}
+              className="underline text-primary text-sm"
+            >
+              Subscribe to all return deadlines 📅
+            </a>
+          </div>
         </div>
 
         {/* ===== Floating + Button ===== */}
@@ -11,13 +11,49 @@ interface UploadResult {
   order?: {
     id: number;
     merchant: string;
-    order_id_text: string;
+    order_id_text: string | null;
     purchase_date: string;
     deadline_date: string;
     days_remaining: number;
   };
 }
 
+const STAGE_LABELS: Record<string, string> = {
+  received: "Uploaded",
+  cache_hit: "Seen this receipt before",
+  pdf_text: "Reading PDF",
+  local_parse: "Parsing text",
+  image_prep: "Preparing image",
+  ocr_done: "Text recognized",
+  extraction_started: "Extracting details",
+  llm_started: "Reading receipt",
+  extracted: "Saving order",
+};
+
+// Splits an SSE body into {event, data} records as chunks arrive.
+async function* readEvents(body: ReadableStream<Uint8Array>) {
+  const reader = body.getReader();
+  const decoder = new TextDecoder();
+  let buf = "";
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buf += decoder.decode(value, { stream: true });
+    let end;
+    while ((end = buf.indexOf("\n\n")) >= 0) {
+      const block = buf.slice(0, end);
+      buf = buf.slice(end + 2);
+      let event = "message";
+      let data = "";
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      }
+      if (data) yield { event, data: JSON.parse(data) };
+    }
+  }
+}
+
 export function UploadReceipt({ onUploadComplete }: UploadReceiptProps) {
   const uploadFormRef = useRef<HTMLFormElement | null>(null);
   const uploadInputRef = useRef<HTMLInputElement | null>(null);
@@ -28,6 +64,8 @@ export function UploadReceipt({ onUploadComplete }: UploadReceiptProps) {
   const [result, setResult] = useState<UploadResult | null>(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
+  const [stage, setStage] = useState<string | null>(null);
+  const [partial, setPartial] = useState<Record<string, any>>({});
 
   const reset = () => {
     setResult(null);
@@ -51,17 +89,24 @@ export function UploadReceipt({ onUploadComplete }: UploadReceiptProps) {
     setLoading(true);
     setError(null);
     setResult(null);
+    setStage(null);
+    setPartial({});
 
     const formData = new FormData(form);
 
     try {
-      const res = await fetch("/api/upload", {
+      const res = await fetch("/api/upload?stream=1", {
         method: "POST",
         body: formData,
       });
-      if (!res.ok) throw new Error("Upload failed");
-      const data = await res.json();
-      setResult(data);
+      if (!res.ok || !res.body) throw new Error("Upload failed");
+      for await (const { event, data } of readEvents(res.body)) {
+        if (event === "stage") setStage(data.stage);
+        else if (event === "partial") setPartial((p) => ({ ...p, ...data.fields }));
+        else if (event === "done") setResult(data);
+        else if (event === "error") throw new Error(data.error || "Extraction failed");
+        else if (event !== "token") setStage(event);
+      }
     } catch (err) {
       console.error(err);
       setError("Failed to upload image. Please try again.");
@@ -176,7 +221,12 @@ export function UploadReceipt({ onUploadComplete }: UploadReceiptProps) {
 
           {loading && (
             <div className="text-center text-sm text-muted-foreground">
-              Uploading...
+              {stage ? STAGE_LABELS[stage] || stage : "Uploading"}...
+              {(partial.merchant || partial.purchase_date) && (
+                <div className="mt-1 font-medium text-foreground">
+                  {[partial.merchant, partial.purchase_date].filter(Boolean).join(" · ")}
+                </div>
+              )}
             </div>
           )}
         </div>
@@ -193,7 +243,7 @@ export function UploadReceipt({ onUploadComplete }: UploadReceiptProps) {
             </div>
             <div>
               <div className="text-muted-foreground">Order ID</div>
-              <div className="font-medium">{result.order.order_id_text}</div>
+              <div className="font-medium">{result.order.order_id_text ?? "—"}</div>
             </div>
             <div>
               <div className="text-muted-foreground">Purchase Date</div>